@@ -1,5 +1,6 @@
 # adc_manager.py — continuous ADC sampling and scaling for PMU
 import uasyncio as asyncio
+import utime
 from machine import I2C
 from ads1x15 import ADS1115
 
@@ -32,6 +33,15 @@ class ADCManager:
         self.A_PER_V_CHARGE = 125.0
         self.A_PER_V_SPARE  = 125.0
 
+        # Throttle converter read-back on 0x48 AIN1 (0–10 V through a
+        # divider into the ±4.096 V range); used by pmu_throttle_cal
+        self.VDIV_THROTTLE = 3.0
+
+        # EMA weight of a new sample for battery_v_f / charge_i_f
+        # (0.3 at 20 Hz ≈ 140 ms time constant)
+        self.EMA_ALPHA = 0.3
+        self._ema_primed = False
+
         self._print_debug = False
 
     async def _read_diff_v(self, adc, chp, chm):
@@ -42,6 +52,22 @@ class ADCManager:
         raw = adc.read(channel1=ch)
         return adc.raw_to_v(raw), raw
 
+    async def read_throttle_v(self, samples=4):
+        """Average throttle converter output (V) from 0x48 AIN1."""
+        acc = 0.0
+        async with self.lock:
+            for _ in range(samples):
+                v, _raw = await self._read_single_v(self.adc_curr, 1)
+                acc += v
+        return acc / samples * self.VDIV_THROTTLE
+
+    async def read_battery_v(self):
+        """One battery/DC-link voltage conversion (0x49 AIN2-3), outside
+        the task period; used by precharge to sample fast near threshold."""
+        async with self.lock:
+            v, _raw = await self._read_diff_v(self.adc_bus, 2, 3)
+        return v * self.VDIV_BATT
+
     def read_all_once(self):
         """Synchronous one-shot for startup."""
         try:
@@ -59,7 +85,8 @@ class ADCManager:
             print("ADC read_once error:", e)
 
     async def task(self, period_ms=50):
-        """Async sampler (~20 Hz)."""
+        """Async sampler (~20 Hz). Publishes the GRP_ADC seqlock group."""
+        from pmu_config import GRP_ADC   # pmu_config imports this module
         D = self.DATA
         while True:
             try:
@@ -69,10 +96,20 @@ class ADCManager:
                     v_chg_adc,  raw_charge = await self._read_single_v(self.adc_curr, 2)
                     v_spare_adc, raw_spare = await self._read_single_v(self.adc_bus, 0)
 
+                D.begin_write(GRP_ADC)
                 D.battery_v = v_batt_adc * self.VDIV_BATT
                 D.load_i    = v_load_adc * self.A_PER_V_LOAD
                 D.charge_i  = v_chg_adc  * self.A_PER_V_CHARGE
                 D.spare_i   = v_spare_adc* self.A_PER_V_SPARE
+                if self._ema_primed:
+                    a = self.EMA_ALPHA
+                    D.battery_v_f += (D.battery_v - D.battery_v_f) * a
+                    D.charge_i_f  += (D.charge_i  - D.charge_i_f)  * a
+                else:
+                    D.battery_v_f = D.battery_v
+                    D.charge_i_f  = D.charge_i
+                    self._ema_primed = True
+                D.end_write(GRP_ADC, utime.ticks_ms())
 
                 if self._print_debug:
                     print(f"ADC batt raw={raw_batt} → {v_batt_adc:.4f} V "
@@ -178,7 +178,7 @@ class ADS1115:
         self._write_register(_REGISTER_LOWTHRESH, threshold_low)
         self._write_register(_REGISTER_HITHRESH, threshold_high)
         self._write_register(_REGISTER_CONFIG, _CQUE_1CONV |
-                             _CLAT_LATCH if latched else _CLAT_NONLAT |
+                             (_CLAT_LATCH if latched else _CLAT_NONLAT) |
                              _CPOL_ACTVLOW | _CMODE_TRAD | _RATES[rate] |
                              _MODE_CONTIN | _GAINS[self.gain] |
                              _CHANNELS[(channel1, channel2)])
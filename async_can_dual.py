@@ -6,6 +6,7 @@
 #  - Ringbuffer ingest
 #  - pmu_can_filters for both CAN1/CAN2
 #  - pmu_can_decode integration
+#  - Priority TX queue (pmu_can_txq) drained by tx_task
 #
 # Designed for PMU crank + PID where timing must be exact.
 
@@ -13,6 +14,11 @@ from pyb import CAN
 import micropython, utime
 
 from pmu_can_ringbuffer import CANRingBuffer
+from pmu_can_txq import (
+    CANTxQueue, tx_prio, PRIO_NMT, PRIO_SDO, N_PRIO, FRAME_BITS,
+)
+from pmu_trace import emit
+from pmu_trace_events import EV_CANTX_DROP
 from pmu_can_decode import decode_frame
 from pmu_can_filters import (
     configure_can1_filters,
@@ -77,6 +83,24 @@ class AsyncCANPort:
         # Whether TX is blocked (used by crank code)
         self.tx_blocked = False 
 
+        # Per-port frame handler: fn(can_id, data, ts_ms), called from
+        # decode_task. CAN1 -> Gen4 decoder; pmu_can points CAN2 at
+        # customer_can.feed.
+        self.on_frame = decode_frame
+
+        # hwcan.info() target: [tec, rec, warn, passive, bus_off,
+        # tx_pending, rx0, rx1] — filled in place, no allocation
+        self._info = [0] * 8
+
+        # Frames that found no free mailbox wait here (tx_task drains)
+        self.txq = CANTxQueue()
+        self._tx_flag = asyncio.ThreadSafeFlag()
+        self._drops_seen = 0
+
+        # RX counters; rx_bits is taken and reset by pmu_busmon
+        self.rx_frames = 0
+        self.rx_bits = 0
+        self.rx_overrun = 0
        
 
     # ------------------------------------------------------------------
@@ -92,7 +116,10 @@ class AsyncCANPort:
             data   = frame[4]
             dlc    = len(data)
             ts     = ms()
-            self.rx_fifo.put((can_id, dlc, data, ts))
+            self.rx_frames += 1
+            self.rx_bits += FRAME_BITS[dlc]
+            if not self.rx_fifo.put((can_id, dlc, data, ts)):
+                self.rx_overrun += 1
         except Exception as e:
             print("PUSHFRAME ERROR:", e, frame)
 
@@ -108,14 +135,68 @@ class AsyncCANPort:
     # ------------------------------------------------------------------
     # Transmit CAN frame
     # ------------------------------------------------------------------
-    def tx(self, can_id, data, ext=False, rtr=False):
+    def tx(self, can_id, data, ext=False, rtr=False, prio=None):
+        """
+        Send now if a mailbox is free and nothing is queued, else queue at
+        prio (default from the COB-ID, pmu_can_txq.tx_prio). False only
+        when TX is blocked or that priority's queue is full.
+        """
         if self.tx_blocked:
             return False
+        q = self.txq
+        if prio is None:
+            prio = tx_prio(can_id)
+        if not q.pending() and self.tx_free() > 0:
+            try:
+                self.hwcan.send(data, can_id, timeout=0, rtr=rtr, extframe=ext)
+                q.sent[prio] += 1
+                q.tx_bits += FRAME_BITS[len(data)]
+                return True
+            except:
+                q.retried[prio] += 1
+        if not q.put(prio, can_id, data, ext, rtr):
+            return False
+        self._tx_flag.set()
+        return True
+
+    async def send_async(self, can_id, data, prio=None):
+        """gen4_helpers_async interface: queued tx, SDO priority by default."""
+        if prio is None:
+            prio = PRIO_NMT if can_id < 0x100 else PRIO_SDO
+        return self.tx(can_id, data, prio=prio)
+
+    def tx_free(self):
+        """Free TX mailboxes (bxCAN has 3); 0 means tx() would fail."""
         try:
-            self.hwcan.send(data, can_id, timeout=0, rtr=rtr, extframe=ext)
-            return True
+            return 3 - self.hwcan.info(self._info)[5]
         except:
-            return False
+            return 3
+
+    # ------------------------------------------------------------------
+    # TX queue drain (async). No TX-complete IRQ in pyb.CAN, so poll
+    # every 1 ms while frames are waiting; sleep on the flag otherwise.
+    # ------------------------------------------------------------------
+    async def tx_task(self):
+        import uasyncio as asyncio
+        q = self.txq
+        while True:
+            if q.pending():
+                if not self.tx_blocked:
+                    q.drain(self.hwcan, self.tx_free())
+                self._report_drops()
+                await asyncio.sleep_ms(1)
+            else:
+                self._report_drops()
+                await self._tx_flag.wait()
+
+    def _report_drops(self):
+        d = self.txq.dropped
+        n = d[0] + d[1] + d[2] + d[3]
+        if n != self._drops_seen:
+            for p in range(N_PRIO):
+                if d[p]:
+                    emit(EV_CANTX_DROP, self.bus_id, p, d[p])
+            self._drops_seen = n
 
     # ------------------------------------------------------------------
     # Background decode loop (async)
@@ -136,10 +217,11 @@ class AsyncCANPort:
                 self._push_frame(raw)
 
             # PROCESS RINGBUFFER
+            handler = self.on_frame
             while not self.rx_fifo.empty():
                 slot = self.rx_fifo.get()    # returns CANFrame object
                 if slot:
-                    decode_frame(slot.id, slot.data, slot.timestamp)
+                    handler(slot.id, slot.data, slot.timestamp)
 
             await asyncio.sleep_ms(1)
 
@@ -158,6 +240,8 @@ class DualCAN:
         import uasyncio as asyncio
         asyncio.create_task(self.can1.decode_task())
         asyncio.create_task(self.can2.decode_task())
+        asyncio.create_task(self.can1.tx_task())
+        asyncio.create_task(self.can2.tx_task())
 
 
 # ----------------------------------------------------------------------
@@ -173,7 +257,7 @@ async def sync_task(can_port, period_ms=20):
     while True:
         try:
             # COB-ID 0x080, empty data
-            can_port.tx(0x80, b'')
+            can_port.tx(0x80, b'', prio=PRIO_NMT)
         except:
             pass
         await asyncio.sleep_ms(period_ms)
@@ -0,0 +1,31 @@
+# bench_snapshot.py — allocation/time benchmark for PMUData snapshots
+# Run on the board:  import bench_snapshot
+# Expect snapshot_into() to report 0 bytes/call.
+
+import gc
+import time
+from pmu_config import DATA, SNAP_SIZE
+
+N = 1000
+
+def bench(label, fn):
+    gc.collect()
+    gc.disable()
+    a0 = gc.mem_alloc()
+    t0 = time.ticks_us()
+    for _ in range(N):
+        fn()
+    dt = time.ticks_diff(time.ticks_us(), t0)
+    a1 = gc.mem_alloc()
+    gc.enable()
+    print("%-16s %6.1f us/call  %6.1f bytes/call" % (label, dt / N, (a1 - a0) / N))
+
+buf = bytearray(SNAP_SIZE)
+
+def _into():
+    DATA.snapshot_into(buf)
+
+print("=== SNAPSHOT BENCH (%d calls, %d-byte layout) ===" % (N, SNAP_SIZE))
+bench("snapshot()", DATA.snapshot)
+bench("snapshot_into()", _into)
+bench("shared_snapshot()", DATA.shared_snapshot)
@@ -1,82 +1,230 @@
-# customer_can.py — CAN2 interface to customer (RX + TX + command polling)
-# -----------------------------------------------------------------------
+# customer_can.py — CAN2 interface to customer (commands + acks + telemetry)
+# --------------------------------------------------------------------------
 
 import uasyncio as asyncio
+from array import array
+from utime import ticks_ms, ticks_diff, ticks_add
 from pmu_config import DATA
+from pmu_can_txq import PRIO_SDO, PRIO_TELEM
+import customer_proto as proto
+from customer_proto import ACK_OK, ACK_IGNORED, ACK_BUSY, ACK_BAD
 
 try:
     from async_can_dual import AsyncCANPort
 except:
     AsyncCANPort = None
 
+# Frame layouts live in customer_proto (also the source of the .dbc)
+_M_CMD = proto.msg_index("PMU_CMD")
+_M_ACK = proto.msg_index("PMU_CMD_ACK")
+_M_CRANK = proto.msg_index("PMU_CRANK_REPORT")
+_M_CRANK2 = proto.msg_index("PMU_CRANK_REPORT2")
+
 
 # -------------------------------------------------------------------
-# CUSTOMER COMMAND BUFFER
+# CUSTOMER COMMANDS — PMU_CMD in, PMU_CMD_ACK out
 # -------------------------------------------------------------------
-_last_cmd = 0
+# feed() runs in the CAN2 decode task (AsyncCANPort.on_frame) and posts
+# the command straight into the FSM event ring, so back-to-back commands
+# queue instead of overwriting each other. Each command takes a slot in
+# a small pending-ack ring; the FSM calls _on_dispatch() once it has
+# acted, and the ack carries the end-to-end latency from frame receipt.
+# While the next slot still waits for its dispatch (the FSM can block in
+# an exit action) further commands are refused with ACK_BUSY.
+# A 1-byte PMU_CMD (command only, as older customer nodes send) is
+# accepted with seq 0; an empty frame is answered with ACK_BAD.
+ID_CMD = proto.MSGS[_M_CMD][1]
+ID_CMD_ACK = proto.MSGS[_M_ACK][1]
+RX_IDS = (ID_CMD,)
+
+_N_PENDING = 8
+_p_cmd = bytearray(_N_PENDING)
+_p_seq = bytearray(_N_PENDING)
+_p_age_us = array("i", bytes(4 * _N_PENDING))   # ring age at feed()
+_p_busy = bytearray(_N_PENDING)                 # posted, not yet dispatched
+_p_next = 0
+_cmd_vals = [0, 0]
+_ack = bytearray(proto.DLC[_M_ACK])
+_ack_vals = [0, 0, 0, 0, 0]
+
+_fsm = None
+_can2 = None
+_cmd_events = {}
+
+rx_cmds = 0
+rx_bad = 0          # short frames
+acks_sent = 0
+
+
+def attach(fsm, can2, cmd_events):
+    """Wire commands to fsm; cmd_events maps command byte -> FSM event."""
+    global _fsm, _can2, _cmd_events
+    _fsm = fsm
+    _can2 = can2
+    _cmd_events = cmd_events
+    fsm.on_dispatch = _on_dispatch
 
 
 # -------------------------------------------------------------------
-# RX HOOK — called from CAN2 decoder
+# RX HOOK — AsyncCANPort.on_frame for CAN2
 # -------------------------------------------------------------------
-def feed(frame_id, data):
+def feed(frame_id, data, ts_ms=None):
     """Receive CAN2 commands from customer node."""
-    global _last_cmd
+    global _p_next, rx_cmds, rx_bad
     try:
-        if frame_id == 0x120 and len(data) > 0:
+        if frame_id != ID_CMD or _fsm is None:
+            return
+        age_us = ticks_diff(ticks_ms(), ts_ms) * 1000 if ts_ms is not None else 0
+        n = len(data)
+        if n == 0:
+            rx_bad += 1
+            _send_ack(0, 0, ACK_BAD, age_us)
+            return
+        rx_cmds += 1
+        if n >= proto.DLC[_M_CMD]:
+            cmd, seq = proto.decode_into(_M_CMD, data, _cmd_vals)
+        else:
             cmd = data[0]
-            if cmd in (0x01, 0x02, 0x03):
-                _last_cmd = cmd
+            seq = 0
+
+        ev = _cmd_events.get(cmd)
+        if ev is None:
+            _send_ack(cmd, seq, ACK_BAD, age_us)
+            return
+
+        i = _p_next
+        if _p_busy[i]:
+            _send_ack(cmd, seq, ACK_BUSY, age_us)
+            return
+        _p_cmd[i] = cmd
+        _p_seq[i] = seq
+        _p_age_us[i] = age_us
+        if not _fsm.post(ev, i + 1):
+            _send_ack(cmd, seq, ACK_BUSY, age_us)
+            return
+        _p_busy[i] = 1
+        _p_next = (i + 1) % _N_PENDING
     except Exception as e:
         print("customer_can feed error:", e)
 
 
-# -------------------------------------------------------------------
-# POLL COMMAND — called by FSM
-# -------------------------------------------------------------------
-def poll_command():
-    global _last_cmd
-    cmd = _last_cmd
-    _last_cmd = 0
-    return cmd
+def _on_dispatch(tag, accepted, lat_us):
+    i = tag - 1
+    _p_busy[i] = 0
+    _send_ack(_p_cmd[i], _p_seq[i], ACK_OK if accepted else ACK_IGNORED,
+              _p_age_us[i] + lat_us)
+
+
+def _send_ack(cmd, seq, result, lat_us):
+    global acks_sent
+    if _can2 is None:
+        return
+    v = _ack_vals
+    v[0] = cmd; v[1] = seq; v[2] = result; v[3] = DATA.state; v[4] = lat_us
+    proto.encode_into(_M_ACK, _ack, v)
+    if _can2.tx(ID_CMD_ACK, _ack, prio=PRIO_SDO):
+        acks_sent += 1
 
 
 # -------------------------------------------------------------------
-# TELEMETRY PUBLISHER — fixed argument order + exception logging
+# TELEMETRY SCHEDULER — multi-rate, on-change, mailbox aware
 # -------------------------------------------------------------------
-ID_TELEM_BASE = 0x500
+# Schedules every customer_proto message sent by the PMU with a period:
+# it goes out every period_ms and, with on_change, also on the next tick
+# after its packed payload changes. Signals are read from DATA via the
+# table's source attributes into per-message preallocated buffers.
+TELEM_TICK_MS = 10
+
+
+class TelemScheduler:
+
+    def __init__(self):
+        self.msgs = tuple(i for i, m in enumerate(proto.MSGS)
+                          if m[2] == proto.PMU and m[3] > 0)
+        n = len(self.msgs)
+        self.ids = tuple(proto.MSGS[m][1] for m in self.msgs)
+        self.period = tuple(proto.MSGS[m][3] for m in self.msgs)
+        self.on_change = tuple(proto.MSGS[m][4] for m in self.msgs)
+        self.buf = tuple(bytearray(proto.DLC[m]) for m in self.msgs)
+        self.last = tuple(bytearray(proto.DLC[m]) for m in self.msgs)
+        self.t_next = array("i", bytes(4 * n))
+        self.sent = array("I", bytes(4 * n))
+        self.tx_busy = 0        # frames deferred: no free mailbox / tx failed
+
+    def _pack(self, i):
+        buf = self.buf[i]
+        seq = DATA.grp_seq
+        for _ in range(4):
+            s0 = seq[0]; s1 = seq[1]; s2 = seq[2]
+            proto.encode_obj(self.msgs[i], buf, DATA)
+            if (not (s0 | s1 | s2) & 1 and
+                    s0 == seq[0] and s1 == seq[1] and s2 == seq[2]):
+                break
+        return buf
+
+    def step(self, can2, now):
+        """Send whatever is due; a message without a mailbox stays due."""
+        for i in range(len(self.ids)):
+            due = ticks_diff(now, self.t_next[i]) >= 0
+            if not (due or self.on_change[i]):
+                continue
+            buf = self._pack(i)
+            if not due and buf == self.last[i]:
+                continue
+            if (can2.tx_free() <= 0 or
+                    not can2.tx(self.ids[i], buf, prio=PRIO_TELEM)):
+                self.tx_busy += 1
+                continue
+            self.last[i][:] = buf
+            self.t_next[i] = ticks_add(now, self.period[i])
+            self.sent[i] += 1
+
+    def report(self):
+        print("telemetry: tx_busy %d" % self.tx_busy)
+        for i in range(len(self.ids)):
+            print("  0x%03X %-12s every %4d ms%s  sent %d" % (
+                self.ids[i], proto.MSGS[self.msgs[i]][0], self.period[i],
+                " +chg" if self.on_change[i] else "     ", self.sent[i]))
+
+
+TELEM = TelemScheduler()
+
 
 async def publisher_task(can2):
-    """Publish compact telemetry on CAN2 at 1 Hz."""
+    """Run the telemetry schedule on CAN2 every TELEM_TICK_MS."""
     if can2 is None:
         print("customer_can: no CAN2, publisher disabled")
         return
 
-    period = 1.0
-
     while True:
         try:
-            s = DATA.snapshot()
-
-            state = s[0] & 0x0F
-            rpm   = s[2] & 0xFFFF
-            bv10  = int(s[7] * 10) & 0xFFFF
-            bi10  = int(s[8] * 10) & 0xFFFF
-
-            data = bytes([
-                state,
-                (rpm >> 8) & 0xFF, rpm & 0xFF,
-                (bv10 >> 8) & 0xFF, bv10 & 0xFF,
-                (bi10 >> 8) & 0xFF, bi10 & 0xFF,
-                0x00,
-            ])
-
-            # ★★★★★ FINAL FIX HERE ★★★★★
-            can2.tx(ID_TELEM_BASE, data)
-
+            TELEM.step(can2, ticks_ms())
         except Exception as e:
             print("customer_can publisher error:", e)
 
-        await asyncio.sleep(period)
+        await asyncio.sleep_ms(TELEM_TICK_MS)
+
 
+# -------------------------------------------------------------------
+# CRANK REPORT — two frames per finished crank (pmu_crank_report)
+# -------------------------------------------------------------------
+ID_CRANK_REPORT = proto.MSGS[_M_CRANK][1]
 
+def _u16(v):
+    """-1 / "none" -> 0xFFFF."""
+    return 0xFFFF if v < 0 else min(int(v), 0xFFFE)
+
+def send_crank_report(can2, r):
+    if can2 is None or r is None:
+        return
+    try:
+        can2.tx(ID_CRANK_REPORT, proto.encode_into(
+            _M_CRANK, bytearray(proto.DLC[_M_CRANK]),
+            (r.outcome, r.timeouts, _u16(r.t_hb_ms), _u16(r.t_pdo_ms),
+             _u16(r.start_ms))), prio=PRIO_TELEM)
+        can2.tx(proto.MSGS[_M_CRANK2][1], proto.encode_into(
+            _M_CRANK2, bytearray(proto.DLC[_M_CRANK2]),
+            (_u16(r.ramp_ms), r.ipk_load, r.ipk_batt, _u16(r.max_rpm()))),
+            prio=PRIO_TELEM)
+    except Exception as e:
+        print("customer_can crank report error:", e)
@@ -0,0 +1,179 @@
+# customer_proto.py — CAN2 customer protocol table (encode + decode)
+# ------------------------------------------------------------------
+# Every CAN2 frame is defined once, here. customer_can encodes and
+# decodes through it on the board; tools/can2_gen.py reads the same
+# table on the host to write the .dbc and a CPython codec.
+#
+#   MSGS:    (name, can_id, sender, period_ms, on_change, signals)
+#   signal:  (name, fmt, scale, unit, source)
+#
+# Frames are big-endian and byte aligned. fmt is one struct code; the
+# wire value is round(physical * scale), clamped to the code's range.
+# source is the DATA attribute telemetry reads (None: filled by caller).
+# period_ms 0 = event frame. Plain Python + struct so CPython imports it.
+import struct
+
+PMU = "PMU"
+CUSTOMER = "CUSTOMER"
+
+# Commands (PMU_CMD.cmd) and ack results (PMU_CMD_ACK.result)
+CMD_CRANK = 0x01
+CMD_REGEN = 0x02
+CMD_STOP = 0x03
+CMD_PRECHARGE = 0x04
+
+ACK_OK = 0          # transition taken
+ACK_IGNORED = 1     # not valid in the current state
+ACK_BUSY = 2        # FSM event queue full
+ACK_BAD = 3         # unknown command
+
+MSGS = (
+    ("PMU_CMD", 0x120, CUSTOMER, 0, False, (
+        ("cmd",             "B", 1,   "",    None),
+        ("seq",             "B", 1,   "",    None))),
+    ("PMU_CMD_ACK", 0x121, PMU, 0, False, (
+        ("cmd",             "B", 1,   "",    None),
+        ("seq",             "B", 1,   "",    None),
+        ("result",          "B", 1,   "",    None),
+        ("state",           "B", 1,   "",    None),
+        ("latency",         "I", 1,   "us",  None))),
+
+    ("PMU_STATUS", 0x500, PMU, 1000, True, (
+        ("state",           "B", 1,   "",    "state"),
+        ("gen4_online",     "B", 1,   "",    "gen4_online"),
+        ("precharge_done",  "B", 1,   "",    "precharge_done"),
+        ("regen_mode",      "B", 1,   "",    "regen_mode"),
+        ("fault_active",    "B", 1,   "",    "fault_active"),
+        ("precharge_fault", "B", 1,   "",    "precharge_fault"),
+        ("last_emcy_code",  "H", 1,   "",    "last_emcy_code"))),
+    ("PMU_MOTOR", 0x501, PMU, 20, False, (
+        ("rpm",             "h", 1,   "rpm", "sevcon_rpm"),
+        ("torque",          "h", 10,  "Nm",  "torque_act"),
+        ("iq_actual",       "h", 10,  "A",   "iq_actual"),
+        ("iq_target",       "h", 10,  "A",   "iq_target"))),
+    ("PMU_POWER", 0x502, PMU, 50, False, (
+        ("dc_bus_v",        "H", 10,  "V",   "dc_bus_v"),
+        ("battery_v",       "H", 10,  "V",   "battery_v"),
+        ("load_i",          "h", 10,  "A",   "load_i"),
+        ("charge_i",        "h", 10,  "A",   "charge_i"))),
+    ("PMU_BATT", 0x503, PMU, 100, False, (
+        ("batt_current",    "h", 10,  "A",   "batt_current"),
+        ("cap_v",           "H", 10,  "V",   "cap_v"),
+        ("throttle_v",      "H", 100, "V",   "throttle_v"),
+        ("spare_i",         "h", 10,  "A",   "spare_i"))),
+    ("PMU_HEALTH", 0x504, PMU, 1000, True, (
+        ("motor_temp",      "h", 1,   "degC", "motor_temp"),
+        ("engine_temp",     "h", 1,   "degC", "engine_temp_c"),
+        ("stale_mask",      "I", 1,   "",    "stale_mask"))),
+    ("PMU_BUS1", 0x505, PMU, 1000, True, (
+        ("load",            "H", 10,  "%",   "can1_load"),
+        ("tec",             "B", 1,   "",    "can1_tec"),
+        ("rec",             "B", 1,   "",    "can1_rec"),
+        ("state",           "B", 1,   "",    "can1_state"),
+        ("busoff",          "H", 1,   "",    "can1_busoff"))),
+    ("PMU_BUS2", 0x506, PMU, 1000, True, (
+        ("load",            "H", 10,  "%",   "can2_load"),
+        ("tec",             "B", 1,   "",    "can2_tec"),
+        ("rec",             "B", 1,   "",    "can2_rec"),
+        ("state",           "B", 1,   "",    "can2_state"),
+        ("busoff",          "H", 1,   "",    "can2_busoff"))),
+
+    # 0xFFFF = not reached / not measured
+    ("PMU_CRANK_REPORT", 0x510, PMU, 0, False, (
+        ("outcome",         "B", 1,   "",    None),
+        ("timeouts",        "B", 1,   "",    None),
+        ("t_hb",            "H", 1,   "ms",  None),
+        ("t_pdo",           "H", 1,   "ms",  None),
+        ("start",           "H", 1,   "ms",  None))),
+    ("PMU_CRANK_REPORT2", 0x511, PMU, 0, False, (
+        ("ramp",            "H", 1,   "ms",  None),
+        ("ipk_load",        "H", 10,  "A",   None),
+        ("ipk_batt",        "H", 10,  "A",   None),
+        ("max_rpm",         "H", 1,   "rpm", None))),
+)
+
+_BUS_STATES = {0: "STOPPED", 1: "ACTIVE", 2: "WARNING", 3: "PASSIVE",
+               4: "BUS_OFF"}
+
+# Value names for enum signals: (message, signal) -> names by value
+VALUE_NAMES = {
+    ("PMU_CMD", "cmd"): {CMD_CRANK: "CRANK", CMD_REGEN: "REGEN",
+                         CMD_STOP: "STOP", CMD_PRECHARGE: "PRECHARGE"},
+    ("PMU_CMD_ACK", "result"): {ACK_OK: "OK", ACK_IGNORED: "IGNORED",
+                                ACK_BUSY: "BUSY", ACK_BAD: "BAD"},
+    ("PMU_STATUS", "state"): {0: "WAIT", 1: "CRANK", 2: "COAST",
+                              3: "REGEN", 4: "PRECHARGE"},
+    ("PMU_STATUS", "regen_mode"): {0: "RPM", 1: "BATT", 2: "TUNE"},
+    ("PMU_BUS1", "state"): _BUS_STATES,
+    ("PMU_BUS2", "state"): _BUS_STATES,
+    ("PMU_CRANK_REPORT", "outcome"): {0: "NONE", 1: "START", 2: "NOSTART",
+                                      3: "ABORT"},
+}
+
+RANGE = {"B": (0, 0xFF), "b": (-0x80, 0x7F),
+         "H": (0, 0xFFFF), "h": (-0x8000, 0x7FFF),
+         "I": (0, 0xFFFFFFFF), "i": (-0x80000000, 0x7FFFFFFF)}
+
+
+def _layout(signals):
+    out = []
+    off = 0
+    for _, c, scale, _, _ in signals:
+        lo, hi = RANGE[c]
+        out.append((">" + c, off, scale, lo, hi))
+        off += struct.calcsize(c)
+    return tuple(out), off
+
+
+# Built once at import: per message (fmt, offset, scale, lo, hi) per
+# signal, frame length, telemetry sources, and can_id -> index
+LAYOUT = []
+DLC = []
+for _m in MSGS:
+    _l, _n = _layout(_m[5])
+    LAYOUT.append(_l)
+    DLC.append(_n)
+LAYOUT = tuple(LAYOUT)
+DLC = tuple(DLC)
+SOURCES = tuple(tuple(s[4] for s in m[5]) for m in MSGS)
+BY_ID = dict((m[1], i) for i, m in enumerate(MSGS))
+
+
+def msg_index(name):
+    for i, m in enumerate(MSGS):
+        if m[0] == name:
+            return i
+    raise KeyError(name)
+
+
+def _put(buf, field, v):
+    fmt, off, scale, lo, hi = field
+    v = round(v * scale)
+    struct.pack_into(fmt, buf, off, lo if v < lo else hi if v > hi else v)
+
+
+def encode_into(m, buf, vals):
+    """Pack physical values (signal order) of message m into buf."""
+    lay = LAYOUT[m]
+    for k in range(len(lay)):
+        _put(buf, lay[k], vals[k])
+    return buf
+
+
+def encode_obj(m, buf, obj):
+    """Pack message m from obj's attributes (SOURCES[m]) into buf."""
+    lay = LAYOUT[m]
+    src = SOURCES[m]
+    for k in range(len(lay)):
+        _put(buf, lay[k], getattr(obj, src[k]))
+    return buf
+
+
+def decode_into(m, data, out):
+    """Unpack message m into out (physical values, signal order)."""
+    lay = LAYOUT[m]
+    for k in range(len(lay)):
+        fmt, off, scale, _, _ = lay[k]
+        v = struct.unpack_from(fmt, data, off)[0]
+        out[k] = v if scale == 1 else v / scale
+    return out
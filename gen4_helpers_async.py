@@ -1,6 +1,8 @@
 # gen4_helpers_async.py
-# Async SDO + DS402 helpers compatible with the original AsyncCANPort
-# (must provide send_async(can_id, data) and recv() -> dict with "id", "data")
+# Async SDO + DS402 helpers for AsyncCANPort (send_async(can_id, data)).
+# Responses are not read from the port: the CAN1 decode task hands every
+# 0x580+node frame to pmu_can_events (CE_SDO, copied to sdo_buf), and the
+# transactions below wait on that event.
 #
 # - Expedited SDO read/write (u8/u16/u32/i8/i16/i32)
 # - DS402 control helpers (6040/6060/6041)
@@ -12,6 +14,9 @@
 import uasyncio as asyncio
 import utime
 
+import pmu_can_events as cev
+from pmu_can_events import CE_SDO
+
 # ──────────────────────────────────────────────────────────────
 # Time helpers
 
@@ -107,6 +112,15 @@ def _abort_str(code):
 # ──────────────────────────────────────────────────────────────
 # Core SDO transactions (expedited)
 
+async def _sdo_reply(rx_id, t0, timeout_ms):
+    """Next SDO response from rx_id before t0 + timeout_ms, or None."""
+    while True:
+        left = timeout_ms - _elapsed(t0)
+        if left <= 0 or not await cev.wait(CE_SDO, left):
+            return None
+        if cev.sdo_id == rx_id and cev.sdo_len >= 4:
+            return cev.sdo_buf
+
 async def _sdo_write_exp(can_port, node_id, index, sub, payload_bytes, timeout_ms=500):
     """
     Expedited SDO write (1–4 bytes).
@@ -125,14 +139,6 @@ async def _sdo_write_exp(can_port, node_id, index, sub, payload_bytes, timeout_m
     else:
         raise ValueError("Expedited write supports 1–4 bytes only")
 
-    # Try to clear any stale SDO replies from queue, if the port exposes _rx_q
-    if hasattr(can_port, "_rx_q"):
-        while True:
-            try:
-                _ = can_port._rx_q.get_nowait()
-            except Exception:
-                break
-
     frame = bytes((
         cmd,
         index & 0xFF, (index >> 8) & 0xFF,
@@ -142,18 +148,15 @@ async def _sdo_write_exp(can_port, node_id, index, sub, payload_bytes, timeout_m
     tx_id = _sdo_tx_cobid(node_id)
     rx_id = _sdo_rx_cobid(node_id)
 
+    # Forget stale replies, then only a response to this request counts
+    cev.clear(CE_SDO)
     await can_port.send_async(tx_id, frame)
 
     t0 = _now()
-    while _elapsed(t0) < timeout_ms:
-        msg = await can_port.recv()
-        if not isinstance(msg, dict):
-            continue
-        if msg.get("id") != rx_id:
-            continue
-        data = msg.get("data", b"")
-        if len(data) < 4:
-            continue
+    while True:
+        data = await _sdo_reply(rx_id, t0, timeout_ms)
+        if data is None:
+            break
 
         ab = _maybe_abort(data)
         if ab is not None:
@@ -180,19 +183,15 @@ async def _sdo_read_exp(can_port, node_id, index, sub, timeout_ms=200):
         sub & 0xFF,
         0, 0, 0, 0,
     ))
+    cev.clear(CE_SDO)
     await can_port.send_async(_sdo_tx_cobid(node_id), req)
 
     cob_expect = _sdo_rx_cobid(node_id)
     t0 = _now()
-    while _elapsed(t0) < timeout_ms:
-        msg = await can_port.recv()
-        if not isinstance(msg, dict):
-            continue
-        if msg.get("id") != cob_expect:
-            continue
-        data = msg.get("data", b"")
-        if len(data) < 4:
-            continue
+    while True:
+        data = await _sdo_reply(cob_expect, t0, timeout_ms)
+        if data is None:
+            break
 
         ab = _maybe_abort(data)
         if ab is not None:
@@ -9,20 +9,15 @@ import pmu_can
 import pmu_ui
 
 
-import pmu_preactor_standalone
-import pmu_crank_io
-import pmu_pid_regen
+from pmu_fsm import FSM, EVT_PRECHARGE, EVT_CRANK, EVT_REGEN, EVT_STOP
 import customer_can
+from customer_proto import CMD_CRANK, CMD_REGEN, CMD_STOP, CMD_PRECHARGE
 import pmu_config
 
 
 from pmu_config import (
     DATA,
     STATE_WAITING,
-    STATE_PRECHARGE,
-    STATE_CRANK,
-    STATE_COAST,
-    STATE_REGEN
 )
 
 
@@ -31,6 +26,7 @@ from pmu_supervisor_can import gen4_supervisor
 
 from NHD_Display import NHD_0420D3Z_I2C
 from pmu_logger_async import log_1hz_task
+from pmu_loops import LOOPS
 
 
 # --------------------------------------------------------------------
@@ -65,92 +61,10 @@ async def raw_can_debug(can_hw):
 
 
 # ----------------------------------------------------------------------------
-# CUSTOMER CAN2 HANDLER
+# CUSTOMER CAN2 COMMANDS (PMU_CMD → FSM event; PMU_CMD_ACK back)
 # ----------------------------------------------------------------------------
-async def customer_can_handler():
-    
-    while True:
-        try:
-            cmd = customer_can.poll_command()
-            if cmd == 0x01:
-                DATA.state = STATE_CRANK
-            elif cmd == 0x02:
-                DATA.state = STATE_REGEN
-            elif cmd == 0x03:
-                DATA.state = STATE_WAITING
-        except Exception as e:
-            print("Customer CAN handler error:", e)
-        await asyncio.sleep_ms(50)
-
-
-
-# ----------------------------------------------------------------------------
-# PMU FSM
-# ----------------------------------------------------------------------------
-async def pmu_fsm(CAN1_PORT):
-
-    STATE_NAMES = {
-        STATE_WAITING: "WAIT",
-        STATE_PRECHARGE: "PCHG",
-        STATE_CRANK: "CRNK",
-        STATE_COAST: "COST",
-        STATE_REGEN: "RGN",
-    }
-
-    while True:
-
-        # Update UI text and request status refresh
-        DATA.state_txt = STATE_NAMES.get(DATA.state, "UNK")
-        DATA.ui_needs_update = True
-
-        # ---------- WAITING ----------
-        if DATA.state == STATE_WAITING:
-            await asyncio.sleep_ms(100)
-            continue
-
-        # ---------- PRECHARGE ----------
-        if DATA.state == STATE_PRECHARGE:
-            print("FSM: Precharge start")
-
-            if DATA.dc_bus_v < (0.85 * DATA.battery_v):
-                await pmu_preactor_standalone.run(DATA, CAN1_PORT, DATA.lcd)
-
-            print("FSM: Precharge done → COAST")
-            DATA.state = STATE_COAST
-            continue
-
-        # ---------- CRANK ----------
-        if DATA.state == STATE_CRANK:
-            print("FSM: Starting CRANK sequence")
-
-            # Ensure precharge
-            if DATA.dc_bus_v < (0.85 * DATA.battery_v):
-                await pmu_preactor_standalone.run(DATA, CAN1_PORT, DATA.lcd)
-
-            await pmu_crank_io.run(DATA, CAN1_PORT, DATA.lcd)
-
-            print("FSM: Crank complete → COAST")
-            DATA.state = STATE_COAST
-            continue
-
-        # ---------- COAST ----------
-        if DATA.state == STATE_COAST:
-            print("FSM: COAST mode — letting RPM stabilise")
-            await asyncio.sleep_ms(1500)
-            continue
-
-        # ---------- REGEN ----------
-        if DATA.state == STATE_REGEN:
-            print("FSM: ENTER PID REGEN")
-
-            await pmu_pid_regen.run(CAN1_PORT, DATA, DATA.lcd)
-
-            DATA.state = STATE_WAITING
-            continue
-
-        # Safety default
-        DATA.state = STATE_WAITING
-        await asyncio.sleep_ms(100)
+_CMD_EVENTS = {CMD_CRANK: EVT_CRANK, CMD_REGEN: EVT_REGEN, CMD_STOP: EVT_STOP,
+               CMD_PRECHARGE: EVT_PRECHARGE}
 
 
 async def delayed_ui_start():
@@ -200,7 +114,7 @@ async def main():
 
     # Sync generator
     print("Starting SYNC task…")
-    asyncio.create_task(sync_task(CAN1_PORT.hwcan, 20))
+    asyncio.create_task(sync_task(CAN1_PORT, 20))
 
 
 
@@ -218,29 +132,32 @@ async def main():
     print("Starting logger…")
     asyncio.create_task(log_1hz_task())
 
-    # Customer CAN
+    # Fixed-rate control loops (PID regen registers here)
+    print("Starting control-loop executor…")
+    asyncio.create_task(LOOPS.run())
+
+    # Customer CAN commands post straight into the FSM
     print("Starting customer CAN…")
-    asyncio.create_task(customer_can_handler())
+    customer_can.attach(FSM, CAN2_PORT, _CMD_EVENTS)
     
     # Boot mode
     if FORCE_PRECHARGE_TEST:
         print("Boot mode: PRECHARGE TEST")
-        asyncio.create_task(pmu_preactor_standalone.run(DATA, CAN1_PORT, DATA.lcd))
+        FSM.post(EVT_PRECHARGE)
 
     elif FORCE_CRANK_AT_BOOT:
         print("Boot mode: CRANK")
-        DATA.state = STATE_CRANK
+        FSM.post(EVT_CRANK)
 
     elif FORCE_PID_AT_BOOT:
         print("Boot mode: PID REGEN")
-        DATA.state = STATE_REGEN
+        FSM.post(EVT_REGEN)
 
     else:
         print("Boot mode: WAITING")
-        DATA.state = STATE_WAITING
 
-    # Start FSM
-    asyncio.create_task(pmu_fsm(CAN1_PORT))
+    # Start FSM (event-driven; boot events above are already queued)
+    asyncio.create_task(FSM.run(CAN1_PORT))
 
 
     print("Scheduling UI…")
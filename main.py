@@ -9,28 +9,29 @@ import pmu_can
 import pmu_ui
 
 
-import pmu_preactor_standalone
-import pmu_crank_io
-import pmu_pid_regen
+from pmu_fsm import FSM, EVT_PRECHARGE, EVT_CRANK, EVT_REGEN, EVT_STOP
 import customer_can
+from customer_proto import CMD_CRANK, CMD_REGEN, CMD_STOP, CMD_PRECHARGE
 import pmu_config
 
 
 from pmu_config import (
     DATA,
     STATE_WAITING,
-    STATE_PRECHARGE,
-    STATE_CRANK,
-    STATE_COAST,
-    STATE_REGEN
 )
 
 
 from async_can_dual import sync_task
 from pmu_supervisor_can import gen4_supervisor
+from pmu_busmon import BUSMON
+from pmu_memmon import MEMMON
 
 from NHD_Display import NHD_0420D3Z_I2C
 from pmu_logger_async import log_1hz_task
+import pmu_trace
+from pmu_loops import LOOPS
+from pmu_throttle import pwm_report
+import pmu_throttle_cal
 
 
 # --------------------------------------------------------------------
@@ -39,6 +40,7 @@ from pmu_logger_async import log_1hz_task
 FORCE_PRECHARGE_TEST = False
 FORCE_CRANK_AT_BOOT  = False
 FORCE_PID_AT_BOOT    = False
+FORCE_THROTTLE_CAL   = False   # sweep + save THROTTLE_CAL_FILE, stay WAITING
 
 
 # ----------------------------------------------------------------------------
@@ -65,103 +67,10 @@ async def raw_can_debug(can_hw):
 
 
 # ----------------------------------------------------------------------------
-# CUSTOMER CAN2 HANDLER
+# CUSTOMER CAN2 COMMANDS (PMU_CMD → FSM event; PMU_CMD_ACK back)
 # ----------------------------------------------------------------------------
-async def customer_can_handler():
-    
-    while True:
-        try:
-            cmd = customer_can.poll_command()
-            if cmd == 0x01:
-                DATA.state = STATE_CRANK
-            elif cmd == 0x02:
-                DATA.state = STATE_REGEN
-            elif cmd == 0x03:
-                DATA.state = STATE_WAITING
-        except Exception as e:
-            print("Customer CAN handler error:", e)
-        await asyncio.sleep_ms(50)
-
-
-
-# ----------------------------------------------------------------------------
-# PMU FSM
-# ----------------------------------------------------------------------------
-async def pmu_fsm(CAN1_PORT):
-
-    STATE_NAMES = {
-        STATE_WAITING: "WAIT",
-        STATE_PRECHARGE: "PRE-CHG",
-        STATE_CRANK: "CRANK",
-        STATE_COAST: "COAST",
-        STATE_REGEN: "REGEN",
-    }
-
-    while True:
-
-        # Update UI text and request status refresh
-        DATA.state_txt = STATE_NAMES.get(DATA.state, "UNK")
-        DATA.ui_needs_update = True
-
-        if DATA.regen_abort and DATA.state == STATE_REGEN:
-            print("FSM: Regen aborted → WAITING")
-            DATA.state = STATE_WAITING
-            continue
-
-        # ---------- WAITING ----------
-        if DATA.state == STATE_WAITING:
-            await asyncio.sleep_ms(100)
-            continue
-
-        # ---------- PRECHARGE ----------
-        if DATA.state == STATE_PRECHARGE:
-            print("FSM: Precharge start")
-
-            print("Threshold = ",(0.85 * DATA.batt_nominal_v))
-            print("DC Bus = ",(DATA.battery_v))
-            
-            if DATA.battery_v < (0.85 * DATA.batt_nominal_v):
-                await pmu_preactor_standalone.run(DATA, CAN1_PORT, DATA.lcd)
-
-            print("FSM: Precharge done → COAST")
-            DATA.state = STATE_COAST
-            continue
-
-        # ---------- CRANK ----------
-        if DATA.state == STATE_CRANK:
-            print("FSM: Starting CRANK sequence")
-
-            # Ensure precharge
-            if DATA.dc_bus_v < (0.85 * DATA.battery_v):
-                await pmu_preactor_standalone.run(DATA, CAN1_PORT, DATA.lcd)
-
-            await pmu_crank_io.run(DATA, CAN1_PORT, DATA.lcd)
-
-            print("FSM: Crank complete → COAST")
-            DATA.state = STATE_COAST
-            continue
-
-        # ---------- COAST ----------
-        if DATA.state == STATE_COAST:
-            print("FSM: COAST mode — letting RPM stabilise")
-            await asyncio.sleep_ms(1500)
-            continue
-
-        # ---------- REGEN ----------
-        if DATA.state == STATE_REGEN:
-            print("FSM: ENTER PID REGEN")
-
-            await pmu_pid_regen.run(CAN1_PORT, DATA, DATA.lcd)
-
-            DATA.state = STATE_WAITING
-            continue
-        
-        
-
-
-        # Safety default
-        DATA.state = STATE_WAITING
-        await asyncio.sleep_ms(100)
+_CMD_EVENTS = {CMD_CRANK: EVT_CRANK, CMD_REGEN: EVT_REGEN, CMD_STOP: EVT_STOP,
+               CMD_PRECHARGE: EVT_PRECHARGE}
 
 
 async def delayed_ui_start():
@@ -178,6 +87,18 @@ async def delayed_ui_start():
     asyncio.create_task(pmu_ui.ui_task(DATA.lcd))
     await asyncio.sleep_ms(5)
 
+
+async def throttle_cal_task():
+    # Let the ADC settle before sweeping
+    await asyncio.sleep_ms(1000)
+    try:
+        cal = await pmu_throttle_cal.calibrate()
+    except Exception as e:
+        print("Throttle cal error:", e)
+        return
+    print("Throttle cal:", "saved" if cal else "FAILED (curve unusable)")
+    pwm_report()
+
     
 # ----------------------------------------------------------------------------
 # MAIN ENTRY
@@ -211,7 +132,7 @@ async def main():
 
     # Sync generator
     print("Starting SYNC task…")
-    asyncio.create_task(sync_task(CAN1_PORT.hwcan, 20))
+    asyncio.create_task(sync_task(CAN1_PORT, 20))
 
 
 
@@ -220,6 +141,12 @@ async def main():
     print("Starting supervisor…")
     asyncio.create_task(gen4_supervisor())
 
+    # Bus load / error counters
+    asyncio.create_task(BUSMON.task(CAN1_PORT, CAN2_PORT))
+
+    # Heap metrics + GC in idle windows
+    asyncio.create_task(MEMMON.task())
+
 
     # ADC
     print("Starting ADC…")
@@ -229,29 +156,43 @@ async def main():
     print("Starting logger…")
     asyncio.create_task(log_1hz_task())
 
-    # Customer CAN
+    # Throttle output resolution
+    pwm_report()
+
+    # Fixed-rate control loops (PID regen registers here)
+    print("Starting control-loop executor…")
+    asyncio.create_task(LOOPS.run())
+
+    # Event trace drain
+    pmu_trace.set_level(pmu_config.TRACE_LEVEL)
+    asyncio.create_task(pmu_trace.drain_task(pmu_config.TRACE_SINK))
+
+    # Customer CAN commands post straight into the FSM
     print("Starting customer CAN…")
-    asyncio.create_task(customer_can_handler())
+    customer_can.attach(FSM, CAN2_PORT, _CMD_EVENTS)
     
     # Boot mode
     if FORCE_PRECHARGE_TEST:
         print("Boot mode: PRECHARGE TEST")
-        asyncio.create_task(pmu_preactor_standalone.run(DATA, CAN1_PORT, DATA.lcd))
+        FSM.post(EVT_PRECHARGE)
 
     elif FORCE_CRANK_AT_BOOT:
         print("Boot mode: CRANK")
-        DATA.state = STATE_CRANK
+        FSM.post(EVT_CRANK)
 
     elif FORCE_PID_AT_BOOT:
         print("Boot mode: PID REGEN")
-        DATA.state = STATE_REGEN
+        FSM.post(EVT_REGEN)
+
+    elif FORCE_THROTTLE_CAL:
+        print("Boot mode: THROTTLE CAL")
+        asyncio.create_task(throttle_cal_task())
 
     else:
         print("Boot mode: WAITING")
-        DATA.state = STATE_WAITING
 
-    # Start FSM
-    asyncio.create_task(pmu_fsm(CAN1_PORT))
+    # Start FSM (event-driven; boot events above are already queued)
+    asyncio.create_task(FSM.run(CAN1_PORT))
 
 
     print("Scheduling UI…")
@@ -263,8 +204,7 @@ async def main():
  
  
     # Idle forever
-    while True:
-        await asyncio.sleep_ms(200)
+    await asyncio.Event().wait()
 
 
 # ----------------------------------------------------------------------------
@@ -0,0 +1,218 @@
+# pmu_autotune.py — throttle step test and FOPDT fit for the rpm regen PID
+# ------------------------------------------------------------------------
+# Entered like a regen session (DATA.regen_mode == REGEN_TUNE):
+#
+#   1. hold throttle at tune_u0 for TUNE_SETTLE_MS (engine settles)
+#   2. record rpm + throttle every PID_PERIOD_MS on LOOPS: _PRE samples at
+#      u0, then step to u0 + tune_step and record TUNE_RECORD_MS more
+#   3. throttle back to neutral, write the recording to TUNE_FILE
+#   4. fit K / tau / theta (two-point 28.3% / 63.2% method) and compute
+#      SIMC PI gains; store them in DATA.pid_kp/pid_ki, the settings file
+#      and, if a gain table exists, its cell at the operating point
+#
+# tools/autotune_fit.py re-fits TUNE_FILE on the host by least squares.
+# Sample buffers are allocated once before recording; the sampling step
+# only writes into them.
+#
+# TUNE_FILE layout (little-endian):
+#   "<4sHHHHfff"  magic b"PTUN", version, n, dt_ms, k_step, u0, du, vdc
+#   n x float32   rpm
+#   n x float32   throttle volts
+import struct
+import uasyncio as asyncio
+from array import array
+from micropython import const
+
+from pmu_throttle import set_throttle_voltage, set_throttle_voltage_now, V_NEUTRAL_HW
+from pmu_loops import LOOPS
+from pmu_trace import emit
+from pmu_trace_events import (
+    EV_TUNE_START, EV_TUNE_STEP, EV_TUNE_FIT, EV_TUNE_GAINS,
+    EV_TUNE_FAIL, EV_TUNE_ABORT,
+)
+import pmu_gain_sched
+
+from pmu_config import (
+    DATA,
+    STATE_REGEN,
+    GRP_TPDO1,
+    GRP_TPDO2,
+    PID_PERIOD_MS,
+    TUNE_FILE,
+    TUNE_SETTLE_MS,
+    TUNE_RECORD_MS,
+)
+
+TUNE_MAGIC = b"PTUN"
+TUNE_HDR = "<4sHHHHfff"
+
+_PRE = const(50)            # baseline samples before the step
+MIN_DRPM = 20.0             # smaller responses are treated as noise
+
+# Fit failure codes (EV_TUNE_FAIL)
+FAIL_NO_RESPONSE = const(1)
+FAIL_NEG_GAIN = const(2)
+FAIL_NOT_SETTLED = const(3)
+
+_tpdo1 = array("f", (0.0, 0.0, 0.0, 0.0))   # velocity, torque_act, iq_actual, iq_target
+_tpdo2 = array("f", (0.0, 0.0, 0.0, 0.0))   # ud, uq, mod, dc_bus_v
+_rpm = None
+_thr = None
+_n = 0
+_k = 0
+_u1 = 0.0
+
+
+def _sample(now_us):
+    """LOOPS step: apply the step at _PRE, record one sample."""
+    global _k
+    k = _k
+    if k >= _n:
+        return
+    DATA.read_group(GRP_TPDO1, _tpdo1)  # keeps the previous copy on a miss
+    if k == _PRE:
+        set_throttle_voltage_now(_u1)
+        emit(EV_TUNE_STEP, int(_tpdo1[0]))
+    _rpm[k] = _tpdo1[0]
+    _thr[k] = DATA.throttle_v
+    _k = k + 1
+
+
+def fit_fopdt(rpm, n, k_step, du, dt):
+    """
+    Two-point fit of a first-order-plus-dead-time step response.
+    Returns (K, tau, theta) with K in rpm/V and times in s, or raises
+    OSError(code).
+    """
+    y0 = 0.0
+    for i in range(k_step):
+        y0 += rpm[i]
+    y0 /= k_step
+    m = max(1, (n - k_step) // 10)
+    yf = 0.0
+    for i in range(n - m, n):
+        yf += rpm[i]
+    yf /= m
+
+    dy = yf - y0
+    if abs(dy) < MIN_DRPM:
+        raise OSError(FAIL_NO_RESPONSE)
+    K = dy / du
+    if K <= 0:
+        raise OSError(FAIL_NEG_GAIN)
+
+    t28 = t63 = -1.0
+    for i in range(k_step, n):
+        r = (rpm[i] - y0) / dy
+        if t28 < 0 and r >= 0.283:
+            t28 = (i - k_step) * dt
+        if r >= 0.632:
+            t63 = (i - k_step) * dt
+            break
+    if t63 < 0 or t28 < 0:
+        raise OSError(FAIL_NOT_SETTLED)
+
+    tau = max(dt, 1.5 * (t63 - t28))
+    theta = max(0.0, t63 - tau)
+    return K, tau, theta
+
+
+def simc(K, tau, theta, dt):
+    """SIMC PI gains (tc = theta, at least two sample periods)."""
+    tc = max(theta, 2 * dt)
+    kp = tau / (K * (tc + theta))
+    ki = kp / min(tau, 4 * (tc + theta))
+    return kp, ki
+
+
+def _save(n, k_step, u0, du, vdc):
+    try:
+        with open(TUNE_FILE, "wb") as f:
+            f.write(struct.pack(TUNE_HDR, TUNE_MAGIC, 1, n, PID_PERIOD_MS,
+                                k_step, u0, du, vdc))
+            f.write(_rpm)
+            f.write(_thr)
+    except OSError as e:
+        print("Tune save error:", e)
+
+
+async def _show(lcd, l1, l2, l3):
+    if lcd is None:
+        return
+    await lcd.clear_screen()
+    await lcd.set_cursor(0, 0)
+    await lcd.write_string("MODE: AUTO-TUNE")
+    await lcd.set_cursor(1, 0)
+    await lcd.write_string(l1)
+    await lcd.set_cursor(2, 0)
+    await lcd.write_string(l2)
+    await lcd.set_cursor(3, 0)
+    await lcd.write_string(l3)
+
+
+async def run(can, DATA, lcd=None):
+    """Step test, fit and store gains. Returns (kp, ki) or None."""
+    global _rpm, _thr, _n, _k, _u1
+
+    dt = PID_PERIOD_MS / 1000
+    u0 = DATA.tune_u0
+    du = DATA.tune_step
+    _n = _PRE + TUNE_RECORD_MS // PID_PERIOD_MS
+    _rpm = array("f", bytes(4 * _n))
+    _thr = array("f", bytes(4 * _n))
+    _k = 0
+    _u1 = u0 + du
+    result = None
+
+    emit(EV_TUNE_START, int(u0 * 1000), int(du * 1000), _n)
+    await _show(lcd, "u0:%.2fV step:%.2fV" % (u0, du), "Settling...", "MENU=abort")
+
+    await set_throttle_voltage(u0)
+    waited = 0
+    while waited < TUNE_SETTLE_MS and DATA.state == STATE_REGEN and not DATA.regen_abort:
+        await asyncio.sleep_ms(50)
+        waited += 50
+
+    slot = LOOPS.register("tune", PID_PERIOD_MS, _sample)
+    try:
+        while _k < _n and DATA.state == STATE_REGEN and not DATA.regen_abort:
+            await asyncio.sleep_ms(50)
+    finally:
+        LOOPS.unregister(slot)
+        await set_throttle_voltage(V_NEUTRAL_HW)
+
+    if _k < _n:
+        emit(EV_TUNE_ABORT, _k)
+        await _show(lcd, "Aborted", "", "")
+    else:
+        DATA.read_group(GRP_TPDO2, _tpdo2)
+        vdc = _tpdo2[3]
+        _save(_n, _PRE, u0, du, vdc)
+        try:
+            K, tau, theta = fit_fopdt(_rpm, _n, _PRE, du, dt)
+        except OSError as e:
+            emit(EV_TUNE_FAIL, e.args[0])
+            await _show(lcd, "Fit failed, code %d" % e.args[0], "", "")
+        else:
+            kp, ki = simc(K, tau, theta, dt)
+            emit(EV_TUNE_FIT, int(K), int(tau * 1000), int(theta * 1000))
+            emit(EV_TUNE_GAINS, int(kp * 1e6), int(ki * 1e6))
+
+            DATA.pid_kp = kp
+            DATA.pid_ki = ki
+            DATA.pid_kd = 0.0
+            DATA.save_settings()
+
+            # Operating point for the gain schedule: mid-response rpm
+            rpm_op = (_rpm[_PRE - 1] + _rpm[_n - 1]) / 2
+            table = pmu_gain_sched.load()
+            if table is not None:
+                table.set_cell(rpm_op, vdc, kp, ki, 0.0)
+                table.save()
+
+            await _show(lcd, "K:%.0f T:%.2f L:%.2f" % (K, tau, theta),
+                        "Kp:%.5f" % kp, "Ki:%.5f" % ki)
+            result = (kp, ki)
+
+    _rpm = _thr = None
+    return result
@@ -0,0 +1,124 @@
+# pmu_batt_regen.py — battery-voltage regen with a charge-current inner loop
+# ---------------------------------------------------------------------------
+# Cascade, both stages pmu_pid.PID, stepped on LOOPS at BATT_PERIOD_MS:
+#
+#   outer: pid_setpoint (V) vs battery_v_f  ->  charge demand 0..regen_i_max (A)
+#   inner: charge demand (A) vs charge_i_f  ->  regen depth 0..(NEUTRAL-MIN) (V)
+#   throttle = V_NEUTRAL_HW - depth         (below neutral = regen)
+#
+# battery_v_f / charge_i_f are the EMA-filtered ADC values. The step is
+# polled every BATT_PERIOD_MS but only acts when ADCManager has published a
+# new GRP_ADC sample, so the cascade runs at the ADC rate with at most one
+# poll period of latency.
+#
+# When the inner loop is at full depth, the outer loop's upper limit is
+# pulled down to the measured current so it stops winding up on a demand
+# the generator cannot meet.
+#
+# If the ADC group goes stale the throttle is held at neutral.
+import uasyncio as asyncio
+from time import ticks_diff, ticks_us
+
+from pmu_throttle import (
+    set_throttle_voltage, set_throttle_voltage_now, V_NEUTRAL_HW, V_MIN_HW,
+)
+from pmu_pid import PID
+from pmu_loops import LOOPS
+from pmu_trace import emit
+from pmu_trace_events import EV_BATT_START, EV_BATT_STEP, EV_BATT_STALE, EV_BATT_EXIT
+
+from pmu_config import (
+    DATA,
+    STATE_REGEN,
+    GRP_ADC,
+    BATT_PERIOD_MS,
+)
+
+ADC_STALE_MS = 250          # five missed ADC samples
+
+_DEPTH_MAX = V_NEUTRAL_HW - V_MIN_HW
+
+_outer = PID(DATA.vbat_kp, DATA.vbat_ki, out_min=0.0, out_max=DATA.regen_i_max)
+_inner = PID(DATA.ichg_kp, DATA.ichg_ki, out_min=0.0, out_max=_DEPTH_MAX)
+_last_us = 0
+_last_seq = 0
+_stale = False
+
+
+def _load_gains():
+    """Apply the current settings (DATA.vbat_* / ichg_*) to the cascade."""
+    _outer.set_gains(DATA.vbat_kp, DATA.vbat_ki)
+    _outer.set_limits(0.0, DATA.regen_i_max)
+    _inner.set_gains(DATA.ichg_kp, DATA.ichg_ki)
+    _inner.set_limits(0.0, _DEPTH_MAX)
+
+
+def _step(now_us):
+    """One cascade step, called by LOOPS; skips until a new ADC sample."""
+    global _last_us, _last_seq, _stale
+
+    seq = DATA.grp_seq
+    s0 = seq[GRP_ADC]
+    if s0 == _last_seq or s0 & 1:
+        if DATA.group_age_ms(GRP_ADC) > ADC_STALE_MS and not _stale:
+            _stale = True
+            set_throttle_voltage_now(V_NEUTRAL_HW)
+            emit(EV_BATT_STALE, DATA.group_age_ms(GRP_ADC))
+        return
+    vb = DATA.battery_v_f
+    ib = DATA.charge_i_f
+    if seq[GRP_ADC] != s0:
+        return                          # ADC published meanwhile: next tick
+    _last_seq = s0
+
+    dt = max(1, ticks_diff(now_us, _last_us)) / 1_000_000
+    _last_us = now_us
+
+    if _stale:
+        # Resume bumplessly from neutral
+        _stale = False
+        _outer.reset(vb, ib)
+        _inner.reset(ib, 0.0)
+
+    # Outer loop may not ask for more than the inner loop can deliver
+    if _inner.saturated and _inner.u >= _DEPTH_MAX:
+        _outer.out_max = max(0.0, min(DATA.regen_i_max, ib))
+    else:
+        _outer.out_max = DATA.regen_i_max
+
+    # Battery below target -> positive error -> more charge current
+    i_dem = _outer.update(DATA.pid_setpoint, vb, dt)
+    depth = _inner.update(i_dem, ib, dt)
+    volts = V_NEUTRAL_HW - depth
+
+    set_throttle_voltage_now(volts)
+    emit(EV_BATT_STEP, int(vb * 10), int(ib * 10), int(i_dem * 10), int(volts * 1000))
+
+
+async def run(can, DATA, lcd=None):
+    global _last_us, _last_seq, _stale
+
+    emit(EV_BATT_START, int(DATA.pid_setpoint * 10), int(DATA.regen_i_max * 10))
+
+    _load_gains()
+    # Start from neutral with the present current as the demand
+    _outer.reset(DATA.battery_v_f, 0.0)
+    _inner.reset(DATA.charge_i_f, 0.0)
+    _last_seq = DATA.grp_seq[GRP_ADC]
+    _stale = False
+    _last_us = ticks_us()
+    slot = LOOPS.register("batt", BATT_PERIOD_MS, _step)
+
+    try:
+        while DATA.state == STATE_REGEN and not DATA.regen_abort:
+            await asyncio.sleep_ms(50)
+    finally:
+        LOOPS.unregister(slot)
+
+    emit(EV_BATT_EXIT)
+    LOOPS.report()
+
+    # Ensure throttle safe-off
+    await set_throttle_voltage(V_NEUTRAL_HW)
+
+    # The FSM returns to WAITING when this coroutine completes
@@ -0,0 +1,113 @@
+# pmu_busmon.py — CAN bus load and error-state monitor
+# ----------------------------------------------------
+# Every BUSMON_PERIOD_MS, per port:
+#
+#   load %    (RX + TX bits since last sample) / (baudrate * dt), bits per
+#             frame from pmu_can_txq.FRAME_BITS (worst-case stuffing).
+#             Frames rejected by the acceptance filters are never seen,
+#             so this is a lower bound on the real bus load.
+#   TEC/REC   transmit / receive error counters, hwcan.info()
+#   state     hwcan.state(): 1 active, 2 warning, 3 passive, 4 bus-off
+#   bus-off   hwcan.info() bus-off count; auto_restart=True recovers the
+#             controller silently, so each new event is traced here
+#
+# Results go to DATA.can1_* / can2_* (snapshot -> SD log, CAN2 PMU_BUS1/2
+# telemetry). State changes, bus-off events and load above
+# BUSMON_LOAD_WARN are traced; peak load per bus is kept in load_max.
+import uasyncio as asyncio
+from array import array
+from utime import ticks_ms, ticks_diff
+
+from pmu_config import DATA, BUSMON_PERIOD_MS, BUSMON_LOAD_WARN
+from pmu_trace import emit
+from pmu_trace_events import EV_CANBUS_STATE, EV_CANBUS_OFF, EV_CANBUS_LOAD
+
+# DATA attributes per bus: load, tec, rec, state, busoff
+_ATTRS = (
+    ("can1_load", "can1_tec", "can1_rec", "can1_state", "can1_busoff"),
+    ("can2_load", "can2_tec", "can2_rec", "can2_state", "can2_busoff"),
+)
+
+STATE_NAMES = ("STOPPED", "ACTIVE", "WARNING", "PASSIVE", "BUS-OFF")
+
+
+class BusMonitor:
+
+    def __init__(self):
+        self.ports = ()
+        self.t_last = 0
+        self.load_max = array("f", (0.0, 0.0))
+        self.busoff = array("H", (0, 0))
+        self.state = bytearray(b"\x01\x01")   # ERROR_ACTIVE
+        self._over = bytearray(2)       # load warning latched
+
+    def _take_bits(self, port):
+        n = port.rx_bits + port.txq.tx_bits
+        port.rx_bits = 0
+        port.txq.tx_bits = 0
+        return n
+
+    def sample(self, now):
+        dt = ticks_diff(now, self.t_last)
+        self.t_last = now
+        for b in range(len(self.ports)):
+            port = self.ports[b]
+            a = _ATTRS[b]
+            bits = self._take_bits(port)
+
+            load = 100.0 * bits * 1000 / (port.baudrate * dt) if dt > 0 else 0.0
+            setattr(DATA, a[0], load)
+            if load > self.load_max[b]:
+                self.load_max[b] = load
+            if load > BUSMON_LOAD_WARN:
+                if not self._over[b]:
+                    emit(EV_CANBUS_LOAD, b + 1, int(load * 10), BUSMON_LOAD_WARN)
+                    self._over[b] = 1
+            elif load < BUSMON_LOAD_WARN - 10:
+                self._over[b] = 0
+
+            try:
+                info = port.hwcan.info(port._info)
+                st = port.hwcan.state()
+            except Exception:
+                continue
+            tec = info[0]
+            setattr(DATA, a[1], tec if tec < 255 else 255)
+            setattr(DATA, a[2], info[1] if info[1] < 255 else 255)
+            setattr(DATA, a[3], st)
+            if st != self.state[b]:
+                emit(EV_CANBUS_STATE, b + 1, self.state[b], st, tec)
+                self.state[b] = st
+
+            n = info[4]
+            if n != self.busoff[b]:
+                emit(EV_CANBUS_OFF, b + 1, (n - self.busoff[b]) & 0xFFFF, n)
+                self.busoff[b] = n
+                setattr(DATA, a[4], n)
+
+    async def task(self, *ports):
+        self.ports = ports
+        self.t_last = ticks_ms()
+        for p in ports:
+            self._take_bits(p)
+        while True:
+            await asyncio.sleep_ms(BUSMON_PERIOD_MS)
+            try:
+                self.sample(ticks_ms())
+            except Exception as e:
+                print("busmon error:", e)
+
+    def report(self):
+        for b in range(len(self.ports)):
+            a = _ATTRS[b]
+            st = getattr(DATA, a[3])
+            print("CAN%d: load %.1f %% (max %.1f)  TEC %d REC %d  %s  "
+                  "bus-off %d  rx overrun %d" % (
+                      b + 1, getattr(DATA, a[0]), self.load_max[b],
+                      getattr(DATA, a[1]), getattr(DATA, a[2]),
+                      STATE_NAMES[st] if st < len(STATE_NAMES) else st,
+                      getattr(DATA, a[4]), self.ports[b].rx_overrun))
+
+
+# Global instance
+BUSMON = BusMonitor()
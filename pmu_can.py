@@ -4,6 +4,7 @@
 from async_can_dual import DualCAN
 from pmu_can_filters import configure_can1_filters, configure_can2_filters
 from pmu_config import CAN1_BAUD, CAN2_BAUD
+import customer_can
 
 dual = None
 CAN1 = None
@@ -31,11 +32,14 @@ async def start_can():
 
     # 4. Apply filters in the correct order
     configure_can1_filters(CAN1)
-    configure_can2_filters(CAN2)
+    configure_can2_filters(CAN2, customer_can.RX_IDS)
     configure_can1_filters(CAN1)
 
+    # 5. CAN2 frames go to the customer command handler, not the Gen4 decoder
+    dual.can2.on_frame = customer_can.feed
+
     print("pmu_can: CAN1 & CAN2 filters applied (1 → 2 → 1)")
     print("pmu_can: decode tasks running")
 
-    # 5. Return the AsyncCANPort objects (not raw pyb.CAN)
+    # 6. Return the AsyncCANPort objects (not raw pyb.CAN)
     return dual.can1, dual.can2
@@ -8,7 +8,14 @@
 #
 # All decode failures are caught and suppressed safely.
 
-from pmu_config import DATA
+from pmu_config import (
+    DATA, GRP_TPDO1, GRP_TPDO2,
+    F_HEARTBEAT, F_MOTOR_TEMP, F_BATT_CURRENT, F_CAP_V, F_SEVCON_RPM,
+)
+import pmu_can_events as cev
+from pmu_can_events import (
+    CE_HB, CE_HB_OP, CE_TPDO1, CE_TPDO2, CE_TPDO5, CE_EMCY, NMT_OPERATIONAL,
+)
 import micropython
 micropython.const
 
@@ -36,7 +43,18 @@ def decode_frame(can_id, data, t_ms):
     if can_id == 0x701:
         DATA.gen4_online = True
         DATA.gen4_last_hb_ms = t_ms
-        # state byte is data[0], but not needed here
+        DATA.touch(F_HEARTBEAT, t_ms)
+        cev.signal(CE_HB, t_ms)
+        # state byte is data[0]
+        if len(data) >= 1 and (data[0] & 0x7F) == NMT_OPERATIONAL:
+            cev.signal(CE_HB_OP, t_ms)
+        return
+
+    # --------------------------------------------------------
+    # SDO response — 0x580 + nodeid (gen4_helpers_async waits on it)
+    # --------------------------------------------------------
+    if 0x581 <= can_id <= 0x5FF:
+        cev.sdo_response(can_id, data, t_ms)
         return
 
     # --------------------------------------------------------
@@ -49,6 +67,7 @@ def decode_frame(can_id, data, t_ms):
             DATA.gen4_emcy = code
             DATA.gen4_last_emcy_ms = t_ms
             DATA.fault_active = 1
+            cev.signal(CE_EMCY, t_ms)
         return
 
     # --------------------------------------------------------
@@ -62,12 +81,15 @@ def decode_frame(can_id, data, t_ms):
         # 4–5 : iq_actual (0.1 A)
         # 6–7 : iq_target (0.1 A)
 
+        DATA.begin_write(GRP_TPDO1)
         DATA.velocity = u16(data, 0)
         DATA.torque_act = s16(data, 2) / 10.0
         DATA.iq_actual = s16(data, 4) / 10.0
         DATA.iq_target = s16(data, 6) / 10.0
+        DATA.end_write(GRP_TPDO1, t_ms)
 
         DATA.gen4_last_pdo_ms = t_ms
+        cev.signal(CE_TPDO1, t_ms)
         return
 
     # --------------------------------------------------------
@@ -75,12 +97,15 @@ def decode_frame(can_id, data, t_ms):
     # typically: ud, uq, modulation index, DC-bus volts
     # --------------------------------------------------------
     if can_id == 0x281 and len(data) >= 8:
+        DATA.begin_write(GRP_TPDO2)
         DATA.ud = s16(data, 0) / 10.0
         DATA.uq = s16(data, 2) / 10.0
         DATA.mod = u16(data, 4) / 10.0
         DATA.dc_bus_v = u16(data, 6) / 10.0
+        DATA.end_write(GRP_TPDO2, t_ms)
 
         DATA.gen4_last_pdo_ms = t_ms
+        cev.signal(CE_TPDO2, t_ms)
         return
 
     # --------------------------------------------------------
@@ -96,6 +121,9 @@ def decode_frame(can_id, data, t_ms):
         DATA.motor_temp = s16(data, 0) / 10.0
         DATA.batt_current = s16(data, 2) / 10.0
         DATA.cap_v = u16(data, 4) / 10.0
+        DATA.touch(F_MOTOR_TEMP, t_ms)
+        DATA.touch(F_BATT_CURRENT, t_ms)
+        DATA.touch(F_CAP_V, t_ms)
 
         DATA.gen4_last_pdo_ms = t_ms
         return
@@ -112,6 +140,8 @@ def decode_frame(can_id, data, t_ms):
                 # MicroPython requires positional args only
                 vel_raw = int.from_bytes(data[4:8], "little", True)
                 DATA.sevcon_rpm = vel_raw
+                DATA.touch(F_SEVCON_RPM, t_ms)
+                cev.signal(CE_TPDO5, t_ms)
                 #print(DATA.sevcon_rpm)
 
             except Exception as e:
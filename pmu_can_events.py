@@ -0,0 +1,84 @@
+# pmu_can_events.py — CAN-layer events for sequencers
+# ---------------------------------------------------
+# decode_frame() (running in the CAN decode task) calls signal() when a
+# frame of interest arrives; sequencers await those events with a
+# timeout instead of polling DATA timestamps.
+#
+#   CE_HB       any Gen4 heartbeat (0x701)
+#   CE_HB_OP    heartbeat reporting NMT Operational (state 0x05)
+#   CE_TPDO1    TPDO1 (0x181)
+#   CE_TPDO2    TPDO2 (0x281)
+#   CE_TPDO5    TPDO5 actual velocity (0x154)
+#   CE_EMCY     EMCY (0x081)
+#   CE_SDO      SDO response (0x581-0x5FF); the frame is copied to
+#               sdo_buf / sdo_len / sdo_id for gen4_helpers_async
+#
+# stamp_ms[i] holds the ticks_ms of the last signal; count[i] the number.
+import uasyncio as asyncio
+from array import array
+from micropython import const
+from utime import ticks_ms, ticks_diff
+
+CE_HB = const(0)
+CE_HB_OP = const(1)
+CE_TPDO1 = const(2)
+CE_TPDO2 = const(3)
+CE_TPDO5 = const(4)
+CE_EMCY = const(5)
+CE_SDO = const(6)
+N_EVENTS = const(7)
+
+NMT_OPERATIONAL = const(0x05)
+
+EVENTS = [asyncio.Event() for _ in range(N_EVENTS)]
+stamp_ms = array("i", bytes(4 * N_EVENTS))
+count = array("I", bytes(4 * N_EVENTS))
+
+# Last SDO response (the decode task's data buffer is not ours to keep)
+sdo_buf = bytearray(8)
+sdo_len = 0
+sdo_id = 0
+
+
+def signal(ev, t_ms):
+    stamp_ms[ev] = t_ms
+    count[ev] += 1
+    EVENTS[ev].set()
+
+
+def sdo_response(can_id, data, t_ms):
+    global sdo_len, sdo_id
+    n = len(data)
+    if n > 8:
+        n = 8
+    for i in range(n):
+        sdo_buf[i] = data[i]
+    sdo_len = n
+    sdo_id = can_id
+    signal(CE_SDO, t_ms)
+
+
+def clear(ev):
+    """Forget earlier signals; the next wait needs a new frame."""
+    EVENTS[ev].clear()
+
+
+def seen_within(ev, window_ms):
+    """True if ev was signalled in the last window_ms."""
+    return count[ev] != 0 and ticks_diff(ticks_ms(), stamp_ms[ev]) <= window_ms
+
+
+async def wait(ev, timeout_ms):
+    """
+    Wait for ev (already-set counts). Returns True, or False on timeout.
+    The event is cleared afterwards so the next wait sees a new frame.
+    """
+    e = EVENTS[ev]
+    try:
+        if not e.is_set():
+            await asyncio.wait_for_ms(e.wait(), timeout_ms)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        e.clear()
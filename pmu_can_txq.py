@@ -0,0 +1,132 @@
+# pmu_can_txq.py — priority TX queue for AsyncCANPort
+# ---------------------------------------------------
+# bxCAN has three TX mailboxes; hwcan.send(timeout=0) raises when all are
+# busy. Frames that find no mailbox wait here instead of being dropped:
+#
+#   PRIO_NMT    SYNC / NMT / EMCY (COB-ID < 0x100)
+#   PRIO_RPDO   RPDO 1-4          (0x200 - 0x57F)
+#   PRIO_SDO    SDO requests      (0x600 - 0x67F), command acks
+#   PRIO_TELEM  everything else (CAN2 telemetry)
+#
+# Each priority is a ring of preallocated 8-byte slots; put() copies the
+# payload, so callers may reuse their buffers. drain() fills free
+# mailboxes highest priority first and is called from the port's tx_task.
+# Not IRQ safe: call put() from tasks only.
+#
+# Counters per priority: queued, sent, dropped (ring full), retried (send
+# raised although a mailbox looked free), and the worst queue delay (µs).
+from array import array
+from micropython import const
+from utime import ticks_us, ticks_diff
+
+PRIO_NMT = const(0)
+PRIO_RPDO = const(1)
+PRIO_SDO = const(2)
+PRIO_TELEM = const(3)
+N_PRIO = const(4)
+PRIO_NAMES = ("NMT", "RPDO", "SDO", "TELEM")
+
+DEPTH = (8, 8, 8, 16)           # slots per priority
+
+_F_EXT = const(1)
+_F_RTR = const(2)
+
+# Bits on the wire per standard frame by DLC: 47 fixed (SOF..IFS) + 8n,
+# plus worst-case stuffing over the 34 + 8n stuffable bits. Used for the
+# bus-load estimate (pmu_busmon).
+FRAME_BITS = tuple(47 + 8 * n + (34 + 8 * n - 1) // 4 for n in range(9))
+
+
+def tx_prio(can_id):
+    """Default priority from the CANopen COB-ID."""
+    if can_id < 0x100:
+        return PRIO_NMT
+    if 0x200 <= can_id < 0x580:
+        return PRIO_RPDO
+    if 0x600 <= can_id < 0x680:
+        return PRIO_SDO
+    return PRIO_TELEM
+
+
+class CANTxQueue:
+
+    def __init__(self):
+        n = sum(DEPTH)
+        self.base = array("H", bytes(2 * N_PRIO))
+        b = 0
+        for p in range(N_PRIO):
+            self.base[p] = b
+            b += DEPTH[p]
+        self.ids = array("I", bytes(4 * n))
+        self.dlc = bytearray(n)
+        self.flags = bytearray(n)
+        self.t_us = array("i", bytes(4 * n))
+        self.data = [bytearray(8) for _ in range(n)]
+        self.head = bytearray(N_PRIO)
+        self.count = bytearray(N_PRIO)
+        self._out = [bytearray(k) for k in range(9)]   # send buffer per DLC
+
+        self.queued = array("I", bytes(4 * N_PRIO))
+        self.sent = array("I", bytes(4 * N_PRIO))
+        self.dropped = array("I", bytes(4 * N_PRIO))
+        self.retried = array("I", bytes(4 * N_PRIO))
+        self.delay_max_us = array("I", bytes(4 * N_PRIO))
+        self.tx_bits = 0        # since last pmu_busmon sample
+
+    def pending(self):
+        c = self.count
+        return c[0] + c[1] + c[2] + c[3]
+
+    def put(self, prio, can_id, data, ext=False, rtr=False):
+        """Queue a copy of the frame; False (and counted) if prio is full."""
+        n = self.count[prio]
+        if n >= DEPTH[prio]:
+            self.dropped[prio] += 1
+            return False
+        i = self.base[prio] + (self.head[prio] + n) % DEPTH[prio]
+        k = len(data)
+        d = self.data[i]
+        for j in range(k):
+            d[j] = data[j]
+        self.ids[i] = can_id
+        self.dlc[i] = k
+        self.flags[i] = (_F_EXT if ext else 0) | (_F_RTR if rtr else 0)
+        self.t_us[i] = ticks_us()
+        self.count[prio] = n + 1
+        self.queued[prio] += 1
+        return True
+
+    def drain(self, hwcan, free):
+        """Send up to free frames; stops at the first busy mailbox."""
+        for p in range(N_PRIO):
+            while self.count[p] and free > 0:
+                h = self.head[p]
+                i = self.base[p] + h
+                k = self.dlc[i]
+                out = self._out[k]
+                d = self.data[i]
+                for j in range(k):
+                    out[j] = d[j]
+                f = self.flags[i]
+                try:
+                    hwcan.send(out, self.ids[i], timeout=0,
+                               rtr=bool(f & _F_RTR), extframe=bool(f & _F_EXT))
+                except Exception:
+                    self.retried[p] += 1
+                    return
+                dt = ticks_diff(ticks_us(), self.t_us[i])
+                if dt > self.delay_max_us[p]:
+                    self.delay_max_us[p] = dt
+                self.head[p] = (h + 1) % DEPTH[p]
+                self.count[p] -= 1
+                self.sent[p] += 1
+                self.tx_bits += FRAME_BITS[k]
+                free -= 1
+
+    def report(self, label=""):
+        print("%stxq: pending %d" % (label, self.pending()))
+        for p in range(N_PRIO):
+            print("  %-5s queued %6d sent %6d dropped %4d retried %4d"
+                  " max delay %6d us" % (
+                      PRIO_NAMES[p], self.queued[p], self.sent[p],
+                      self.dropped[p], self.retried[p], self.delay_max_us[p]))
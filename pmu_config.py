@@ -2,6 +2,9 @@
 # ------------------------------------------------------
 # Keep this tiny: constants + a single shared data object.
 
+import struct
+import time
+from array import array
 from micropython import const
 from adc_manager import ADCManager
 
@@ -16,6 +19,71 @@ NODE_ID_BMS      = const(0x03)
 LOG_TO_SD = True
 LOG_DIR = "/sd"
 LOG_PERIOD_HZ = const(1)  # 1Hz CSV logging
+LOG_MAX_BYTES = const(1_000_000)  # rotate file at this size
+LOG_MAX_AGE_S = const(3600)       # ...or after this long (0 = daily only)
+LOG_MAX_FILES = const(72)         # oldest logs deleted beyond this
+LOG_INDEX_EVERY = const(60)       # rows between time-index entries
+
+# ---- Event trace (pmu_trace)
+TRACE_LEVEL = 1           # 0=debug 1=info 2=warn 3=error
+TRACE_SINK = "repl"       # "repl" or "sd"
+
+# ---- CAN bus monitor (pmu_busmon)
+BUSMON_PERIOD_MS = const(1000)    # sample period for load / error counters
+BUSMON_LOAD_WARN = const(70)      # % bus load that raises a trace warning
+
+# ---- Heap / GC monitor (pmu_memmon)
+MEM_PERIOD_MS = const(1000)       # sample period; idle-window collect rate
+MEM_PROBE_EVERY = const(10)       # idle periods between largest-block probes
+MEM_LOW_BYTES = const(8192)       # free heap that raises a trace warning
+
+# ---- Control loops (pmu_loops)
+LOOP_TIMER_ID = 7         # hardware timer that wakes the executor (None = sleep-based)
+LOOP_TICK_MS = const(1)   # fastest executor tick (actual: GCD of loop periods)
+PID_PERIOD_MS = const(10) # PID regen step period
+GAIN_FILE = "/sd/pmu_gains.csv"   # rpm x Vdc gain schedule (pmu_gain_sched)
+BATT_PERIOD_MS = const(10)        # battery regen poll; steps once per new ADC sample
+
+# ---- Regen modes (DATA.regen_mode)
+REGEN_RPM = const(0)      # hold engine rpm (pmu_pid_regen)
+REGEN_BATT = const(1)     # hold battery volts, charge-current limited (pmu_batt_regen)
+REGEN_TUNE = const(2)     # throttle step test + FOPDT fit (pmu_autotune)
+
+# ---- Throttle calibration (pmu_throttle_cal)
+THROTTLE_CAL_FILE = "/sd/throttle_cal.csv"  # measured duty -> volts LUT
+
+# ---- Crank reports (pmu_crank_report)
+CRANK_LOG_FILE = "/sd/pmu_crank.csv"  # one CSV line per crank
+
+# ---- Auto-tune (pmu_autotune)
+TUNE_FILE = "/sd/pmu_tune.bin"    # last step-test recording (tools/autotune_fit.py)
+TUNE_SETTLE_MS = const(2000)      # hold u0 before the step
+TUNE_RECORD_MS = const(4000)      # record after the step
+
+# ---- Settings file (PMUData.save_settings / load_settings)
+SETTINGS_FILE = "/sd/pmu_settings.txt"
+# key=value per line; keys not listed here are ignored on load
+SETTINGS_KEYS = (
+    ("lcd_contrast",  int),
+    ("lcd_backlight", int),
+    ("pid_setpoint",  float),
+    ("regen_rpm",     float),
+    ("pid_kp",        float),
+    ("pid_ki",        float),
+    ("pid_kd",        float),
+    ("pid_kff",       float),
+    ("pid_d_tau",     float),
+    ("pid_sp_rate",   float),
+    ("pid_sched",     int),
+    ("regen_mode",    int),
+    ("regen_i_max",   float),
+    ("vbat_kp",       float),
+    ("vbat_ki",       float),
+    ("ichg_kp",       float),
+    ("ichg_ki",       float),
+    ("tune_u0",       float),
+    ("tune_step",     float),
+)
 
 # ---- Display
 LCD_COLS = const(20)
@@ -32,6 +100,125 @@ STATE_REGEN   = const(3)
 STATE_PRECHARGE = const(4)
 UI_MODE_LCD = 99
 
+# ---- Packed snapshot layout (PMUData.snapshot_into)
+# Edit this table to change what the logger / CAN2 / UI share each tick.
+SNAP_FIELDS = (
+    ("state",          "B"),
+    ("fault_active",   "B"),
+    ("last_emcy_code", "H"),
+    ("uptime_s",       "I"),
+    ("sevcon_rpm",     "i"),
+    ("torque_act",     "f"),
+    ("dc_bus_v",       "f"),
+    ("battery_v",      "f"),
+    ("load_i",         "f"),
+    ("charge_i",       "f"),
+    ("batt_current",   "f"),
+    ("motor_temp",     "f"),
+    ("throttle_mv",    "H"),       # int: no boxed float per pack
+    ("can1_load",      "f"),
+    ("can2_load",      "f"),
+    ("can1_tec",       "B"),
+    ("can1_rec",       "B"),
+    ("can1_state",     "B"),
+    ("can2_tec",       "B"),
+    ("can2_rec",       "B"),
+    ("can2_state",     "B"),
+    ("can1_busoff",    "H"),
+    ("can2_busoff",    "H"),
+    ("mem_free",       "I"),
+    ("mem_largest",    "I"),
+    ("mem_rate",       "i"),
+    ("gc_us",          "I"),
+)
+SNAP_FMT = "<" + "".join(c for _, c in SNAP_FIELDS)
+SNAP_SIZE = struct.calcsize(SNAP_FMT)
+
+# (attribute, single-field format, byte offset) — built once at import
+_SNAP_LAYOUT = []
+_off = 0
+for _name, _c in SNAP_FIELDS:
+    _SNAP_LAYOUT.append((_name, "<" + _c, _off))
+    _off += struct.calcsize("<" + _c)
+_SNAP_LAYOUT = tuple(_SNAP_LAYOUT)
+
+# ---- Seqlock field groups (PMUData.begin_write / read_group)
+# Each group is written by one producer and read as a coherent copy.
+GRP_TPDO1 = const(0)   # pmu_can_decode, 0x181
+GRP_TPDO2 = const(1)   # pmu_can_decode, 0x281
+GRP_ADC   = const(2)   # ADCManager.task
+GROUP_FIELDS = (
+    ("velocity", "torque_act", "iq_actual", "iq_target"),
+    ("ud", "uq", "mod", "dc_bus_v"),
+    ("battery_v", "load_i", "charge_i", "spare_i"),
+)
+N_GROUPS = const(3)
+
+# ---- Per-field freshness (PMUData.touch / fresh / stale_mask)
+# Index constants, attribute names, LCD tags and max age before "stale".
+F_VELOCITY     = const(0)
+F_TORQUE_ACT   = const(1)
+F_IQ_ACTUAL    = const(2)
+F_IQ_TARGET    = const(3)
+F_UD           = const(4)
+F_UQ           = const(5)
+F_MOD          = const(6)
+F_DC_BUS_V     = const(7)
+F_BATTERY_V    = const(8)
+F_LOAD_I       = const(9)
+F_CHARGE_I     = const(10)
+F_SPARE_I      = const(11)
+F_MOTOR_TEMP   = const(12)
+F_BATT_CURRENT = const(13)
+F_CAP_V        = const(14)
+F_SEVCON_RPM   = const(15)
+F_HEARTBEAT    = const(16)
+N_FIELDS       = const(17)
+
+FRESH_FIELDS = (
+    "velocity", "torque_act", "iq_actual", "iq_target",
+    "ud", "uq", "mod", "dc_bus_v",
+    "battery_v", "load_i", "charge_i", "spare_i",
+    "motor_temp", "batt_current", "cap_v", "sevcon_rpm",
+    "gen4_online",
+)
+FIELD_TAGS = (
+    "RPM", "TQ", "IQA", "IQT",
+    "UD", "UQ", "MOD", "VDC",
+    "VBAT", "ILD", "ICH", "ISP",
+    "TMOT", "IBAT", "VCAP", "SRPM",
+    "HB",
+)
+FIELD_MAX_AGE_MS = (
+    250, 250, 250, 250,         # TPDO1
+    250, 250, 250, 250,         # TPDO2
+    200, 200, 200, 200,         # ADC (20 Hz)
+    1000, 250, 250, 250,        # TPDO3 / TPDO5
+    300,                        # heartbeat
+)
+
+# Group → field indices, stamped by end_write()
+GROUP_FIELD_IDX = (
+    (F_VELOCITY, F_TORQUE_ACT, F_IQ_ACTUAL, F_IQ_TARGET),
+    (F_UD, F_UQ, F_MOD, F_DC_BUS_V),
+    (F_BATTERY_V, F_LOAD_I, F_CHARGE_I, F_SPARE_I),
+)
+
+_NEVER_MS = const(0x3FFFFFFF)   # age reported for never-updated fields
+_RAISE = object()
+
+
+class StaleError(OSError):
+    """Raised by PMUData.fresh() when a field is older than allowed."""
+    pass
+
+def snap_offset(name):
+    """Byte offset of a field inside a packed snapshot."""
+    for n, _, off in _SNAP_LAYOUT:
+        if n == name:
+            return off
+    raise KeyError(name)
+
 
 # ======================================================
 # Shared data structure (used across whole PMU system)
@@ -48,6 +235,7 @@ class PMUData:
         # Power
         "dc_bus_v", "battery_v", "battery_i",
         "gen_torque_nm", "gen_power_w", "batt_nominal_v",
+        "precharge_done", "precharge_fault", "precharge_tau_ms",
 
         # Inverter TPDO data
         "id_target", "iq_target",
@@ -56,14 +244,24 @@ class PMUData:
         "ud", "uq", "mod", "cap_v",
 
         "motor_temp", "batt_current", "load_i", "charge_i", "spare_i",
+        "battery_v_f", "charge_i_f",
         "torque_cmd", "torque_act",
         "sevcon_rpm", "regen_pct",
+        "throttle_mv",       # written by the throttle timer IRQ (int)
 
         "vel_max", "velocity",
 
         # Inverter status flags
         "fault_active", "last_emcy_code",
 
+        # CAN bus health (pmu_busmon): load %, error counters,
+        # pyb.CAN.state(), bus-off events since boot
+        "can1_load", "can1_tec", "can1_rec", "can1_state", "can1_busoff",
+        "can2_load", "can2_tec", "can2_rec", "can2_state", "can2_busoff",
+
+        # Heap (pmu_memmon): bytes, largest free block, B/s, last gc µs
+        "mem_free", "mem_alloc", "mem_largest", "mem_rate", "gc_us",
+
         # ---- NEW FIELDS REQUIRED BY CAN DECODER ----
         "sync_seen",         # Sync frame seen?
         "gen4_online",       # Heartbeat present?
@@ -92,9 +290,29 @@ class PMUData:
         
         #PID Setpoint
         "pid_setpoint",
+
+        #PID regen (rpm) gains — per second units, see pmu_pid
+        "regen_rpm", "pid_kp", "pid_ki", "pid_kd",
+        "pid_kff", "pid_d_tau", "pid_sp_rate", "pid_sched",
+
+        #Battery regen (cascaded volts -> charge amps -> throttle)
+        "regen_mode", "regen_i_max",
+        "vbat_kp", "vbat_ki", "ichg_kp", "ichg_ki",
+
+        #Auto-tune step test
+        "tune_u0", "tune_step",
         
         #MISC
         "regen_abort",
+
+        # Shared packed snapshot
+        "snap_buf", "snap_ms",
+
+        # Seqlock per field group: generation counter + publish time
+        "grp_seq", "grp_ms",
+
+        # Per-field update time + "ever updated" bitmask + supervisor result
+        "field_ms", "field_seen", "stale_mask",
     )
 
     # ---------------------------------------------------
@@ -115,10 +333,15 @@ class PMUData:
         self.load_i = 0
         self.charge_i =0
         self.spare_i = 0
+        self.battery_v_f = 0.0    # EMA-filtered by ADCManager
+        self.charge_i_f = 0.0
         self.gen_torque_nm = 0
         self.gen_power_w = 0
         self.regen_pct = 0
         self.batt_nominal_v = 56
+        self.precharge_done = False
+        self.precharge_fault = 0      # PF_* bits, pmu_precharge
+        self.precharge_tau_ms = -1    # last fitted precharge time constant
 
         # TPDO fields
         self.id_target = 0
@@ -139,11 +362,31 @@ class PMUData:
         self.vel_max = 0
         self.velocity = 0
         self.sevcon_rpm = 0
+        self.throttle_mv = 0
 
         # Errors
         self.fault_active = 0
         self.last_emcy_code = 0
 
+        # CAN bus health
+        self.can1_load = 0.0
+        self.can1_tec = 0
+        self.can1_rec = 0
+        self.can1_state = 0
+        self.can1_busoff = 0
+        self.can2_load = 0.0
+        self.can2_tec = 0
+        self.can2_rec = 0
+        self.can2_state = 0
+        self.can2_busoff = 0
+
+        # Heap
+        self.mem_free = 0
+        self.mem_alloc = 0
+        self.mem_largest = 0
+        self.mem_rate = 0
+        self.gc_us = 0
+
         # ---- NEW ----
         self.sync_seen = False
         self.gen4_online = False
@@ -172,10 +415,50 @@ class PMUData:
         
         #PID Setpoint
         self.pid_setpoint = 48.0  # default PID target voltage
+
+        #PID regen (rpm)
+        self.regen_rpm = 2500.0   # target engine rpm
+        self.pid_kp = 0.012       # V per rpm
+        self.pid_ki = 0.0         # V per rpm·s
+        self.pid_kd = 0.0         # V per rpm/s
+        self.pid_kff = 0.0        # V per rpm of target (feed-forward)
+        self.pid_d_tau = 0.05     # derivative filter (s)
+        self.pid_sp_rate = 500.0  # setpoint ramp (rpm/s), 0 = step
+        self.pid_sched = 1        # use GAIN_FILE table when present
+
+        #Battery regen — target volts is pid_setpoint
+        self.regen_mode = REGEN_RPM
+        self.regen_i_max = 40.0   # charge current limit (A)
+        self.vbat_kp = 5.0        # A per V
+        self.vbat_ki = 2.0        # A per V·s
+        self.ichg_kp = 0.01       # throttle V per A
+        self.ichg_ki = 0.05       # throttle V per A·s
+
+        #Auto-tune: throttle operating point and step (V)
+        self.tune_u0 = 5.0
+        self.tune_step = 0.5
         
         #MISC
         self.regen_abort = False
 
+        # Shared packed snapshot
+        self.snap_buf = bytearray(SNAP_SIZE)
+        self.snap_ms = -1            # never packed
+
+        # Seqlock per field group (odd seq = write in progress)
+        self.grp_seq = array("H", bytes(2 * N_GROUPS))
+        self.grp_ms = array("i", bytes(4 * N_GROUPS))
+
+        # Per-field freshness
+        self.field_ms = array("i", bytes(4 * N_FIELDS))
+        self.field_seen = 0
+        self.stale_mask = (1 << N_FIELDS) - 1   # nothing seen yet
+
+
+    @property
+    def throttle_v(self):
+        """Throttle output in volts (telemetry / autotune); allocates."""
+        return self.throttle_mv / 1000
 
     def snapshot(self):
         return (
@@ -188,23 +471,152 @@ class PMUData:
             self.fault_active, self.last_emcy_code
         )
 
+    # ---------------------------------------------------
+    # Seqlock groups
+    # ---------------------------------------------------
+    def begin_write(self, grp):
+        """Producer: call before updating a group's fields."""
+        self.grp_seq[grp] = (self.grp_seq[grp] + 1) & 0xFFFF
+
+    def end_write(self, grp, t_ms):
+        """Producer: call after updating; t_ms is the publish time."""
+        self.grp_ms[grp] = t_ms
+        for f in GROUP_FIELD_IDX[grp]:
+            self.field_ms[f] = t_ms
+            self.field_seen |= 1 << f
+        self.grp_seq[grp] = (self.grp_seq[grp] + 1) & 0xFFFF
+
+    # ---------------------------------------------------
+    # Per-field freshness
+    # ---------------------------------------------------
+    def touch(self, f, t_ms):
+        """Producer: mark field f (F_* index) updated at t_ms."""
+        self.field_ms[f] = t_ms
+        self.field_seen |= 1 << f
+
+    def field_age_ms(self, f, now=None):
+        if not self.field_seen & (1 << f):
+            return _NEVER_MS
+        if now is None:
+            now = time.ticks_ms()
+        return time.ticks_diff(now, self.field_ms[f])
+
+    def fresh(self, f, max_age_ms=None, default=_RAISE):
+        """
+        Value of field f if updated within max_age_ms (default: its
+        FIELD_MAX_AGE_MS). Otherwise returns default, or raises StaleError
+        when no default is given.
+        """
+        if max_age_ms is None:
+            max_age_ms = FIELD_MAX_AGE_MS[f]
+        age = self.field_age_ms(f)
+        if age <= max_age_ms:
+            return getattr(self, FRESH_FIELDS[f])
+        if default is _RAISE:
+            if age == _NEVER_MS:
+                raise StaleError("%s never updated" % FRESH_FIELDS[f])
+            raise StaleError("%s stale: %d ms" % (FRESH_FIELDS[f], age))
+        return default
+
+    def update_stale_mask(self):
+        """Recompute stale_mask (bit i set = FRESH_FIELDS[i] is stale)."""
+        now = time.ticks_ms()
+        m = 0
+        for f in range(N_FIELDS):
+            if self.field_age_ms(f, now) > FIELD_MAX_AGE_MS[f]:
+                m |= 1 << f
+        self.stale_mask = m
+        return m
+
+    def read_group(self, grp, out, retries=4):
+        """
+        Copy a group's fields (GROUP_FIELDS order) into out, e.g. array('f', 4).
+        Never blocks: returns the group's age in ms, or -1 if no coherent
+        copy was obtained (a reader that preempted its writer, e.g. in a
+        timer callback) — keep using the previous copy in that case.
+        """
+        names = GROUP_FIELDS[grp]
+        seq = self.grp_seq
+        for _ in range(retries):
+            s0 = seq[grp]
+            if s0 & 1:
+                continue
+            for i in range(len(names)):
+                out[i] = getattr(self, names[i])
+            if seq[grp] == s0:
+                return time.ticks_diff(time.ticks_ms(), self.grp_ms[grp])
+        return -1
+
+    def group_age_ms(self, grp):
+        """Milliseconds since the group was last published."""
+        return time.ticks_diff(time.ticks_ms(), self.grp_ms[grp])
+
+    def snapshot_into(self, buf, offset=0, retries=4):
+        """
+        Pack SNAP_FIELDS into buf at offset without allocating.
+        Re-packs if any seqlock group was written meanwhile, so e.g.
+        dc_bus_v and battery_v come from complete updates.
+        Returns buf. Decode with struct.unpack_from(SNAP_FMT, buf, offset).
+        """
+        pack_into = struct.pack_into
+        seq = self.grp_seq
+        for _ in range(retries):
+            s0 = seq[0]; s1 = seq[1]; s2 = seq[2]
+            for name, fmt, off in _SNAP_LAYOUT:
+                pack_into(fmt, buf, offset + off, getattr(self, name))
+            if (not (s0 | s1 | s2) & 1 and
+                    s0 == seq[0] and s1 == seq[1] and s2 == seq[2]):
+                break
+        return buf
+
+    def shared_snapshot(self, max_age_ms=100):
+        """
+        One packed snapshot shared by all consumers in the same tick.
+        Re-packed only when older than max_age_ms.
+        """
+        now = time.ticks_ms()
+        if self.snap_ms < 0 or time.ticks_diff(now, self.snap_ms) >= max_age_ms:
+            self.snapshot_into(self.snap_buf)
+            self.snap_ms = now
+        return self.snap_buf
+
     def save_settings(self):
         try:
-            with open("/sd/pmu_settings.txt", "w") as f:
-                f.write(f"{self.lcd_contrast},{self.lcd_backlight},{self.pid_setpoint}\n")
+            with open(SETTINGS_FILE, "w") as f:
+                for key, _ in SETTINGS_KEYS:
+                    f.write("%s=%s\n" % (key, getattr(self, key)))
         except Exception as e:
             print("Save settings error:", e)
 
 
     def load_settings(self):
         try:
-            with open("/sd/pmu_settings.txt") as f:
-                c, b, p = f.read().strip().split(",")
+            with open(SETTINGS_FILE) as f:
+                text = f.read().strip()
+        except OSError:
+            return
+
+        types = dict(SETTINGS_KEYS)
+        if "=" not in text:
+            # Legacy single line: contrast,backlight,setpoint
+            try:
+                c, b, p = text.split(",")
                 self.lcd_contrast  = int(c)
                 self.lcd_backlight = int(b)
                 self.pid_setpoint  = float(p)   # <-- FIXED
-        except:
-            pass
+            except ValueError:
+                pass
+            return
+
+        for line in text.split("\n"):
+            key, _, val = line.strip().partition("=")
+            typ = types.get(key)
+            if typ is None:
+                continue
+            try:
+                setattr(self, key, typ(val))
+            except ValueError:
+                print("Settings: bad value for", key)
 
 
 # Global instance
@@ -1,13 +1,16 @@
 from gen4_helpers_async import *
 import uasyncio as asyncio
 import time
-from pmu_preactor_standalone import run_precharge
+from pmu_precharge import PRECHARGE
 from gen4_helpers_async import sdo_read_u8, sdo_read_u16
-
-LOG_T0 = time.ticks_ms()
-def log(msg):
-    t = time.ticks_diff(time.ticks_ms(), LOG_T0)
-    print(f"[{t:08d} ms] {msg}")
+from pmu_trace import emit
+from pmu_trace_events import (
+    EV_CRANK_START, EV_CRANK_PRECHARGE, EV_CRANK_PCHG_DONE,
+    EV_NMT_RESET, EV_NMT_START, EV_NMT_OK, EV_NMT_FAIL,
+    EV_TQ_CFG_START, EV_TQ_CFG_OPEN, EV_TQ_CFG_DONE, EV_TQ_CFG_FAIL,
+    EV_CRANK_RAMP, EV_CRANK_HOLD, EV_CRANK_TIMEOUT, EV_CRANK_STARTED,
+    EV_CRANK_DONE,
+)
 
 CRANK_CFG = {
     "node_id": 1,
@@ -31,21 +34,21 @@ def get_dc_bus(DATA, can):
 async def nmt_start(can, node_id=1):
     try:
         can._can.send(bytes([0x81, node_id]), 0x000)
-        log("NMT Reset-Node sent")
+        emit(EV_NMT_RESET, node_id)
         await asyncio.sleep_ms(150)
 
         can._can.send(bytes([0x01, node_id]), 0x000)
-        log("NMT Start-Node sent")
+        emit(EV_NMT_START, node_id)
         await asyncio.sleep_ms(50)
 
-        log("NMT OK")
+        emit(EV_NMT_OK, node_id)
         return True
     except Exception as e:
-        log(f"NMT FAIL: {e}")
+        emit(EV_NMT_FAIL, node_id)
         return False
 
-async def configure_torque_mode(can, node_id, logger=log):
-    logger("CONFIG: torque mode")
+async def configure_torque_mode(can, node_id):
+    emit(EV_TQ_CFG_START, node_id)
 
     await can.sdo_write_u16(node_id, 0x6040, 0, 0x0080)
     await asyncio.sleep_ms(40)
@@ -71,7 +74,7 @@ async def configure_torque_mode(can, node_id, logger=log):
         try:
             sw = await can.sdo_read_u16(node_id, 0x6041, 0)
             if (sw & 0x004F) == 0x004F:
-                logger("CONFIG: OpEnabled")
+                emit(EV_TQ_CFG_OPEN, sw)
                 break
         except:
             pass
@@ -79,7 +82,7 @@ async def configure_torque_mode(can, node_id, logger=log):
 
     await can.sdo_write_u16(node_id, 0x6080, 0, 500)
     await asyncio.sleep_ms(40)
-    logger("CONFIG DONE")
+    emit(EV_TQ_CFG_DONE)
 
     return True
 
@@ -90,24 +93,24 @@ async def crank_main(can, DATA):
     cfg = CRANK_CFG
     node_id = cfg["node_id"]
 
-    log("CRANK: sequence starting…")
-    log("CRANK: calling precharge…")
+    emit(EV_CRANK_START)
+    emit(EV_CRANK_PRECHARGE)
 
-    # PRECHARGE EXACTLY ONCE
-    await run_precharge(DATA, can)
+    # PRECHARGE EXACTLY ONCE (shared with the FSM / regen callers)
+    if not await PRECHARGE.ensure():
+        return
 
     DATA.dc_bus_v = get_dc_bus(DATA, can)
 
-    log("CRANK: precharge complete")
-    log(f"CRANK: Vdc post-precharge = {DATA.dc_bus_v}")
+    emit(EV_CRANK_PCHG_DONE, int(DATA.dc_bus_v * 10))
 
     # NMT RESET/START
     await nmt_start(can, node_id)
     await asyncio.sleep_ms(1500)
 
-    ok = await configure_torque_mode(can, node_id, log)
+    ok = await configure_torque_mode(can, node_id)
     if not ok:
-        log("CRANK: torque-mode config FAILED")
+        emit(EV_TQ_CFG_FAIL)
         return
 
     # Final op-enabled check
@@ -120,9 +123,9 @@ async def crank_main(can, DATA):
         except: pass
         await asyncio.sleep_ms(50)
 
-    log(f"CRANK: ramping to {cfg['target_nm']} Nm")
-
     target = cfg["target_nm"]
+    emit(EV_CRANK_RAMP, int(target * 10), cfg["ramp_steps"])
+
     step_nm = target / cfg["ramp_steps"]
 
     # Zero torque
@@ -137,7 +140,7 @@ async def crank_main(can, DATA):
         DATA.torque_cmd = nm
         await asyncio.sleep_ms(cfg["step_ms"])
 
-    log("CRANK: holding torque…")
+    emit(EV_CRANK_HOLD, int(target * 10))
     start = time.ticks_ms()
 
     while True:
@@ -147,11 +150,11 @@ async def crank_main(can, DATA):
         DATA.torque_cmd = target
 
         if elapsed >= cfg["max_crank_ms"]:
-            log("CRANK: timeout")
+            emit(EV_CRANK_TIMEOUT, elapsed, DATA.velocity)
             break
 
         if DATA.velocity >= cfg["start_rpm"]:
-            log(f"CRANK: start detected at {DATA.velocity} rpm")
+            emit(EV_CRANK_STARTED, DATA.velocity, elapsed)
             break
 
         await asyncio.sleep_ms(cfg["sync_period_ms"])
@@ -159,7 +162,7 @@ async def crank_main(can, DATA):
     # Torque off
     await can.sdo_write_u16(node_id, 0x6071, 0, 0)
     DATA.torque_cmd = 0
-    log("CRANK: torque zero; sequence done.")
+    emit(EV_CRANK_DONE)
 
 async def run(can, DATA):
     return await crank_main(can, DATA)
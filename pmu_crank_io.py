@@ -1,9 +1,52 @@
-# pmu_crank_io.py — fully patched for async_can_dual.py
+# pmu_crank_io.py — IO-throttle crank sequence as an explicit state machine
+# -------------------------------------------------------------------------
+# Each state is a coroutine that waits on CAN-layer events
+# (pmu_can_events) with a timeout and returns the next state:
+#
+#   WAIT_HB    first Gen4 heartbeat           (replaces the 1.5 s boot sleep)
+#   WAIT_OP    heartbeat in NMT Operational
+#   WAIT_PDO   first TPDO2 (optional at standstill)
+#   NEUTRAL    throttle at neutral, RC settle
+#   RUN_EN     Y2 RUN high, Sevcon enable settle
+#   RAMP       adaptive ramp (or fixed profile); rpm checked on every TPDO5,
+#              GC held off (pmu_memmon) for the duration
+#   SHUTDOWN   throttle neutral, RUN low
+#   DONE
+#
+# Every transition is timestamped (ms from sequence start); each run
+# fills a pmu_crank_report record (phase times, rpm per ramp step, peak
+# currents, outcome) that run() saves, shows and publishes on CAN2, also
+# when the sequence is cancelled (outcome ABORT). run(resume=True)
+# continues from the interrupted state; states after RUN_EN restart from
+# NEUTRAL so the enable/ramp preconditions are re-established.
+#
+# Adaptive ramp: on every TPDO5 the rpm acceleration is estimated
+# (EMA of d(rpm)/dt) and the throttle is raised at v_up_per_s only while
+# it is below accel_target, so torque stops climbing once the engine is
+# accelerating. If the filtered battery voltage sags below vbat_floor the
+# throttle backs off at v_down_per_s instead. adaptive=False plays the
+# fixed linear profile.
 import uasyncio as asyncio
-from time import ticks_ms, ticks_diff
-from pmu_config import DATA
-from pmu_throttle import set_throttle_voltage
+from array import array
+from micropython import const
+from time import ticks_ms, ticks_diff, ticks_add
+from pmu_config import DATA, F_SEVCON_RPM, F_BATTERY_V
+from pmu_throttle import (
+    set_throttle_voltage, set_throttle_voltage_now, play_profile, stop_profile,
+    profile_active, throttle_output, throttle_at,
+)
+import pmu_can_events as cev
+from pmu_can_events import CE_HB, CE_HB_OP, CE_TPDO2, CE_TPDO5
 from machine import Pin
+from pmu_trace import emit
+from pmu_trace_events import (
+    EV_CRANKIO_STEP, EV_CRANKIO_STARTED, EV_CRANKIO_STATE, EV_CRANKIO_TIMEOUT,
+    EV_CRANKIO_REPORT, EV_CRANKIO_SAG,
+)
+import pmu_crank_report
+from pmu_crank_report import HISTORY
+from customer_can import send_crank_report
+from pmu_memmon import MEMMON
 
 
 # Y2 RUN pin (FS1 + FWD low)
@@ -17,141 +60,330 @@ CRANK_CFG = {
     "ramp_steps": 20,
     "ramp_delay_ms": 100,
     "rpm_start": 1500,
-    "tpdo_wait_ms": 300,
-    "tpdo_retries": 3,
+    "adaptive": True,
+    "accel_target": 3000.0,     # rpm/s; hold throttle while above
+    "accel_alpha": 0.3,         # EMA weight of each new d(rpm)/dt
+    "v_up_per_s": 4.0,          # throttle rise while under-accelerating
+    "v_down_per_s": 8.0,        # throttle back-off while the battery sags
+    "vbat_floor": 42.0,         # battery_v_f floor during the ramp
+    "crank_max_ms": 2500,       # adaptive ramp gives up after this
+    "ramp_margin_ms": 500,      # fixed profile overrun before it is stopped
+    "hb_timeout_ms": 4500,      # Gen4 boot + first heartbeat
+    "op_timeout_ms": 3000,
+    "pdo_timeout_ms": 1000,
+    "neutral_settle_ms": 50,    # throttle RC filter settle
+    "run_settle_ms": 150,       # Sevcon FS1/FWD debounce
+    "recent_ms": 1000,          # events this recent satisfy a wait at once
 }
 
-
-async def run(DATA, can, lcd=None):
-
-    print("CRANK(IO): sequence starting...")
-    print("CRANK(IO): allowing Gen4 to boot (1.5s)...")
-    await asyncio.sleep_ms(1500)
-
-    # ------------------------------------------------------------------
-    print("CRANK(IO): waiting for GEN4 PDO/heartbeat...")
-    timeout = 3000
-    start = ticks_ms()
-
-    while True:
-        if DATA.gen4_last_hb_ms != 0:
-            print("CRANK(IO): GEN4 heartbeat detected.")
-            break
-        if ticks_diff(ticks_ms(), start) > timeout:
-            print("CRANK(IO): WARNING - no GEN4 frames detected before crank!")
-            break
-        await asyncio.sleep_ms(10)
-
-    # ------------------------------------------------------------------
-    print("CRANK(IO): clearing CAN1 RX buffers...")
-    try:
-        while can.hwcan.any(0):
-            can.hwcan.recv(0)
-        while can.hwcan.any(1):
-            can.hwcan.recv(1)
-    except Exception as e:
-        print("CRANK(IO): buffer clear skipped:", e)
-
-    await asyncio.sleep_ms(20)
+# States
+CS_WAIT_HB = const(0)
+CS_WAIT_OP = const(1)
+CS_WAIT_PDO = const(2)
+CS_NEUTRAL = const(3)
+CS_RUN_EN = const(4)
+CS_RAMP = const(5)
+CS_SHUTDOWN = const(6)
+CS_DONE = const(7)
+STATE_NAMES = ("WAIT_HB", "WAIT_OP", "WAIT_PDO", "NEUTRAL",
+               "RUN_EN", "RAMP", "SHUTDOWN", "DONE")
+
+# Outcomes
+OUT_NONE = const(0)
+OUT_STARTED = const(1)
+OUT_NO_START = const(2)
+OUT_ABORTED = const(3)
+OUTCOME_NAMES = ("-", "STARTED", "NO_START", "ABORTED")
+
+MAX_TRANSITIONS = const(16)
+
+# Crank ramp profile: (target_v, duration_ms) pairs, filled in RAMP
+_ramp = array("f", bytes(4 * 4))
+
+
+class CrankIO:
+
+    def __init__(self):
+        self.state = CS_DONE
+        self.outcome = OUT_NONE
+        self.t0 = 0
+        self.n_tr = 0
+        self.tr_state = bytearray(MAX_TRANSITIONS)
+        self.tr_ms = array("i", bytes(4 * MAX_TRANSITIONS))
+        self.timeouts = 0           # bit per state that timed out
+        self.start_ms = -1          # start detected, ms from sequence start
+        self.ramp_ms = -1
+        self._handlers = (
+            self._wait_hb, self._wait_op, self._wait_pdo, self._neutral,
+            self._run_en, self._ramp, self._shutdown,
+        )
 
     # ------------------------------------------------------------------
-    print("CRANK(IO): waiting for Sevcon to enter OP state...")
-    timeout = 3000
-    start = ticks_ms()
-
-    while True:
-        if DATA.gen4_last_hb_ms != 0:
-            print("CRANK(IO): GEN4 OP heartbeat seen.")
-            break
-        if ticks_diff(ticks_ms(), start) > timeout:
-            print("CRANK(IO): WARNING - no heartbeat during OP wait.")
-            break
-        await asyncio.sleep_ms(10)
+    def _elapsed(self):
+        return ticks_diff(ticks_ms(), self.t0)
+
+    def _enter(self, st):
+        t = self._elapsed()
+        if self.n_tr < MAX_TRANSITIONS:
+            self.tr_state[self.n_tr] = st
+            self.tr_ms[self.n_tr] = t
+            self.n_tr += 1
+        emit(EV_CRANKIO_STATE, self.state, st, t)
+        self.state = st
+
+    def _timed_out(self, ms):
+        self.timeouts |= 1 << self.state
+        emit(EV_CRANKIO_TIMEOUT, self.state, ms)
+
+    async def _await(self, ev, timeout_ms):
+        """Event wait that records a timeout against the current state."""
+        if cev.seen_within(ev, CRANK_CFG["recent_ms"]):
+            cev.clear(ev)
+            return True
+        cev.clear(ev)
+        if await cev.wait(ev, timeout_ms):
+            return True
+        self._timed_out(timeout_ms)
+        return False
+
+    def phase_ms(self, st):
+        """ms from sequence start to entering st, or -1."""
+        for i in range(self.n_tr):
+            if self.tr_state[i] == st:
+                return self.tr_ms[i]
+        return -1
 
     # ------------------------------------------------------------------
-    print("CRANK(IO): waiting for PDOs to begin...")
-    timeout = 2000
-    start = ticks_ms()
-    initial = DATA.gen4_last_pdo_ms
-
-    while True:
-        if DATA.gen4_last_pdo_ms != initial:
-            print("CRANK(IO): first PDO received.")
-            break
-        if ticks_diff(ticks_ms(), start) > timeout:
-            print("⚠ CRANK(IO): No PDOs yet - continuing anyway.")
-            break
-        await asyncio.sleep_ms(10)
-
+    # States
     # ------------------------------------------------------------------
-    print("CRANK(IO): TPDO2 optional check...")
-    cfg = CRANK_CFG
-    got_tpdo2 = False
-
-    for i in range(cfg["tpdo_retries"]):
-        print(f"  waiting for TPDO2... ({i+1}/{cfg['tpdo_retries']})")
-
-        start = ticks_ms()
-        initial = DATA.gen4_last_pdo_ms
-
-        while True:
-            if DATA.gen4_last_pdo_ms != initial:
-                got_tpdo2 = True
-                print("  TPDO2 detected.")
-                break
-
-            if ticks_diff(ticks_ms(), start) > cfg["tpdo_wait_ms"]:
+    async def _wait_hb(self):
+        if not await self._await(CE_HB, CRANK_CFG["hb_timeout_ms"]):
+            print("CRANK(IO): WARNING - no GEN4 heartbeat before crank!")
+        return CS_WAIT_OP
+
+    async def _wait_op(self):
+        if not await self._await(CE_HB_OP, CRANK_CFG["op_timeout_ms"]):
+            print("CRANK(IO): WARNING - Gen4 not reporting OPERATIONAL.")
+        return CS_WAIT_PDO
+
+    async def _wait_pdo(self):
+        if not await self._await(CE_TPDO2, CRANK_CFG["pdo_timeout_ms"]):
+            print("CRANK(IO): TPDO2 not received - normal at standstill.")
+        return CS_NEUTRAL
+
+    async def _neutral(self):
+        cfg = CRANK_CFG
+        await set_throttle_voltage(cfg["neutral_v"])
+        await _until_output(cfg["neutral_v"], 500)
+        await asyncio.sleep_ms(cfg["neutral_settle_ms"])
+        return CS_RUN_EN
+
+    async def _run_en(self):
+        PIN_RUN.high()
+        await asyncio.sleep_ms(CRANK_CFG["run_settle_ms"])
+        return CS_RAMP
+
+    async def _ramp(self):
+        with MEMMON.critical():         # no GC pause mid ramp
+            if CRANK_CFG["adaptive"]:
+                return await self._ramp_adaptive()
+            return await self._ramp_profile()
+
+    async def _ramp_adaptive(self):
+        cfg = CRANK_CFG
+        delay = cfg["ramp_delay_ms"]
+        v_lo = cfg["crank_v_start"]
+        v_hi = cfg["crank_v_max"]
+        up = cfg["v_up_per_s"]
+        down = cfg["v_down_per_s"]
+        a_tgt = cfg["accel_target"]
+        alpha = cfg["accel_alpha"]
+        floor = cfg["vbat_floor"]
+
+        v = v_lo
+        set_throttle_voltage_now(v)
+
+        i = 0
+        accel = 0.0
+        sag = False
+        t_ramp = self._elapsed()
+        t_prev = ticks_ms()
+        rpm_prev = DATA.fresh(F_SEVCON_RPM, 200, 0)
+        next_step = t_prev
+        end = ticks_add(t_prev, cfg["crank_max_ms"])
+        while ticks_diff(end, ticks_ms()) > 0:
+            await cev.wait(CE_TPDO5, delay)
+            now = ticks_ms()
+            dt = ticks_diff(now, t_prev) / 1000
+            if dt <= 0:
+                continue
+            t_prev = now
+            rpm = DATA.fresh(F_SEVCON_RPM, 200, 0)
+            accel += ((rpm - rpm_prev) / dt - accel) * alpha
+            rpm_prev = rpm
+            HISTORY.sample(abs(DATA.load_i), abs(DATA.batt_current))
+
+            # Battery floor first; a stale ADC gives no sag information
+            vb_fresh = DATA.fresh(F_BATTERY_V, 250, None) is not None
+            vb = DATA.battery_v_f
+            if vb_fresh and vb < floor:
+                if not sag:
+                    emit(EV_CRANKIO_SAG, int(vb * 1000), int(v * 1000))
+                sag = True
+                v = max(v_lo, v - down * dt)
+            else:
+                sag = False
+                if accel < a_tgt:
+                    v = min(v_hi, v + up * dt)
+            set_throttle_voltage_now(v)
+
+            if ticks_diff(now, next_step) >= 0:
+                emit(EV_CRANKIO_STEP, i, int(v * 1000), rpm)
+                HISTORY.step(rpm)
+                i += 1
+                next_step = ticks_add(next_step, delay)
+
+            if rpm >= cfg["rpm_start"]:
+                self.start_ms = self._elapsed()
+                self.ramp_ms = self.start_ms - t_ramp
+                emit(EV_CRANKIO_STARTED, rpm)
+                self.outcome = OUT_STARTED
+                return CS_SHUTDOWN
+
+        self.ramp_ms = self._elapsed() - t_ramp
+        self.outcome = OUT_NO_START
+        return CS_SHUTDOWN
+
+    async def _ramp_profile(self):
+        # Jump to v0, hold one ramp step, then a linear ramp to v1 over
+        # ramp_steps * ramp_delay_ms, played by the throttle timer. rpm is
+        # checked on every TPDO5; steps are traced at ramp_delay_ms.
+        cfg = CRANK_CFG
+        delay = cfg["ramp_delay_ms"]
+        _ramp[0] = cfg["crank_v_start"]
+        _ramp[1] = delay
+        _ramp[2] = cfg["crank_v_max"]
+        _ramp[3] = cfg["ramp_steps"] * delay
+
+        set_throttle_voltage_now(cfg["crank_v_start"])
+        play_profile(_ramp, 2)
+
+        i = 0
+        t_ramp = self._elapsed()
+        next_step = ticks_ms()
+        # The timer ends the profile; bound the wait in case it never does
+        limit = _ramp[1] + _ramp[3] + cfg["ramp_margin_ms"]
+        while profile_active():
+            if t_ramp + limit - self._elapsed() < 0:
+                stop_profile()
+                self._timed_out(limit)
                 break
-
-            await asyncio.sleep_ms(5)
-
-        if got_tpdo2:
-            break
-
-    if not got_tpdo2:
-        print("⚠ CRANK(IO): TPDO2 not received - normal at standstill.")
-
-    # ------------------------------------------------------------------
-    print("CRANK(IO): throttle = neutral (4.0 V)")
-    await set_throttle_voltage(cfg["neutral_v"])
-    await asyncio.sleep_ms(400)
+            await cev.wait(CE_TPDO5, delay)
+            rpm = DATA.fresh(F_SEVCON_RPM, 200, 0)
+            HISTORY.sample(abs(DATA.load_i), abs(DATA.batt_current))
+
+            now = ticks_ms()
+            if ticks_diff(now, next_step) >= 0:
+                emit(EV_CRANKIO_STEP, i, int(throttle_output() * 1000), rpm)
+                HISTORY.step(rpm)
+                i += 1
+                next_step = ticks_add(next_step, delay)
+
+            if rpm >= cfg["rpm_start"]:
+                stop_profile()
+                self.start_ms = self._elapsed()
+                self.ramp_ms = self.start_ms - t_ramp
+                emit(EV_CRANKIO_STARTED, rpm)
+                self.outcome = OUT_STARTED
+                return CS_SHUTDOWN
+
+        self.ramp_ms = self._elapsed() - t_ramp
+        self.outcome = OUT_NO_START
+        return CS_SHUTDOWN
+
+    async def _shutdown(self):
+        await _safe_off()
+        return CS_DONE
 
     # ------------------------------------------------------------------
-    print("CRANK(IO): RUN ENABLED (Y2 high → Sevcon FS1+FWD low)")
-    PIN_RUN.high()
-    await asyncio.sleep_ms(150)
-
-    # ------------------------------------------------------------------
-    print("CRANK(IO): ramping throttle to crank voltage...")
-
-    v0 = cfg["crank_v_start"]
-    v1 = cfg["crank_v_max"]
-    steps = cfg["ramp_steps"]
-    dv = (v1 - v0) / max(1, steps)
-
-    await set_throttle_voltage(v0)
-    await asyncio.sleep_ms(cfg["ramp_delay_ms"])
-
-    for i in range(steps):
-        v = v0 + dv * i
-        await set_throttle_voltage(v)
-
-        # <-- FIX: consistently use DATA.sevcon_rpm
-        rpm = getattr(DATA, "sevcon_rpm", 0)
-
-        print("  throttle = %.2f V   rpm=%d" % (v, rpm))
+    async def run(self, resume=False):
+        if resume and self.state < CS_DONE:
+            if self.state > CS_RUN_EN:
+                self.state = CS_NEUTRAL
+            print("CRANK(IO): resuming at", STATE_NAMES[self.state])
+            self._enter(self.state)
+        else:
+            self.t0 = ticks_ms()
+            self.n_tr = 0
+            self.timeouts = 0
+            self.outcome = OUT_NONE
+            self.start_ms = -1
+            self.state = CS_WAIT_HB
+            self._enter(CS_WAIT_HB)
+        self.ramp_ms = -1
+        HISTORY.begin()
+
+        try:
+            while self.state < CS_DONE:
+                self._enter(await self._handlers[self.state]())
+        finally:
+            # Cancelled or failed before DONE: SHUTDOWN has not run (or
+            # did not finish), so drop the throttle and RUN here
+            if self.state < CS_DONE:
+                self.outcome = OUT_ABORTED
+                await _safe_off()
+            self._finish_report()
+        return self.outcome
+
+    def _finish_report(self):
+        r = HISTORY.finish(
+            self.phase_ms(CS_WAIT_OP), self.phase_ms(CS_NEUTRAL),
+            self.ramp_ms, self.start_ms, self.outcome, self.timeouts)
+        emit(EV_CRANKIO_REPORT, r.seq, r.outcome, r.start_ms,
+             int(max(r.ipk_load, r.ipk_batt)))
+        return r
+
+    def report(self):
+        print("CRANK(IO): outcome %s" % OUTCOME_NAMES[self.outcome])
+        for i in range(self.n_tr):
+            st = self.tr_state[i]
+            print("  +%5d ms  %-8s%s" % (self.tr_ms[i], STATE_NAMES[st],
+                  " (timeout)" if self.timeouts & (1 << st) else ""))
+
+
+async def _until_output(volts, timeout_ms):
+    """Wait for the slew-limited throttle output to reach volts."""
+    t = ticks_ms()
+    while not throttle_at(volts) and ticks_diff(ticks_ms(), t) < timeout_ms:
+        await asyncio.sleep_ms(5)
+
+
+async def _safe_off():
+    try:
+        await set_throttle_voltage(CRANK_CFG["neutral_v"])
+        await _until_output(CRANK_CFG["neutral_v"], 500)
+    finally:
+        PIN_RUN.low()
 
-        if rpm >= cfg["rpm_start"]:
-            print("CRANK(IO): engine start detected!")
-            break
 
-        await asyncio.sleep_ms(cfg["ramp_delay_ms"])
+# Global instance
+CRANK = CrankIO()
 
-    # ------------------------------------------------------------------
-    print("CRANK(IO): returning throttle to neutral")
-    await set_throttle_voltage(cfg["neutral_v"])
-    await asyncio.sleep_ms(200)
 
-    PIN_RUN.low()
+async def run(DATA, can, lcd=None, resume=False):
+    print("CRANK(IO): sequence starting...")
+    try:
+        outcome = await CRANK.run(resume)
+    finally:
+        # Aborted cranks are reported too (outcome ABORT)
+        CRANK.report()
+        rec = HISTORY.latest()
+        HISTORY.print_record(rec)
+        HISTORY.save(rec)
+        send_crank_report(DATA.can2, rec)
+        try:
+            await pmu_crank_report.show(lcd, rec)
+        except Exception as e:
+            print("CRANK(IO): report display error:", e)
     print("CRANK(IO): sequence complete.")
-
+    return outcome
@@ -0,0 +1,165 @@
+# pmu_crank_report.py — per-crank performance report and history
+# ---------------------------------------------------------------
+# One CrankRecord per crank, filled by pmu_crank_io while it runs:
+#
+#   t_hb_ms     sequence start -> first heartbeat
+#   t_pdo_ms    sequence start -> PDOs flowing (NEUTRAL entered)
+#   ramp_ms     ramp duration (RAMP -> SHUTDOWN)
+#   start_ms    sequence start -> start detected (-1 if no start)
+#   ipk_load    peak load_i (A) during the ramp
+#   ipk_batt    peak batt_current (A) during the ramp
+#   rpm[i]      rpm at each ramp step
+#   outcome     pmu_crank_io OUT_*
+#   timeouts    bit per crank state that timed out
+#
+# History is a fixed ring of HIST_N preallocated records (newest via
+# latest()). Each finished record is appended as a CSV line to
+# CRANK_LOG_FILE, shown on the LCD and published on CAN2
+# (customer_can.send_crank_report).
+import time
+from array import array
+from micropython import const
+
+from pmu_config import CRANK_LOG_FILE
+
+HIST_N = const(8)
+MAX_STEPS = const(32)
+
+OUTCOME_TAGS = ("-", "START", "NOSTART", "ABORT")
+
+
+class CrankRecord:
+
+    def __init__(self):
+        self.rpm = array("h", bytes(2 * MAX_STEPS))
+        self.clear()
+
+    def clear(self):
+        self.seq = 0
+        self.ts = 0
+        self.t_hb_ms = -1
+        self.t_pdo_ms = -1
+        self.ramp_ms = -1
+        self.start_ms = -1
+        self.ipk_load = 0.0
+        self.ipk_batt = 0.0
+        self.n_steps = 0
+        self.outcome = 0
+        self.timeouts = 0
+
+    def max_rpm(self):
+        m = 0
+        for i in range(self.n_steps):
+            if self.rpm[i] > m:
+                m = self.rpm[i]
+        return m
+
+    def csv(self):
+        rpm = ";".join(str(self.rpm[i]) for i in range(self.n_steps))
+        return "%d,%d,%s,%d,%d,%d,%d,%.1f,%.1f,%d,%s\n" % (
+            self.ts, self.seq, OUTCOME_TAGS[self.outcome], self.t_hb_ms,
+            self.t_pdo_ms, self.ramp_ms, self.start_ms,
+            self.ipk_load, self.ipk_batt, self.timeouts, rpm)
+
+
+CSV_HEADER = ("ts,seq,outcome,t_hb_ms,t_pdo_ms,ramp_ms,start_ms,"
+              "ipk_load_a,ipk_batt_a,timeouts,rpm_steps\n")
+
+
+class CrankHistory:
+
+    def __init__(self):
+        self.recs = [CrankRecord() for _ in range(HIST_N)]
+        self.head = 0           # next slot to fill
+        self.count = 0
+        self.seq = 0
+        self.cur = None
+
+    # ---- filled by the crank sequence --------------------------------
+    def begin(self):
+        r = self.recs[self.head]
+        r.clear()
+        self.seq += 1
+        r.seq = self.seq
+        r.ts = time.time()
+        self.cur = r
+        return r
+
+    def sample(self, load_i, batt_i):
+        r = self.cur
+        if load_i > r.ipk_load:
+            r.ipk_load = load_i
+        if batt_i > r.ipk_batt:
+            r.ipk_batt = batt_i
+
+    def step(self, rpm):
+        r = self.cur
+        if r.n_steps < MAX_STEPS:
+            r.rpm[r.n_steps] = rpm
+            r.n_steps += 1
+
+    def finish(self, t_hb_ms, t_pdo_ms, ramp_ms, start_ms, outcome, timeouts):
+        r = self.cur
+        r.t_hb_ms = t_hb_ms
+        r.t_pdo_ms = t_pdo_ms
+        r.ramp_ms = ramp_ms
+        r.start_ms = start_ms
+        r.outcome = outcome
+        r.timeouts = timeouts
+        self.head = (self.head + 1) % HIST_N
+        if self.count < HIST_N:
+            self.count += 1
+        self.cur = None
+        return r
+
+    # ---- readers -----------------------------------------------------
+    def get(self, age=0):
+        """age 0 = newest finished record; None if not that many."""
+        if age >= self.count:
+            return None
+        return self.recs[(self.head - 1 - age) % HIST_N]
+
+    def latest(self):
+        return self.get(0)
+
+    def print_record(self, r):
+        print("CRANK #%d %s: hb %d ms, pdo %d ms, ramp %d ms, start %d ms, "
+              "Ipk load %.0f A batt %.0f A, to=0x%02X"
+              % (r.seq, OUTCOME_TAGS[r.outcome], r.t_hb_ms, r.t_pdo_ms,
+                 r.ramp_ms, r.start_ms, r.ipk_load, r.ipk_batt, r.timeouts))
+        print("  rpm/step:", " ".join(str(r.rpm[i]) for i in range(r.n_steps)))
+
+    def save(self, r, path=CRANK_LOG_FILE):
+        try:
+            try:
+                new = False
+                open(path).close()
+            except OSError:
+                new = True
+            with open(path, "a") as f:
+                if new:
+                    f.write(CSV_HEADER)
+                f.write(r.csv())
+        except OSError as e:
+            print("Crank report save error:", e)
+
+
+async def show(lcd, r):
+    """Four-line summary of record r."""
+    if lcd is None or r is None:
+        return
+    st = "%.1fs" % (r.start_ms / 1000) if r.start_ms >= 0 else "--"
+    lines = (
+        "CRANK #%d %s %s" % (r.seq, OUTCOME_TAGS[r.outcome], st),
+        "HB:%dms PDO:%dms" % (r.t_hb_ms, r.t_pdo_ms),
+        "Ramp:%dms max:%d" % (r.ramp_ms, r.max_rpm()),
+        "Ipk L:%.0fA B:%.0fA" % (r.ipk_load, r.ipk_batt),
+    )
+    await lcd.clear_screen()
+    for i in range(4):
+        await lcd.set_cursor(i, 0)
+        await lcd.write_string(lines[i][:20])
+
+
+# Global instance
+HISTORY = CrankHistory()
@@ -0,0 +1,327 @@
+# pmu_fsm.py — event-driven PMU state machine
+# -------------------------------------------
+# Producers post events; the FSM task sleeps on a ThreadSafeFlag until
+# one arrives, looks (state, event) up in TRANSITIONS and runs
+#
+#   exit action (old state)  ->  DATA.state = new  ->  entry action (new)
+#
+#   FSM.post(EVT_CRANK)      customer CAN, UI, boot flags
+#   FSM.post(EVT_GEN4_LOST)  supervisor; ignored while cranking (no
+#                            TPDOs at standstill is normal)
+#   EVT_FAULT                a state's sequence failed (a crank that
+#                            did not start the engine included)
+#   EVT_DONE                 posted when a state's sequence completes
+#   EVT_STOP                 also clears a latched precharge fault
+#
+# Entry actions start the state's sequence (precharge / crank / regen)
+# as a task; exit actions stop it (regen via DATA.regen_abort, others by
+# cancellation) and wait, bounded, for its cleanup to finish. Leaving
+# CRANK or PRECHARGE before MAIN closed opens the relays. post() never
+# allocates and updates the event ring with IRQs disabled, so hard-IRQ
+# handlers and tasks may post concurrently.
+#
+# post(ev, tag) carries an optional non-zero tag byte; after dispatching a
+# tagged event the FSM calls on_dispatch(tag, accepted, lat_us) so the
+# producer can acknowledge it (customer_can command acks).
+#
+# CRANK and PRECHARGE sequences start with a collection (pmu_memmon),
+# run from the sequence task so the GC pause is not in dispatch latency.
+#
+# Instrumentation: transitions per (from, to), entries and dwell time per
+# state, worst entry/exit action time, and post-to-dispatch latency
+# (last / max, µs). report() prints them.
+import uasyncio as asyncio
+from array import array
+from micropython import const
+from machine import disable_irq, enable_irq
+from time import ticks_ms, ticks_us, ticks_diff
+
+from pmu_config import (
+    DATA,
+    STATE_WAITING,
+    STATE_CRANK,
+    STATE_COAST,
+    STATE_REGEN,
+    STATE_PRECHARGE,
+    REGEN_BATT,
+    REGEN_TUNE,
+    F_DC_BUS_V,
+    F_BATTERY_V,
+)
+from pmu_precharge import PRECHARGE
+from pmu_memmon import MEMMON
+import pmu_crank_io
+import pmu_pid_regen
+import pmu_batt_regen
+import pmu_autotune
+from pmu_trace import emit
+from pmu_trace_events import EV_FSM_TRANS, EV_FSM_IGNORED, EV_FSM_QFULL
+
+N_STATES = const(5)
+STATE_NAMES = ("WAIT", "CRANK", "COAST", "REGEN", "PRE-CHG")
+
+# Events
+EVT_PRECHARGE = const(0)
+EVT_CRANK = const(1)
+EVT_REGEN = const(2)
+EVT_STOP = const(3)
+EVT_DONE = const(4)
+EVT_FAULT = const(5)
+EVT_GEN4_LOST = const(6)
+EVENT_NAMES = ("PRECHARGE", "CRANK", "REGEN", "STOP", "DONE", "FAULT",
+               "GEN4_LOST")
+
+# (state, event, next state); anything else is ignored
+TRANSITIONS = (
+    (STATE_WAITING,   EVT_PRECHARGE, STATE_PRECHARGE),
+    (STATE_WAITING,   EVT_CRANK,     STATE_CRANK),
+    (STATE_WAITING,   EVT_REGEN,     STATE_REGEN),
+
+    (STATE_PRECHARGE, EVT_DONE,      STATE_COAST),
+    (STATE_PRECHARGE, EVT_FAULT,     STATE_WAITING),
+    (STATE_PRECHARGE, EVT_STOP,      STATE_WAITING),
+
+    (STATE_CRANK,     EVT_DONE,      STATE_COAST),
+    (STATE_CRANK,     EVT_FAULT,     STATE_WAITING),
+    (STATE_CRANK,     EVT_STOP,      STATE_WAITING),
+
+    (STATE_COAST,     EVT_CRANK,     STATE_CRANK),
+    (STATE_COAST,     EVT_REGEN,     STATE_REGEN),
+    (STATE_COAST,     EVT_STOP,      STATE_WAITING),
+    (STATE_COAST,     EVT_GEN4_LOST, STATE_WAITING),
+
+    (STATE_REGEN,     EVT_DONE,      STATE_WAITING),
+    (STATE_REGEN,     EVT_STOP,      STATE_WAITING),
+    (STATE_REGEN,     EVT_FAULT,     STATE_WAITING),
+    (STATE_REGEN,     EVT_GEN4_LOST, STATE_WAITING),
+)
+
+QLEN = const(16)
+REGEN_EXIT_MS = const(500)      # regen loops poll regen_abort every 50 ms
+SEQ_EXIT_MS = const(2000)       # crank safe-off (500 ms) + report save/send/show
+
+
+class PMUFsm:
+
+    def __init__(self):
+        self.state = STATE_WAITING
+        self.can = None
+        self._next = {}
+        for s, e, n in TRANSITIONS:
+            self._next[(s << 4) | e] = n
+
+        # Event ring: id + ticks_us stamp + producer tag
+        self._q = bytearray(QLEN)
+        self._qt = array("i", bytes(4 * QLEN))
+        self._qtag = bytearray(QLEN)
+        self.on_dispatch = None
+        self._r = 0
+        self._w = 0
+        self._flag = asyncio.ThreadSafeFlag()
+
+        self._task = None
+        self._gen = 0           # entry count; stale DONE/FAULT are dropped
+        self.last_event = -1
+
+        # Instrumentation
+        self.trans = array("H", bytes(2 * N_STATES * N_STATES))
+        self.enters = array("H", bytes(2 * N_STATES))
+        self.dwell_ms = array("I", bytes(4 * N_STATES))
+        self.entry_us = array("I", bytes(4 * N_STATES))  # worst case
+        self.exit_us = array("I", bytes(4 * N_STATES))
+        self.t_enter = ticks_ms()
+        self.lat_us = 0
+        self.lat_max_us = 0
+        self.ignored = 0
+        self.dropped = 0
+
+        self._entry = (None, self._do_crank, None, self._do_regen,
+                       self._do_precharge)
+
+    # ------------------------------------------------------------------
+    def post(self, ev, tag=0):
+        """Queue an event (any context). False if the queue is full."""
+        irq = disable_irq()
+        w = self._w
+        nxt = (w + 1) % QLEN
+        if nxt == self._r:
+            self.dropped += 1
+            enable_irq(irq)
+            return False
+        self._q[w] = ev
+        self._qt[w] = ticks_us()
+        self._qtag[w] = tag
+        self._w = nxt
+        enable_irq(irq)
+        self._flag.set()
+        return True
+
+    def dwell_now_ms(self):
+        return ticks_diff(ticks_ms(), self.t_enter)
+
+    # ------------------------------------------------------------------
+    async def run(self, can):
+        self.can = can
+        self.t_enter = ticks_ms()
+        self._publish()
+        while True:
+            await self._flag.wait()
+            while self._r != self._w:
+                r = self._r
+                ev = self._q[r]
+                t = self._qt[r]
+                tag = self._qtag[r]
+                self._r = (r + 1) % QLEN
+                if self.dropped:
+                    emit(EV_FSM_QFULL, self.dropped)
+                    self.dropped = 0
+                ok = False
+                try:
+                    ok = await self._dispatch(ev, t)
+                except Exception as e:
+                    print("FSM error:", e)
+                if tag and self.on_dispatch is not None:
+                    self.on_dispatch(tag, ok, ticks_diff(ticks_us(), t))
+
+    async def _dispatch(self, ev, t_post):
+        old = self.state
+        new = self._next.get((old << 4) | ev)
+        self.last_event = ev
+        if ev == EVT_STOP:
+            PRECHARGE.clear_fault()     # operator reset, in any state
+        if new is None:
+            self.ignored += 1
+            emit(EV_FSM_IGNORED, ev, old)
+            return False
+        lat = ticks_diff(ticks_us(), t_post)
+        self.lat_us = lat
+        if lat > self.lat_max_us:
+            self.lat_max_us = lat
+
+        t = ticks_us()
+        await self._exit(old)
+        t = ticks_diff(ticks_us(), t)
+        if t > self.exit_us[old]:
+            self.exit_us[old] = t
+
+        now = ticks_ms()
+        self.dwell_ms[old] += ticks_diff(now, self.t_enter)
+        self.t_enter = now
+        self.trans[old * N_STATES + new] += 1
+        self.enters[new] += 1
+        self.state = new
+        self._publish()
+        emit(EV_FSM_TRANS, old, new, ev, lat)
+        print("FSM: %s -> %s (%s)" % (STATE_NAMES[old], STATE_NAMES[new],
+                                      EVENT_NAMES[ev]))
+
+        t = ticks_us()
+        self._enter_state(new)
+        t = ticks_diff(ticks_us(), t)
+        if t > self.entry_us[new]:
+            self.entry_us[new] = t
+        return True
+
+    def _publish(self):
+        DATA.state = self.state
+        DATA.state_txt = STATE_NAMES[self.state]
+        DATA.ui_needs_update = True
+
+    # ------------------------------------------------------------------
+    # Entry / exit actions
+    # ------------------------------------------------------------------
+    def _enter_state(self, st):
+        self._gen += 1
+        if st == STATE_REGEN:
+            DATA.regen_abort = False
+        fn = self._entry[st]
+        if fn is not None:
+            self._task = asyncio.create_task(self._sequence(fn, self._gen))
+
+    async def _sequence(self, fn, gen):
+        try:
+            MEMMON.on_state(self.state)     # clean heap for crank / precharge
+            ev = await fn()
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            print("FSM: %s sequence error:" % STATE_NAMES[self.state], e)
+            ev = EVT_FAULT
+        if gen == self._gen:
+            self._task = None
+            self.post(ev)
+
+    async def _exit(self, st):
+        self._gen += 1          # its DONE must not reach the next state
+        task = self._task
+        self._task = None
+        if task is None:
+            return
+        if st == STATE_REGEN:
+            DATA.regen_abort = True
+            try:
+                await asyncio.wait_for_ms(task, REGEN_EXIT_MS)
+            except asyncio.TimeoutError:
+                pass
+            return
+        # Let the sequence's cleanup (crank safe-off and report) finish
+        # before the next state's entry action can start another run
+        task.cancel()
+        try:
+            await asyncio.wait_for_ms(task, SEQ_EXIT_MS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        # The crank may have been waiting on PRECHARGE.ensure(): cancelling
+        # the waiter leaves the precharge run going
+        if st in (STATE_PRECHARGE, STATE_CRANK) and not PRECHARGE.closed():
+            PRECHARGE.open_all()
+
+    async def _do_precharge(self):
+        vbatt = DATA.fresh(F_BATTERY_V, 500, 0.0)
+        if vbatt < 0.85 * DATA.batt_nominal_v and not await PRECHARGE.ensure():
+            print("FSM: Precharge FAULT 0x%02X" % PRECHARGE.fault)
+            return EVT_FAULT
+        return EVT_DONE
+
+    async def _do_crank(self):
+        # Ensure precharge (a stale TPDO2 bus voltage counts as 0 V)
+        if (DATA.fresh(F_DC_BUS_V, 500, 0.0) < 0.85 * DATA.battery_v
+                and not await PRECHARGE.ensure()):
+            print("FSM: Precharge FAULT 0x%02X" % PRECHARGE.fault)
+            return EVT_FAULT
+        outcome = await pmu_crank_io.run(DATA, self.can, DATA.lcd)
+        if outcome != pmu_crank_io.OUT_STARTED:
+            print("FSM: crank %s" % pmu_crank_io.OUTCOME_NAMES[outcome])
+            return EVT_FAULT
+        return EVT_DONE
+
+    async def _do_regen(self):
+        if DATA.regen_mode == REGEN_TUNE:
+            await pmu_autotune.run(self.can, DATA, DATA.lcd)
+        elif DATA.regen_mode == REGEN_BATT:
+            await pmu_batt_regen.run(self.can, DATA, DATA.lcd)
+        else:
+            await pmu_pid_regen.run(self.can, DATA, DATA.lcd)
+        return EVT_DONE
+
+    # ------------------------------------------------------------------
+    def report(self):
+        print("FSM: state %s for %d ms, latency last %d / max %d us, "
+              "ignored %d" % (STATE_NAMES[self.state], self.dwell_now_ms(),
+                              self.lat_us, self.lat_max_us, self.ignored))
+        for s in range(N_STATES):
+            dwell = self.dwell_ms[s]
+            if s == self.state:
+                dwell += self.dwell_now_ms()
+            print("  %-7s enters %4d  dwell %8d ms  entry %5d us  exit %6d us"
+                  % (STATE_NAMES[s], self.enters[s], dwell,
+                     self.entry_us[s], self.exit_us[s]))
+        for a in range(N_STATES):
+            for b in range(N_STATES):
+                n = self.trans[a * N_STATES + b]
+                if n:
+                    print("  %s -> %s: %d" % (STATE_NAMES[a], STATE_NAMES[b], n))
+
+
+# Global instance
+FSM = PMUFsm()
@@ -0,0 +1,154 @@
+# pmu_gain_sched.py — rpm × DC-bus gain scheduling for the regen PID
+# -------------------------------------------------------------------
+# Gains live on a uniform grid and are looked up in fixed point: the
+# grid coordinates are Q8 integers (rpm in rpm, Vdc in mV) and the
+# bilinear blend of four flat-array entries is two integer lerps per
+# gain, so a lookup allocates only the Vdc -> mV scaling and the three
+# gains it hands to the float PID.
+#
+#   cell (i, j):  rpm = rpm0 + i*rpm_step   (i < n_rpm)
+#                 vdc = v0   + j*v_step     (j < n_v)
+#   flat index:   i*n_v + j
+#
+# Gains are stored in micro-units (GAIN_SCALE, as EV_TUNE_GAINS traces
+# them); |gain| below ~4 keeps the products in small ints. Outside the
+# grid the edge values are held. Tables are loaded from SD (GAIN_FILE);
+# tools/gain_table_gen.py builds them from logged data.
+#
+# File format (CSV, '#' comments):
+#   axes,<rpm0>,<rpm_step>,<n_rpm>,<v0>,<v_step>,<n_v>
+#   kp,<n_rpm*n_v values, rpm-major>
+#   ki,...
+#   kd,...
+
+from array import array
+from micropython import const
+
+from pmu_config import GAIN_FILE
+
+GAIN_SCALE = const(1_000_000)   # stored gain units per gain unit
+_FRAC = const(8)                # Q8 grid coordinates
+_ONE = const(1 << _FRAC)
+
+
+def _fixed(vals, n):
+    if not vals:
+        return array("i", bytes(4 * n))
+    return array("i", [round(v * GAIN_SCALE) for v in vals])
+
+
+class GainTable:
+
+    def __init__(self, rpm0, rpm_step, n_rpm, v0, v_step, n_v,
+                 kp=None, ki=None, kd=None):
+        self.rpm0 = int(rpm0)
+        self.rpm_step = max(1, int(rpm_step))
+        self.n_rpm = n_rpm
+        self.v0_mv = round(v0 * 1000)
+        self.v_step_mv = max(1, round(v_step * 1000))
+        self.n_v = n_v
+        n = n_rpm * n_v
+        self.kp = _fixed(kp, n)
+        self.ki = _fixed(ki, n)
+        self.kd = _fixed(kd, n)
+        if len(self.kp) != n or len(self.ki) != n or len(self.kd) != n:
+            raise OSError("GainTable: expected %d values per gain" % n)
+        self.out = array("f", (0.0, 0.0, 0.0))   # kp, ki, kd of last lookup
+
+    @classmethod
+    def flat(cls, kp, ki, kd):
+        """1×1 table: the same gains everywhere."""
+        return cls(0, 1, 1, 0.0, 1.0, 1, (kp,), (ki,), (kd,))
+
+    def lookup(self, rpm, vdc):
+        """Interpolated (kp, ki, kd) into self.out; returns self.out."""
+        # Q8 grid coordinates, clamped to the table edges
+        xm = (self.n_rpm - 1) << _FRAC
+        ym = (self.n_v - 1) << _FRAC
+        x = ((int(rpm) - self.rpm0) << _FRAC) // self.rpm_step
+        y = ((int(vdc * 1000) - self.v0_mv) << _FRAC) // self.v_step_mv
+        if x < 0:
+            x = 0
+        elif x > xm:
+            x = xm
+        if y < 0:
+            y = 0
+        elif y > ym:
+            y = ym
+        i = x >> _FRAC
+        j = y >> _FRAC
+        if x == xm and i > 0:
+            i -= 1
+        if y == ym and j > 0:
+            j -= 1
+        fx = x - (i << _FRAC)
+        fy = y - (j << _FRAC)
+        gx = _ONE - fx
+        gy = _ONE - fy
+
+        nv = self.n_v
+        a = i * nv + j                       # (i,   j)
+        b = a + 1 if ym else a               # (i,   j+1)
+        c = a + nv if xm else a              # (i+1, j)
+        d = c + 1 if ym else c               # (i+1, j+1)
+
+        out = self.out
+        g = self.kp
+        lo = (g[a] * gy + g[b] * fy) >> _FRAC
+        hi = (g[c] * gy + g[d] * fy) >> _FRAC
+        out[0] = ((lo * gx + hi * fx) >> _FRAC) / GAIN_SCALE
+        g = self.ki
+        lo = (g[a] * gy + g[b] * fy) >> _FRAC
+        hi = (g[c] * gy + g[d] * fy) >> _FRAC
+        out[1] = ((lo * gx + hi * fx) >> _FRAC) / GAIN_SCALE
+        g = self.kd
+        lo = (g[a] * gy + g[b] * fy) >> _FRAC
+        hi = (g[c] * gy + g[d] * fy) >> _FRAC
+        out[2] = ((lo * gx + hi * fx) >> _FRAC) / GAIN_SCALE
+        return out
+
+    def set_cell(self, rpm, vdc, kp, ki, kd):
+        """Overwrite the grid point nearest (rpm, vdc)."""
+        i = round((rpm - self.rpm0) / self.rpm_step)
+        j = round((vdc * 1000 - self.v0_mv) / self.v_step_mv)
+        i = max(0, min(self.n_rpm - 1, i))
+        j = max(0, min(self.n_v - 1, j))
+        n = i * self.n_v + j
+        self.kp[n] = round(kp * GAIN_SCALE)
+        self.ki[n] = round(ki * GAIN_SCALE)
+        self.kd[n] = round(kd * GAIN_SCALE)
+
+    # ------------------------------------------------------------------
+    def save(self, path=GAIN_FILE):
+        with open(path, "w") as f:
+            f.write("# rpm0,rpm_step,n_rpm,v0,v_step,n_v\n")
+            f.write("axes,%d,%d,%d,%g,%g,%d\n" % (
+                self.rpm0, self.rpm_step, self.n_rpm,
+                self.v0_mv / 1000, self.v_step_mv / 1000, self.n_v))
+            for name in ("kp", "ki", "kd"):
+                f.write(name + "," + ",".join(
+                    "%g" % (v / GAIN_SCALE) for v in getattr(self, name)) + "\n")
+
+
+def load(path=GAIN_FILE):
+    """Read a table from SD; returns None if missing or malformed."""
+    rows = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                parts = line.split(",")
+                rows[parts[0]] = parts[1:]
+        ax = rows["axes"]
+        return GainTable(
+            float(ax[0]), float(ax[1]), int(ax[2]),
+            float(ax[3]), float(ax[4]), int(ax[5]),
+            [float(v) for v in rows["kp"]],
+            [float(v) for v in rows["ki"]],
+            [float(v) for v in rows["kd"]],
+        )
+    except (OSError, KeyError, IndexError, ValueError) as e:
+        print("Gain table not loaded:", e)
+        return None
@@ -1,9 +1,35 @@
+# pmu_logger_async.py — 1 Hz CSV logger to SD with rotation + time index
+# ------------------------------------------------------------------------
+# Files: LOG_DIR/pmu_YYYYMMDD_NNN_1hz.csv
+#
+# A file is closed and a new one started when:
+#   - the calendar date changes (checked on every row)
+#   - it reaches LOG_MAX_BYTES
+#   - it has been open for LOG_MAX_AGE_S
+# Only the newest LOG_MAX_FILES logs are kept.
+#
+# On close each file gets a footer so tools/log_seek.py can jump straight
+# to a time range:
+#   #INDEX,<n>
+#   #I,<ts>,<byte offset of row>      (n lines, ascending ts)
+#   #END,<byte offset of #INDEX>      (fixed width, always the last 16 bytes)
+# Files without a footer (power loss) are still plain CSV and get scanned.
 
-# pmu_logger_async.py — minimal 1 Hz CSV logger to SD
 import uasyncio as asyncio
 import time
 import os
-from pmu_config import DATA, LOG_TO_SD, LOG_DIR, LOG_PERIOD_HZ
+import struct
+from array import array
+from pmu_config import (
+    DATA, LOG_TO_SD, LOG_DIR, LOG_PERIOD_HZ,
+    LOG_MAX_BYTES, LOG_MAX_AGE_S, LOG_MAX_FILES, LOG_INDEX_EVERY,
+    SNAP_FIELDS, SNAP_FMT,
+)
+
+LOG_PREFIX = "pmu_"
+LOG_SUFFIX = "_1hz.csv"
+LOG_HEADER = "ts," + ",".join(n for n, _ in SNAP_FIELDS) + "\n"
+INDEX_MAX = 128              # index entries per file (stride doubles when full)
 
 _can_hooks = []  # optional (bus_name, callable(can_id:int, data:bytes))
 
@@ -16,46 +42,134 @@ def _ensure_dir(path):
     except OSError:
         pass
 
-def _open_daily():
-    _ensure_dir(LOG_DIR)
-    t = time.localtime()
-    fname = "%s/pmu_%04d%02d%02d_1hz.csv" % (LOG_DIR, t[0], t[1], t[2])
-    new = not _file_exists(fname)
-    f = open(fname, "a")
-    if new:
-        f.write("ts,state,uptime,eng_rpm,eng_temp,map,iat,dc_bus,batt_v,batt_i,gen_torque,gen_power,fault,last_emcy\n")
-    return f
-
-def _file_exists(p):
+def _log_files():
+    """Rotated log names, oldest first (names sort chronologically)."""
     try:
-        s = os.stat(p)
-        return True
+        names = [n for n in os.listdir(LOG_DIR)
+                 if n.startswith(LOG_PREFIX) and n.endswith(LOG_SUFFIX)]
     except OSError:
-        return False
+        return []
+    names.sort()
+    return names
+
+def _next_name(t):
+    day = "%s%04d%02d%02d_" % (LOG_PREFIX, t[0], t[1], t[2])
+    seq = 0
+    for n in _log_files():
+        if n.startswith(day):
+            try:
+                seq = max(seq, int(n[len(day):len(day) + 3]) + 1)
+            except ValueError:
+                pass
+    return "%s/%s%03d%s" % (LOG_DIR, day, seq, LOG_SUFFIX)
+
+def _enforce_retention():
+    names = _log_files()
+    while len(names) > LOG_MAX_FILES:
+        try:
+            os.remove(LOG_DIR + "/" + names.pop(0))
+        except OSError:
+            break
+
+
+class RotatingLog:
+    """One open CSV file plus its in-RAM time→offset index."""
+
+    def __init__(self):
+        self.f = None
+        self.day = 0
+        self.opened_s = 0
+        self.size = 0
+        self.rows = 0
+        self.idx_ts = array("i", bytes(4 * INDEX_MAX))
+        self.idx_off = array("i", bytes(4 * INDEX_MAX))
+        self.idx_n = 0
+        self.idx_every = LOG_INDEX_EVERY
+
+    def open(self):
+        _ensure_dir(LOG_DIR)
+        t = time.localtime()
+        fname = _next_name(t)
+        self.f = open(fname, "w")
+        self.f.write(LOG_HEADER)
+        self.day = t[2]
+        self.opened_s = time.time()
+        self.size = len(LOG_HEADER)
+        self.rows = 0
+        self.idx_n = 0
+        self.idx_every = LOG_INDEX_EVERY
+        _enforce_retention()
+        return fname
+
+    def _index(self, ts):
+        if self.idx_n == INDEX_MAX:
+            # Full: keep every other entry and halve the index rate
+            for i in range(INDEX_MAX // 2):
+                self.idx_ts[i] = self.idx_ts[2 * i]
+                self.idx_off[i] = self.idx_off[2 * i]
+            self.idx_n = INDEX_MAX // 2
+            self.idx_every *= 2
+        self.idx_ts[self.idx_n] = ts
+        self.idx_off[self.idx_n] = self.size
+        self.idx_n += 1
+
+    def due(self, ts):
+        """True when the current file must be rotated before writing."""
+        if self.f is None:
+            return True
+        if self.size >= LOG_MAX_BYTES:
+            return True
+        if LOG_MAX_AGE_S and ts - self.opened_s >= LOG_MAX_AGE_S:
+            return True
+        return time.localtime(ts)[2] != self.day
+
+    def write_row(self, ts, line):
+        if self.rows % self.idx_every == 0:
+            self._index(ts)
+        self.f.write(line)
+        self.f.flush()
+        self.size += len(line)
+        self.rows += 1
+
+    def close(self):
+        if self.f is None:
+            return
+        f = self.f
+        self.f = None
+        try:
+            start = self.size
+            f.write("#INDEX,%d\n" % self.idx_n)
+            for i in range(self.idx_n):
+                f.write("#I,%d,%d\n" % (self.idx_ts[i], self.idx_off[i]))
+            f.write("#END,%010d\n" % start)
+        except OSError:
+            pass
+        try:
+            f.close()
+        except OSError:
+            pass
+
 
 async def log_1hz_task():
     if not LOG_TO_SD:
         return
-    f = _open_daily()
+    log = RotatingLog()
     try:
         period = 1 / LOG_PERIOD_HZ if LOG_PERIOD_HZ > 0 else 1
         while True:
             ts = time.time()
-            s = DATA.snapshot()
+            s = struct.unpack_from(SNAP_FMT, DATA.shared_snapshot())
             line = ",".join(str(x) for x in (ts,) + s) + "\n"
 
             try:
-                f.write(line)
-                f.flush()
+                if log.due(ts):
+                    log.close()
+                    log.open()
+                log.write_row(ts, line)
             except Exception as e:
-                # If SD disappears, try re-open next loop
-                try:
-                    f.close()
-                except: pass
+                # If SD disappears, drop the file and re-open next loop
+                log.close()
                 await asyncio.sleep_ms(500)
-                f = _open_daily()
             await asyncio.sleep(period)
     finally:
-        try:
-            f.close()
-        except: pass
+        log.close()
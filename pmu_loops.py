@@ -0,0 +1,186 @@
+# pmu_loops.py — fixed-rate control-loop executor
+# ------------------------------------------------
+# Runs registered step functions at fixed periods (e.g. 10 ms) from one
+# asyncio task. Deadlines advance by exactly one period each run, so there
+# is no cumulative drift from scheduler latency. If a loop falls more than
+# one period behind it is counted as an overrun and re-phased instead of
+# running a burst of catch-up steps.
+#
+# With LOOP_TIMER_ID set, a hardware timer wakes the executor through a
+# ThreadSafeFlag at the GCD of the registered periods (never faster than
+# LOOP_TICK_MS) and is stopped while no loop is registered; registering
+# or unregistering re-times it and re-phases deadlines onto its ticks.
+# Without a timer the executor sleeps until the nearest deadline (at most
+# IDLE_SLEEP_MS when nothing is registered).
+#
+# Step functions are plain (non-async) callables: fn(now_us). Keep them
+# short and allocation-free; long work belongs in ordinary tasks.
+#
+# Per loop, measured with ticks_us:
+#   runs, overruns, exec_last/exec_max (us), late_last/late_max (us)
+
+import uasyncio as asyncio
+from array import array
+from micropython import const
+from utime import ticks_us, ticks_diff, ticks_add
+
+from pmu_config import LOOP_TIMER_ID, LOOP_TICK_MS
+
+MAX_LOOPS = const(4)
+IDLE_SLEEP_MS = const(100)
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+class ControlLoops:
+
+    def __init__(self, timer_id=LOOP_TIMER_ID, tick_ms=LOOP_TICK_MS):
+        self.names = [None] * MAX_LOOPS
+        self.fns = [None] * MAX_LOOPS
+        self.period_us = array("i", bytes(4 * MAX_LOOPS))
+        self.due_us = array("i", bytes(4 * MAX_LOOPS))
+
+        # Statistics
+        self.runs = array("I", bytes(4 * MAX_LOOPS))
+        self.overruns = array("I", bytes(4 * MAX_LOOPS))
+        self.exec_last = array("i", bytes(4 * MAX_LOOPS))
+        self.exec_max = array("i", bytes(4 * MAX_LOOPS))
+        self.late_last = array("i", bytes(4 * MAX_LOOPS))
+        self.late_max = array("i", bytes(4 * MAX_LOOPS))
+
+        self.timer_id = timer_id
+        self.tick_ms = tick_ms          # fastest allowed timer tick
+        self.tick_now_ms = 0            # current timer tick, 0 = stopped
+        self._slack_us = 0              # run loops due within half a tick
+        self._flag = asyncio.ThreadSafeFlag()
+        self._tim = None
+        self._running = False
+
+    # ------------------------------------------------------------------
+    def register(self, name, period_ms, fn):
+        """Add a loop; returns its slot. First run is one period from now."""
+        for i in range(MAX_LOOPS):
+            if self.fns[i] is None:
+                self.names[i] = name
+                self.period_us[i] = period_ms * 1000
+                self.due_us[i] = ticks_add(ticks_us(), period_ms * 1000)
+                self.fns[i] = fn
+                self.reset_stats(i)
+                self._retime()
+                return i
+        raise OSError("ControlLoops: no free slot for %s" % name)
+
+    def unregister(self, slot):
+        self.fns[slot] = None
+        self._retime()
+
+    def _retime(self):
+        """Timer at the GCD of the registered periods; stopped if none."""
+        if self.timer_id is None or not self._running:
+            return
+        g = 0
+        for i in range(MAX_LOOPS):
+            if self.fns[i] is not None:
+                g = _gcd(g, self.period_us[i] // 1000)
+        if g and g < self.tick_ms:
+            g = self.tick_ms
+        if g == self.tick_now_ms:
+            return
+        if self._tim is not None:
+            self._tim.deinit()
+            self._tim = None
+        self.tick_now_ms = g
+        self._slack_us = g * 500
+        if not g:
+            return
+        from pyb import Timer
+        t0 = ticks_us()
+        for i in range(MAX_LOOPS):
+            if self.fns[i] is not None:
+                self.due_us[i] = ticks_add(t0, self.period_us[i])
+        self._tim = Timer(self.timer_id, freq=1000 / g, callback=self._tick)
+
+    def reset_stats(self, slot):
+        self.runs[slot] = 0
+        self.overruns[slot] = 0
+        self.exec_last[slot] = 0
+        self.exec_max[slot] = 0
+        self.late_last[slot] = 0
+        self.late_max[slot] = 0
+
+    def stats(self, slot):
+        """(name, period_us, runs, overruns, exec_last, exec_max, late_last, late_max)"""
+        return (self.names[slot], self.period_us[slot], self.runs[slot],
+                self.overruns[slot], self.exec_last[slot], self.exec_max[slot],
+                self.late_last[slot], self.late_max[slot])
+
+    def report(self):
+        for i in range(MAX_LOOPS):
+            if self.names[i] is not None:
+                print("LOOP %-8s T=%dus runs=%d ovr=%d exec=%d/%dus late=%d/%dus"
+                      % self.stats(i))
+
+    # ------------------------------------------------------------------
+    def _tick(self, _t):
+        # Hard IRQ: only set the flag
+        self._flag.set()
+
+    def _run_due(self):
+        """Run every loop whose deadline has passed; returns us to next deadline."""
+        wait = 1_000_000
+        for i in range(MAX_LOOPS):
+            fn = self.fns[i]
+            if fn is None:
+                continue
+            now = ticks_us()
+            late = ticks_diff(now, self.due_us[i])
+            if late >= -self._slack_us:
+                fn(now)
+                end = ticks_us()
+                ex = ticks_diff(end, now)
+
+                period = self.period_us[i]
+                self.runs[i] += 1
+                self.exec_last[i] = ex
+                if ex > self.exec_max[i]:
+                    self.exec_max[i] = ex
+                self.late_last[i] = late
+                if late > self.late_max[i]:
+                    self.late_max[i] = late
+
+                # Drift-free: advance by one period; re-phase if a whole
+                # period was missed or the step overran its period.
+                if late >= period or ex >= period:
+                    self.overruns[i] += 1
+                    self.due_us[i] = ticks_add(end, period)
+                else:
+                    self.due_us[i] = ticks_add(self.due_us[i], period)
+                now = end
+
+            d = ticks_diff(self.due_us[i], now)
+            if d < wait:
+                wait = d
+        return wait
+
+    async def run(self):
+        self._running = True
+        if self.timer_id is not None:
+            self._retime()
+            while True:
+                await self._flag.wait()
+                self._run_due()
+        else:
+            while True:
+                wait = self._run_due()
+                # Round up: waking early would only spin until the deadline
+                ms = (wait + 999) // 1000
+                await asyncio.sleep_ms(1 if ms < 1 else
+                                       IDLE_SLEEP_MS if ms > IDLE_SLEEP_MS else ms)
+
+
+# Global instance
+LOOPS = ControlLoops()
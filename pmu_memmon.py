@@ -0,0 +1,191 @@
+# pmu_memmon.py — heap / GC monitor with scheduled collection windows
+# -------------------------------------------------------------------
+# Left alone, gc.collect() runs whenever an allocation crosses
+# gc.threshold — possibly mid crank ramp or mid SDO exchange. Instead:
+#
+#   idle windows   WAITING / COAST: task() collects every MEM_PERIOD_MS,
+#                  so the heap is clean when a critical phase starts
+#   critical       CRANK / PRECHARGE: one collect when the FSM's sequence
+#                  task starts (on_state, outside event dispatch), then
+#                  automatic GC by threshold like every other state
+#   held           `with MEMMON.critical():` around short sections only
+#                  (crank ramp, DS402 SDO burst): collect on entry, then
+#                  gc.disable() until the last holder leaves. MicroPython
+#                  does not collect on allocation failure while disabled
+#                  (it raises MemoryError), so holds must stay short.
+#   otherwise      automatic GC, threshold = 1/4 of the free heap at
+#                  start() (MicroPython docs' suggestion)
+#
+# Metrics, every MEM_PERIOD_MS, in DATA (-> snapshot / SD log):
+#   mem_free, mem_alloc   gc.mem_free() / gc.mem_alloc()
+#   mem_largest           largest allocatable block (bytes); probed every
+#                         MEM_PROBE_EVERY idle periods by binary search
+#   mem_rate              allocation rate (B/s); a window in which an
+#                         unscheduled collection ran is skipped and counted
+#   gc_us                 duration of the last scheduled collection
+import gc
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_us, ticks_diff
+
+from pmu_config import (
+    DATA,
+    STATE_WAITING,
+    STATE_COAST,
+    STATE_CRANK,
+    STATE_PRECHARGE,
+    MEM_PERIOD_MS,
+    MEM_PROBE_EVERY,
+    MEM_LOW_BYTES,
+)
+from pmu_trace import emit
+from pmu_trace_events import EV_MEM_GC, EV_MEM_LOW, EV_MEM_AUTO
+
+IDLE_STATES = (STATE_WAITING, STATE_COAST)
+CRITICAL_STATES = (STATE_CRANK, STATE_PRECHARGE)
+
+
+def largest_block(hi):
+    """Largest bytearray that can be allocated, to 64 bytes (0..hi)."""
+    lo = 0
+    while hi - lo > 64:
+        mid = (lo + hi) // 2
+        try:
+            bytearray(mid)
+            lo = mid
+        except MemoryError:
+            hi = mid
+    return lo
+
+
+class MemMonitor:
+
+    def __init__(self):
+        self._hold = 0              # critical() holders
+        self.t_last = ticks_ms()
+        self.last_alloc = 0
+        self.n_idle = 0
+
+        self.gc_runs = 0            # scheduled collections
+        self.auto_gc = 0            # unscheduled ones seen
+        self.gc_us_max = 0
+        self.free_min = 0x3FFFFFFF
+        self.rate_max = 0
+        self.held_ms = 0            # time with GC disabled
+        self._t_hold = 0
+
+    # ---- collection control -----------------------------------------
+    def collect(self):
+        a0 = gc.mem_alloc()
+        t = ticks_us()
+        gc.collect()
+        t = ticks_diff(ticks_us(), t)
+        a1 = gc.mem_alloc()
+        self.gc_runs += 1
+        if t > self.gc_us_max:
+            self.gc_us_max = t
+        DATA.gc_us = t
+        self.last_alloc = a1
+        emit(EV_MEM_GC, t, a0 - a1, gc.mem_free())
+
+    def hold(self):
+        """Collect now, then keep GC off until the matching release()."""
+        if self._hold == 0:
+            self.collect()
+            gc.disable()
+            self._t_hold = ticks_ms()
+        self._hold += 1
+
+    def release(self):
+        if self._hold == 0:
+            return
+        self._hold -= 1
+        if self._hold == 0:
+            gc.enable()
+            self.held_ms += ticks_diff(ticks_ms(), self._t_hold)
+
+    def held(self):
+        return self._hold > 0
+
+    def critical(self):
+        return self
+
+    def __enter__(self):
+        self.hold()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def on_state(self, st):
+        """FSM hook: start a critical state with a clean heap."""
+        if st in CRITICAL_STATES and self._hold == 0:
+            self.collect()
+
+    # ---- sampling ---------------------------------------------------
+    def start(self):
+        gc.collect()
+        gc.threshold(gc.mem_free() // 4 + gc.mem_alloc())
+        self.last_alloc = gc.mem_alloc()
+        self.t_last = ticks_ms()
+
+    def sample(self, now):
+        dt = ticks_diff(now, self.t_last)
+        self.t_last = now
+        a = gc.mem_alloc()
+        f = gc.mem_free()
+        DATA.mem_alloc = a
+        DATA.mem_free = f
+        if f < self.free_min:
+            self.free_min = f
+
+        d = a - self.last_alloc
+        if d < 0:
+            self.auto_gc += 1
+            emit(EV_MEM_AUTO, DATA.state, self.last_alloc, a)
+        elif dt > 0:
+            rate = d * 1000 // dt
+            DATA.mem_rate = rate
+            if rate > self.rate_max:
+                self.rate_max = rate
+        self.last_alloc = a
+
+        if self._hold == 0 and DATA.state in IDLE_STATES:
+            self.collect()
+            self.n_idle += 1
+            if self.n_idle % MEM_PROBE_EVERY == 0:
+                DATA.mem_largest = largest_block(gc.mem_free())
+                self.collect()
+            f = gc.mem_free()
+            DATA.mem_free = f
+
+        if f < MEM_LOW_BYTES:
+            emit(EV_MEM_LOW, f, DATA.mem_largest, MEM_LOW_BYTES)
+
+    async def task(self):
+        self.start()
+        while True:
+            await asyncio.sleep_ms(MEM_PERIOD_MS)
+            try:
+                self.sample(ticks_ms())
+            except Exception as e:
+                print("memmon error:", e)
+
+    def frag_pct(self):
+        f = DATA.mem_free
+        if not (f and DATA.mem_largest):
+            return 0
+        return 100 - DATA.mem_largest * 100 // f
+
+    def report(self):
+        print("MEM: free %d (min %d) alloc %d largest %d frag %d%%" % (
+            DATA.mem_free, self.free_min, DATA.mem_alloc, DATA.mem_largest,
+            self.frag_pct()))
+        print("  rate %d B/s (max %d)  gc %d runs, last %d us, max %d us, "
+              "unscheduled %d, held %d ms%s" % (
+                  DATA.mem_rate, self.rate_max, self.gc_runs, DATA.gc_us,
+                  self.gc_us_max, self.auto_gc, self.held_ms,
+                  " (held now)" if self.held() else ""))
+
+
+# Global instance
+MEMMON = MemMonitor()
@@ -0,0 +1,107 @@
+# pmu_pid.py — allocation-free PID controller
+# -------------------------------------------
+#   u = ff + Kp*e + I - Kd*d(y)/dt
+#
+# - Derivative acts on the measurement (no kick on setpoint changes) and is
+#   low-pass filtered with time constant d_tau.
+# - Output is clamped to [out_min, out_max].
+# - Back-calculation anti-windup: the integrator is driven back by
+#   kaw * (u_clamped - u_unclamped), so it never winds up while saturated.
+#   With ki == 0 there is no integral action: i_term stays at the value
+#   reset() preloaded (the bumpless-start bias).
+# - Optional setpoint ramp: the working setpoint moves toward the target at
+#   no more than sp_rate units per second.
+# - ff is a feed-forward term added before clamping.
+#
+# dt is in seconds. Floats are boxed on the pyboard, so update() allocates
+# a few small objects per call: run it from a task (pmu_loops), never from
+# a hard IRQ.
+# The module has no MicroPython-only imports; tools/pid_sim.py runs it
+# against a simulated engine/generator on the host.
+
+
+class PID:
+
+    def __init__(self, kp, ki=0.0, kd=0.0, out_min=0.0, out_max=1.0,
+                 kaw=None, d_tau=0.0, sp_rate=0.0):
+        self.set_gains(kp, ki, kd, kaw)
+        self.out_min = out_min
+        self.out_max = out_max
+        self.d_tau = d_tau          # derivative filter time constant (s)
+        self.sp_rate = sp_rate      # setpoint ramp (units/s), 0 = step
+
+        self.i_term = 0.0
+        self.d_filt = 0.0
+        self.last_y = 0.0
+        self.sp = 0.0               # working (ramped) setpoint
+        self.u = 0.0
+        self.saturated = False
+
+    def set_gains(self, kp, ki=0.0, kd=0.0, kaw=None):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        # Default tracking gain: 1/Ti (Ti = Kp/Ki); unused without ki
+        if kaw is None:
+            kaw = ki / kp if kp and ki else 0.0
+        self.kaw = kaw
+
+    def set_limits(self, out_min, out_max):
+        self.out_min = out_min
+        self.out_max = out_max
+
+    def reset(self, measurement, output=None, ff=0.0):
+        """
+        Bumpless start: working setpoint starts at the measurement and
+        the integrator is preloaded so the first output equals `output`.
+        """
+        self.last_y = measurement
+        self.sp = measurement
+        self.d_filt = 0.0
+        if output is None:
+            output = self.out_min
+        self.i_term = output - ff
+        self.u = output
+        self.saturated = False
+
+    def update(self, setpoint, measurement, dt, ff=0.0):
+        if dt <= 0:
+            return self.u
+
+        # Setpoint ramp
+        if self.sp_rate > 0:
+            step = self.sp_rate * dt
+            if setpoint > self.sp + step:
+                self.sp += step
+            elif setpoint < self.sp - step:
+                self.sp -= step
+            else:
+                self.sp = setpoint
+        else:
+            self.sp = setpoint
+
+        e = self.sp - measurement
+
+        # Filtered derivative on measurement
+        dy = (measurement - self.last_y) / dt
+        self.last_y = measurement
+        if self.d_tau > 0:
+            self.d_filt += (dy - self.d_filt) * (dt / (self.d_tau + dt))
+        else:
+            self.d_filt = dy
+
+        u_raw = ff + self.kp * e + self.i_term - self.kd * self.d_filt
+
+        u = u_raw
+        if u > self.out_max:
+            u = self.out_max
+        elif u < self.out_min:
+            u = self.out_min
+        self.saturated = u != u_raw
+
+        # Integrate with back-calculation (P/PD: hold the reset value)
+        if self.ki:
+            self.i_term += (self.ki * e + self.kaw * (u - u_raw)) * dt
+
+        self.u = u
+        return u
@@ -1,69 +1,92 @@
 # pmu_pid_regen.py — IO throttle PID version, patched
+# The PID step runs on the pmu_loops executor every PID_PERIOD_MS; run()
+# only owns the regen session (start, wait for exit, safe-off).
 import uasyncio as asyncio
-from pmu_throttle import set_throttle_voltage
-from pmu_config import DATA
-from time import ticks_ms, ticks_diff
-
-
-
+from array import array
+from pmu_throttle import (
+    set_throttle_voltage, set_throttle_voltage_now, V_NEUTRAL_HW, V_MAX_HW,
+)
+from pmu_pid import PID
+import pmu_gain_sched
+from time import ticks_diff, ticks_us
+from pmu_loops import LOOPS
+from pmu_trace import emit
+from pmu_trace_events import EV_PID_START, EV_PID_STEP, EV_PID_EXIT
 from pmu_config import (
     DATA,
-    STATE_WAITING,
-    STATE_PRECHARGE,
-    STATE_CRANK,
-    STATE_COAST,
-    STATE_REGEN
+    STATE_REGEN,
+    GRP_TPDO1,
+    GRP_TPDO2,
+    PID_PERIOD_MS,
 )
 
+_tpdo1 = array("f", (0.0, 0.0, 0.0, 0.0))   # velocity, torque_act, iq_actual, iq_target
+_tpdo2 = array("f", (0.0, 0.0, 0.0, 0.0))   # ud, uq, mod, dc_bus_v
 
+# Throttle volts out; neutral is the bias, gains come from settings
+_pid = PID(DATA.pid_kp, out_min=V_NEUTRAL_HW, out_max=V_MAX_HW)
+_last_us = 0
+_table = None               # pmu_gain_sched.GainTable, or None = fixed gains
 
-KP = 0.012
-KI = 0.0
-KD = 0.0
 
-TARGET_RPM = 2500
+def _load_gains():
+    """Apply the current settings (DATA.pid_*) to the controller."""
+    global _table
+    _table = pmu_gain_sched.load() if DATA.pid_sched else None
+    _pid.set_gains(DATA.pid_kp, DATA.pid_ki, DATA.pid_kd)
+    _pid.d_tau = DATA.pid_d_tau
+    _pid.sp_rate = DATA.pid_sp_rate
 
-async def run(can, DATA, lcd=None):
 
-    print("PID-REGEN: starting IO throttle PID loop")
+def _step(now_us):
+    """One PID step, called by LOOPS at PID_PERIOD_MS."""
+    global _last_us
+
+    if DATA.read_group(GRP_TPDO1, _tpdo1) < 0:
+        return                          # no coherent sample: hold output
+    rpm = _tpdo1[0]
 
-    integral = 0
-    last_err = 0
-    last_ms = ticks_ms()
+    dt = max(1, ticks_diff(now_us, _last_us)) / 1_000_000
+    _last_us = now_us
 
-    # Loop ONLY while regen active and NOT aborted
-    while DATA.state == STATE_REGEN and not DATA.regen_abort:
+    # Gain schedule; the integrator holds output units, so a gain change
+    # does not bump the output. Keep the last Vdc if TPDO2 is mid-write.
+    if _table is not None:
+        DATA.read_group(GRP_TPDO2, _tpdo2)
+        g = _table.lookup(rpm, _tpdo2[3])
+        _pid.set_gains(g[0], g[1], g[2])
 
-        rpm = getattr(DATA, "velocity", 0)
-        err = TARGET_RPM - rpm
+    target = DATA.regen_rpm
+    ff = V_NEUTRAL_HW + DATA.pid_kff * target
+    volts = _pid.update(target, rpm, dt, ff)
 
-        now = ticks_ms()
-        dt = max(1, ticks_diff(now, last_ms))
-        last_ms = now
+    set_throttle_voltage_now(volts)
+    emit(EV_PID_STEP, int(rpm), int(volts * 1000), int(_pid.sp - rpm))
 
-        integral += err * dt
-        deriv = (err - last_err) / dt
-        last_err = err
 
-        u = KP * err + KI * integral + KD * deriv
+async def run(can, DATA, lcd=None):
+    global _last_us
 
-        volts = 4.0 + u
-        volts = max(4.0, min(9.0, volts))
+    emit(EV_PID_START, int(DATA.regen_rpm))
 
-        await set_throttle_voltage(volts)
-        print("PID: rpm=%d  V=%.2f" % (rpm, volts))
+    _load_gains()
+    DATA.read_group(GRP_TPDO1, _tpdo1)
+    _pid.reset(_tpdo1[0], V_NEUTRAL_HW, V_NEUTRAL_HW + DATA.pid_kff * DATA.regen_rpm)
+    _last_us = ticks_us()
+    slot = LOOPS.register("pid", PID_PERIOD_MS, _step)
 
-        # make loop responsive to abort
-        for _ in range(20):          # 20×50ms = 1s loop
-            if DATA.regen_abort or DATA.state != STATE_REGEN:
-                break
+    try:
+        # Loop ONLY while regen active and NOT aborted
+        while DATA.state == STATE_REGEN and not DATA.regen_abort:
             await asyncio.sleep_ms(50)
+    finally:
+        LOOPS.unregister(slot)
 
     # EXIT CONDITION
-    print("PID-REGEN: loop exiting (abort or mode change)")
+    emit(EV_PID_EXIT)
+    LOOPS.report()
 
     # Ensure throttle safe-off
-    await set_throttle_voltage(4.0)
+    await set_throttle_voltage(V_NEUTRAL_HW)
 
-    # Force FSM back to safe state
-    DATA.state = STATE_WAITING
+    # The FSM returns to WAITING when this coroutine completes
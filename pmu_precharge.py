@@ -0,0 +1,281 @@
+# pmu_precharge.py — single precharge service (owns KEY / PRE / MAIN)
+# --------------------------------------------------------------------
+# One sequencing task drives the relays; every caller (FSM, crank, regen)
+# awaits the same run instead of toggling pins itself:
+#
+#   ok = await PRECHARGE.ensure()    # start if needed, wait; True = MAIN closed
+#
+#   IDLE -> KEY_ON -> CHARGING -> CLOSING -> CLOSED
+#                         \-> FAULT (PRE opened, PF_* bits in .fault)
+#
+# CHARGING fits the DC-link RC curve online (pmu_rc_fit) from direct ADC
+# reads; tau and Vf predict the time to threshold. Once that is under
+# near_ms, the ADS1115 0x49 comparator is armed at the threshold (860 SPS
+# continuous, ALERT on ALERT_PIN) and MAIN closes on the ALERT edge; with
+# ALERT_PIN = None the window is polled every fast_sample_ms instead.
+# After fit_min_ms an abnormal tau or Vf faults out well before
+# max_close_ms. A FAULT latches until the operator clears it: an FSM
+# EVT_STOP (UI stop, customer CAN CMD_STOP) calls clear_fault().
+import uasyncio as asyncio
+from micropython import const
+from time import ticks_ms, ticks_diff
+from machine import Pin
+
+from pmu_config import DATA, F_BATTERY_V
+from pmu_rc_fit import RCFit
+from pmu_throttle import set_throttle_voltage
+from pmu_trace import emit
+from pmu_trace_events import (
+    EV_PCHG_START, EV_PCHG_KEY_ON, EV_PCHG_RELAY_ON, EV_PCHG_SAMPLE,
+    EV_PCHG_MAIN_CLOSE, EV_PCHG_TIMEOUT, EV_PCHG_DONE, EV_PCHG_FIT,
+    EV_PCHG_FAULT, EV_PCHG_ALERT, EV_PCHG_STATE,
+)
+
+# Relays — only this module drives them
+PIN_KEY  = Pin("Y1", Pin.OUT, value=0)    # LV enable to Sevcon
+PIN_PRE  = Pin("X1", Pin.OUT, value=0)
+PIN_MAIN = Pin("X2", Pin.OUT, value=0)
+
+ALERT_PIN = None        # pyboard pin wired to ADS1115 0x49 ALERT/RDY (e.g. "X8")
+
+CFG = {
+    "key_on_throttle_v": 1.0,   # keeps the Sevcon happy at key-on
+    "throttle_settle_ms": 1500,
+    "startup_delay_ms": 2500,   # LV rails after KEY
+    "main_overlap_ms":  150,    # PRE stays closed this long after MAIN
+    "max_close_ms":     8000,
+    "ratio_floor_v":    12.0,
+    "ratio_frac":       0.8,
+    "fit_sample_ms":    50,     # sample period while far from threshold
+    "fast_sample_ms":   5,      # polled near-threshold period (no ALERT_PIN)
+    "near_ms":          300,
+    "fit_min_ms":       400,    # fit span before faults are judged
+    "tau_min_ms":       40,     # faster: precharge resistor bypassed / link open
+    "tau_max_ms":       2500,   # slower: resistor open or high, link leaking
+    "vf_min_v":         40.0,   # Vf below the empty-pack voltage: link shorted/loaded
+}
+
+# States
+PC_IDLE = const(0)
+PC_KEY_ON = const(1)
+PC_CHARGING = const(2)
+PC_CLOSING = const(3)
+PC_CLOSED = const(4)
+PC_FAULT = const(5)
+STATE_NAMES = ("IDLE", "KEY_ON", "CHARGING", "CLOSING", "CLOSED", "FAULT")
+
+# Fault bits (DATA.precharge_fault)
+PF_TAU_LOW  = const(0x01)
+PF_TAU_HIGH = const(0x02)
+PF_VF_LOW   = const(0x04)
+PF_NO_RISE  = const(0x08)       # no usable fit: voltage not rising
+PF_TIMEOUT  = const(0x10)
+
+_ADS_860SPS = const(7)          # ads1x15 rate index
+
+
+class Precharge:
+
+    def __init__(self):
+        self.state = PC_IDLE
+        self.fault = 0
+        self.fit = RCFit()
+        self.done = asyncio.Event()
+        self._task = None
+        self._gen = 0           # run count; a cancelled run leaves no trace
+        self._flag = asyncio.ThreadSafeFlag()
+        self._alert = None
+        if ALERT_PIN is not None:
+            self._alert = Pin(ALERT_PIN, Pin.IN, Pin.PULL_UP)
+            self._alert.irq(self._on_alert, Pin.IRQ_FALLING)
+
+    def _on_alert(self, _pin):
+        self._flag.set()
+
+    def _enter(self, st):
+        emit(EV_PCHG_STATE, self.state, st)
+        self.state = st
+
+    # ---- public ------------------------------------------------------
+    def closed(self):
+        return self.state == PC_CLOSED
+
+    def start(self):
+        """Begin the sequence unless it is running, closed or faulted."""
+        if self._task is None and self.state == PC_IDLE:
+            self._gen += 1
+            self.done.clear()
+            self._task = asyncio.create_task(self._run(self._gen))
+
+    async def ensure(self):
+        """Precharge if needed and wait; True once MAIN is closed."""
+        self.start()
+        if self._task is not None:
+            await self.done.wait()
+        return self.state == PC_CLOSED
+
+    def clear_fault(self):
+        """Operator reset of a latched FAULT (FSM EVT_STOP)."""
+        if self.state == PC_FAULT:
+            self.fault = 0
+            DATA.precharge_fault = 0
+            self._enter(PC_IDLE)
+
+    def open_all(self):
+        """Open MAIN and PRE, drop KEY; cancels a running sequence."""
+        if self._task is not None:
+            # Detach it now so start() may begin a new run at once
+            self._gen += 1
+            self._task.cancel()
+            self._task = None
+            self.done.set()
+        PIN_MAIN.low()
+        PIN_PRE.low()
+        PIN_KEY.low()
+        DATA.precharge_done = False
+        if self.state != PC_FAULT:
+            self._enter(PC_IDLE)
+
+    # ---- sequence ----------------------------------------------------
+    async def _run(self, gen):
+        emit(EV_PCHG_START)
+        try:
+            if not PIN_KEY.value():
+                self._enter(PC_KEY_ON)
+                try:
+                    await set_throttle_voltage(CFG["key_on_throttle_v"])
+                except Exception as e:
+                    print("PRECHARGE: couldn't set key-on throttle:", e)
+                await asyncio.sleep_ms(CFG["throttle_settle_ms"])
+                PIN_KEY.high()
+                emit(EV_PCHG_KEY_ON, CFG["startup_delay_ms"])
+                await asyncio.sleep_ms(CFG["startup_delay_ms"])
+
+            self._enter(PC_CHARGING)
+            PIN_PRE.high()
+            emit(EV_PCHG_RELAY_ON)
+            fault = await self._charge()
+
+            if fault:
+                PIN_PRE.low()
+                self.fault = fault
+                DATA.precharge_fault = fault
+                DATA.precharge_done = False
+                self._enter(PC_FAULT)
+                return
+
+            self._enter(PC_CLOSING)
+            PIN_MAIN.high()
+            await asyncio.sleep_ms(CFG["main_overlap_ms"])
+            PIN_PRE.low()
+            DATA.precharge_done = True
+            self._enter(PC_CLOSED)
+            emit(EV_PCHG_DONE)
+        except asyncio.CancelledError:
+            if gen == self._gen:
+                PIN_PRE.low()
+                PIN_MAIN.low()
+                DATA.precharge_done = False
+                self._enter(PC_IDLE)
+            raise
+        finally:
+            if gen == self._gen:
+                self._task = None
+                self.done.set()
+
+    async def _charge(self):
+        """Wait for the DC link; returns 0 when MAIN may close, else PF_*."""
+        fit = self.fit
+        vbatt_nom = DATA.batt_nominal_v
+        target = max(CFG["ratio_floor_v"], vbatt_nom * CFG["ratio_frac"])
+        period = CFG["fit_sample_ms"]
+        DATA.precharge_fault = 0
+        DATA.precharge_tau_ms = -1
+
+        t0 = ticks_ms()
+        fit.reset(t0, await _read_vdc())
+
+        while True:
+            await asyncio.sleep_ms(period)
+            now = ticks_ms()
+            t = ticks_diff(now, t0)
+            vdc = await _read_vdc()
+            fit.add(now, vdc, ticks_diff(now, fit.t_prev))
+            emit(EV_PCHG_SAMPLE, int(vdc * 10), int(target * 10),
+                 int(vbatt_nom * 10), t)
+
+            if vdc >= target:
+                emit(EV_PCHG_MAIN_CLOSE, int(vdc * 10))
+                return 0
+
+            fault = 0
+            if fit.solve():
+                tau_ms = int(fit.tau_s * 1000)
+                eta_ms = int(fit.time_to(target) * 1000)
+                DATA.precharge_tau_ms = tau_ms
+                emit(EV_PCHG_FIT, tau_ms, int(fit.vf * 10), eta_ms)
+                if t >= CFG["fit_min_ms"]:
+                    fault = _check_fit(tau_ms, fit.vf, target)
+                near = 0 <= eta_ms < CFG["near_ms"]
+                if near and not fault and self._alert is not None:
+                    v = await self._wait_alert(target, 2 * CFG["near_ms"])
+                    if v >= target:
+                        emit(EV_PCHG_MAIN_CLOSE, int(v * 10))
+                        return 0
+                period = CFG["fast_sample_ms"] if near else CFG["fit_sample_ms"]
+            elif t >= CFG["fit_min_ms"]:
+                fault = PF_NO_RISE
+
+            if not fault and t >= CFG["max_close_ms"]:
+                emit(EV_PCHG_TIMEOUT, int(vdc * 10), CFG["max_close_ms"])
+                fault = PF_TIMEOUT
+
+            if fault:
+                emit(EV_PCHG_FAULT, fault, DATA.precharge_tau_ms,
+                     int(fit.vf * 10), t)
+                return fault
+
+    async def _wait_alert(self, v_th, timeout_ms):
+        """
+        Comparator at v_th on 0x49 AIN2-3, continuous 860 SPS, holding the
+        ADC lock (the sampler task's next single-shot read restores the
+        chip). Returns the last conversion in volts.
+        """
+        mgr = DATA.adc_mgr
+        adc = mgr.adc_bus
+        raw = int(v_th / mgr.VDIV_BATT / adc.raw_to_v(1))
+        emit(EV_PCHG_ALERT, int(v_th * 10), timeout_ms)
+        async with mgr.lock:
+            self._flag.clear()
+            adc.alert_start(_ADS_860SPS, 2, 3, threshold_high=raw,
+                            threshold_low=raw - 1)
+            try:
+                await asyncio.wait_for_ms(self._flag.wait(), timeout_ms)
+            except asyncio.TimeoutError:
+                pass
+            return adc.raw_to_v(adc.alert_read()) * mgr.VDIV_BATT
+
+
+def _check_fit(tau_ms, vf, target):
+    f = 0
+    if tau_ms < CFG["tau_min_ms"]:
+        f |= PF_TAU_LOW
+    elif tau_ms > CFG["tau_max_ms"]:
+        f |= PF_TAU_HIGH
+    # Absolute floor, not a fraction of nominal: a partly discharged
+    # pack is healthy and still charges the link past target
+    if vf < CFG["vf_min_v"] or vf <= target:
+        f |= PF_VF_LOW
+    return f
+
+
+async def _read_vdc():
+    """Direct ADC conversion; falls back to the task value (stale = 0 V)."""
+    try:
+        return await DATA.adc_mgr.read_battery_v()
+    except Exception:
+        return DATA.fresh(F_BATTERY_V, 500, 0.0)
+
+
+# Global instance
+PRECHARGE = Precharge()
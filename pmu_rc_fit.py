@@ -0,0 +1,74 @@
+# pmu_rc_fit.py — online RC charging-curve fit (precharge)
+# ---------------------------------------------------------
+# A precharging DC link follows
+#
+#   V(t) = Vf - (Vf - V0) * exp(-t / tau)   =>   dV/dt = (Vf - V) / tau
+#
+# so dV/dt is linear in V: slope b = -1/tau, intercept a = Vf/tau.
+# add() turns each pair of samples into one (V_mid, dV/dt) point and
+# updates running means and co-moments (Welford form, stable in single
+# precision floats), so a fit costs a few float ops and no buffers.
+#
+# The fit is not allocation-free: floats are boxed on the pyboard, so each
+# add() / solve() makes a few small objects. Scaled-integer sums were
+# considered: the co-moments over a precharge (mV x mV/s x ~160 samples)
+# overflow 31-bit small ints, so they would allocate bignums instead, and
+# at 0.1 V units the dV/dt resolution near Vf is too coarse for the ETA.
+# add() runs at most every fast_sample_ms in the precharge task; never call
+# it from an IRQ.
+#
+#   tau_s   fitted time constant (s), or -1 before solve() succeeds
+#   vf      fitted final voltage (V)
+#   time_to(v_th)  predicted seconds from the last sample to v_th, -1 if
+#                  the fit says v_th is never reached
+import math
+
+
+class RCFit:
+
+    def __init__(self):
+        self.reset(0, 0.0)
+
+    def reset(self, t_ms, v):
+        self.n = 0
+        self.mx = 0.0       # mean V
+        self.my = 0.0       # mean dV/dt
+        self.cxx = 0.0
+        self.cxy = 0.0
+        self.t_prev = t_ms
+        self.v_prev = v
+        self.tau_s = -1.0
+        self.vf = 0.0
+
+    def add(self, t_ms, v, dt_ms):
+        """Sample v at t_ms, dt_ms after the previous one."""
+        if dt_ms <= 0:
+            return
+        x = (v + self.v_prev) * 0.5
+        y = (v - self.v_prev) * 1000.0 / dt_ms
+        self.t_prev = t_ms
+        self.v_prev = v
+        self.n += 1
+        dx = x - self.mx
+        self.mx += dx / self.n
+        self.my += (y - self.my) / self.n
+        self.cxx += dx * (x - self.mx)
+        self.cxy += dx * (y - self.my)
+
+    def solve(self):
+        """Update tau_s / vf; False if the samples do not give a decay."""
+        if self.n < 3 or self.cxx <= 0:
+            return False
+        b = self.cxy / self.cxx
+        if b >= 0:
+            return False
+        self.tau_s = -1.0 / b
+        self.vf = self.mx - self.my / b     # V where dV/dt = 0
+        return True
+
+    def time_to(self, v_th):
+        if self.tau_s <= 0 or self.vf <= v_th:
+            return -1.0
+        if self.v_prev >= v_th:
+            return 0.0
+        return self.tau_s * math.log((self.vf - self.v_prev) / (self.vf - v_th))
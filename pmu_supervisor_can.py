@@ -4,6 +4,7 @@
 import pyb
 import uasyncio as asyncio
 from pmu_config import DATA
+from pmu_fsm import FSM, EVT_GEN4_LOST
 
 HEARTBEAT_TIMEOUT = 300     # ms
 PDO_TIMEOUT       = 250     # ms
@@ -21,7 +22,8 @@ if not hasattr(DATA, "gen4_online"):
 
 
 async def gen4_supervisor():
-    """Monitor GEN4 online/offline state."""
+    """Monitor GEN4 online/offline state; posts EVT_GEN4_LOST when it drops."""
+    was_online = False
     while True:
         try:
             now = pyb.millis()
@@ -34,6 +36,13 @@ async def gen4_supervisor():
             if now - DATA.gen4_last_pdo_ms > PDO_TIMEOUT:
                 DATA.gen4_online = False
 
+            if was_online and not DATA.gen4_online:
+                FSM.post(EVT_GEN4_LOST)
+            was_online = DATA.gen4_online
+
+            # Per-field staleness for UI / logging
+            DATA.update_stale_mask()
+
         except Exception as e:
             print("Supervisor error:", e)
 
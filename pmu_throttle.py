@@ -1,14 +1,49 @@
 # pmu_throttle.py — Pyboard PWM/I2C throttle helper
+#
+# The PWM output is owned by a timer callback (ThrottleWave, SLEW_TIMER_ID
+# at SLEW_TICK_HZ). Each tick moves the output toward the target by at
+# most the slew rate, or steps the profile player, so ramps do not depend
+# on asyncio latency. DATA.throttle_mv is the value actually on the pin
+# (DATA.throttle_v reads it in volts).
+#
+#   set_throttle_voltage(v)      slew-limited target
+#   set_throttle_voltage_now(v)  immediate (control loops), stops a profile
+#   play_profile(segs, n)        (target_v, duration_ms) pairs, linear
+#   throttle_output()            current output volts
+#
+# volts_to_duty uses the measured LUT from pmu_throttle_cal when
+# THROTTLE_CAL_FILE exists, else the nominal linear map. It is float code,
+# so it never runs in the timer callback: Throttle.build_lut() samples it
+# (at import and install_cal) onto a grid of output µV -> pin counts in
+# 1/16 counts, and the callback interpolates that grid in small ints.
+# Floats are boxed on the pyboard; float math in a hard IRQ raises
+# MemoryError and kills the timer. With PWM_DITHER the fractional count is
+# sigma-delta dithered at the throttle tick rate and averaged out by the
+# output RC filter.
 
 import uasyncio as asyncio
+from array import array
+from micropython import const
 from pyb import Pin, Timer
+from pmu_config import DATA
+import pmu_throttle_cal
 
 # CONFIG
 USE_PWM_THROTTLE = True
 USE_I2C_THROTTLE = False
 
 PWM_PIN = 'Y7'
-PWM_FREQ = 1000
+PWM_FREQ = 1000         # counts per cycle = period() + 1 (pyb picks the
+                        # prescaler to fit the 16-bit TIM12); raise only
+                        # as far as the RC filter + converter settle
+PWM_DITHER = False      # dither between adjacent counts
+
+# Timer-driven output stage
+SLEW_TIMER_ID = 14
+SLEW_TICK_HZ = 1000
+SLEW_V_PER_S = 50.0     # default slew limit, 0 = unlimited
+MAX_SEGMENTS = const(8) # profile player capacity
+_UNLIMITED = const(0x10000000)  # slew step (µV/tick) when the limit is off
 
 # Voltage limits
 V_MIN_HW = 0.5
@@ -18,33 +53,111 @@ V_MAX_HW = 7.5
 DUTY_MIN = 5
 DUTY_MAX = 95
 
+# Volts -> counts grid for the timer callback: 2**LUT_SHIFT µV per point
+LUT_SHIFT = const(14)
+_V_MIN_UV = round(V_MIN_HW * 1000000)
+_V_SPAN_UV = round(V_MAX_HW * 1000000) - _V_MIN_UV
+LUT_N = (_V_SPAN_UV >> LUT_SHIFT) + 2
+
+def _uv(volts):
+    return round(volts * 1000000)
+
 # RUN/FS1 pins
 FWD_PIN = Pin('Y2', Pin.OUT_PP)
 FS1_PIN = Pin('Y3', Pin.OUT_PP)
 
-# Calculate duty cycle from voltage
+# Measured calibration (pmu_throttle_cal.ThrottleCal) or None
+_cal = pmu_throttle_cal.load(V_MIN_HW, V_MAX_HW)
+
+# Calculate duty cycle from voltage (float; not for the timer callback)
 def volts_to_duty(v):
     v = max(V_MIN_HW, min(V_MAX_HW, v))
+    if _cal is not None:
+        return _cal.duty_for(v)
     span = V_MAX_HW - V_MIN_HW
     pct = (v - V_MIN_HW) / span
-    return int(DUTY_MIN + pct * (DUTY_MAX - DUTY_MIN))
+    return DUTY_MIN + pct * (DUTY_MAX - DUTY_MIN)
 
-def calibrate_voltage(v):
-    return v
+def install_cal(cal):
+    """Switch volts_to_duty to a new calibration (None = nominal map)."""
+    global _cal
+    _cal = cal
+    _throttle.build_lut()
+    _wave.c16 = -1              # rewrite the pin on the next change
 
 class Throttle:
     def __init__(self):
         self._init_pwm()
+        self.build_lut()
 
     def _init_pwm(self):
         # Y7 / PB14 uses Timer 12, Channel 1 for PWM
         self.tim = Timer(12, freq=PWM_FREQ)
         self.ch  = self.tim.channel(1, Timer.PWM, pin=Pin(PWM_PIN))
+        self.counts = self.tim.period() + 1     # timer counts per PWM cycle
+        self.dither = PWM_DITHER
+        self._base = 0
+        self._frac = 0          # 1/16 counts
+        self._acc = 0
+        self._pw = -1
 
-    async def _set_pwm_output(self, duty):
-        # Pyboard PWM: duty percentage
-        self.ch.pulse_width_percent(100 - duty)  # inverted
-        await asyncio.sleep_ms(1)
+    def duty_c16(self, duty):
+        """Logical duty % -> pin output in 1/16 counts (converter inverts)."""
+        return round((100 - duty) * self.counts * 16 / 100)
+
+    def build_lut(self):
+        """Sample volts_to_duty onto the integer grid c16_for() reads."""
+        lut = array("i", bytes(4 * LUT_N))
+        for k in range(LUT_N):
+            v = (_V_MIN_UV + (k << LUT_SHIFT)) / 1000000
+            lut[k] = self.duty_c16(volts_to_duty(v))
+        # The last point lies past V_MAX_HW (where volts_to_duty clamps):
+        # extend the final slope so the blend lands on V_MAX_HW exactly
+        k = LUT_N - 2
+        dv = _V_SPAN_UV - (k << LUT_SHIFT)
+        if dv > 0:
+            c = self.duty_c16(volts_to_duty(V_MAX_HW))
+            lut[k + 1] = lut[k] + round((c - lut[k]) * (1 << LUT_SHIFT) / dv)
+        self.lut = lut
+
+    def c16_for(self, uv):
+        """Output µV -> 1/16 counts; integer only (IRQ safe)."""
+        lut = self.lut
+        x = uv - _V_MIN_UV
+        if x <= 0:
+            return lut[0]
+        if x > _V_SPAN_UV:
+            x = _V_SPAN_UV
+        i = x >> LUT_SHIFT
+        a = lut[i]
+        # 8-bit blend keeps the product a small int for any LUT slope
+        return a + (((lut[i + 1] - a) * ((x >> (LUT_SHIFT - 8)) & 0xFF)) >> 8)
+
+    def write_counts(self, c16):
+        if self.dither:
+            self._base = c16 >> 4
+            self._frac = c16 & 15
+            self.dither_tick()
+        else:
+            pw = (c16 + 8) >> 4
+            if pw != self._pw:
+                self._pw = pw
+                self.ch.pulse_width(pw)
+
+    def write_duty(self, duty):
+        self.write_counts(self.duty_c16(duty))
+
+    def dither_tick(self):
+        """Sigma-delta between base and base+1 counts; call every tick."""
+        a = self._acc + self._frac
+        pw = self._base
+        if a >= 16:
+            a -= 16
+            pw += 1
+        self._acc = a
+        if pw != self._pw:
+            self._pw = pw
+            self.ch.pulse_width(pw)
 
     async def neutral(self):
         v = V_NEUTRAL_HW
@@ -61,16 +174,182 @@ class Throttle:
         await self._apply_voltage(v)
 
     async def _apply_voltage(self, volts):
-        v = calibrate_voltage(volts)
-        duty = volts_to_duty(v)
-        await self._set_pwm_output(duty)
+        _wave.set_target(volts)
         await asyncio.sleep_ms(1)
 
-# Global instance
+
+class ThrottleWave:
+    """
+    Timer-callback output stage: slew limiter + segment profile player.
+    The callback runs in hard-IRQ context, so it only does small-int
+    arithmetic (µV, ticks, 1/16 counts) on preallocated state; floats
+    are converted before they reach it.
+    """
+
+    def __init__(self, out, tick_hz=SLEW_TICK_HZ, timer_id=SLEW_TIMER_ID):
+        self.out = out
+        self.tick_hz = tick_hz
+        self.cur = _uv(V_NEUTRAL_HW)    # µV on the pin
+        self.tgt = self.cur             # slew limiter target, µV
+        self.c16 = -1
+        self.set_slew_rate(SLEW_V_PER_S)
+
+        # Profile: target (µV) and length (ticks) per segment
+        self.seg_uv = array("i", bytes(4 * MAX_SEGMENTS))
+        self.seg_n = array("i", bytes(4 * MAX_SEGMENTS))
+        self.n_seg = 0
+        self.seg_i = 0
+        self.seg_k = 0
+        self.seg_q = 0                  # whole µV per tick
+        self.seg_r = 0                  # remainder, spread Bresenham-style
+        self.seg_acc = 0
+        self.playing = False
+        self.done = asyncio.ThreadSafeFlag()
+
+        self._write(self.cur)
+        self.tim = Timer(timer_id, freq=tick_hz, callback=self._tick)
+
+    def set_slew_rate(self, v_per_s):
+        if v_per_s > 0:
+            self.step = max(1, round(v_per_s * 1000000 / self.tick_hz))
+        else:
+            self.step = _UNLIMITED
+
+    def set_target(self, volts):
+        """Slew-limited move; cancels a running profile."""
+        self.playing = False
+        self.tgt = _uv(volts)
+
+    def hold(self, volts):
+        """Immediate output, bypassing the slew limiter."""
+        self.playing = False
+        uv = _uv(volts)
+        self.tgt = uv
+        self._write(uv)
+
+    def play(self, segs, n):
+        """Start a profile of n segments from segs (flat pairs)."""
+        if n > MAX_SEGMENTS:
+            raise OSError("ThrottleWave: %d segments > %d" % (n, MAX_SEGMENTS))
+        self.playing = False
+        for i in range(n):
+            self.seg_uv[i] = _uv(segs[2 * i])
+            self.seg_n[i] = int(segs[2 * i + 1] * self.tick_hz) // 1000
+        self.n_seg = n
+        self.done.clear()
+        self._load(0, self.tgt)
+        self.playing = n > 0
+
+    def _load(self, i, uv_from):
+        n = self.seg_n[i]
+        self.seg_i = i
+        self.seg_k = 0
+        self.seg_acc = 0
+        if n:
+            d = self.seg_uv[i] - uv_from
+            q = d // n
+            self.seg_q = q
+            self.seg_r = d - q * n      # 0 <= r < n
+
+    def _tick(self, _t):
+        if self.playing:
+            i = self.seg_i
+            n = self.seg_n[i]
+            k = self.seg_k + 1
+            if k >= n:
+                # Segment end: land exactly on its target
+                self.tgt = self.seg_uv[i]
+                i += 1
+                if i < self.n_seg:
+                    self._load(i, self.tgt)
+                else:
+                    self.playing = False
+                    self.done.set()
+            else:
+                self.seg_k = k
+                t = self.tgt + self.seg_q
+                a = self.seg_acc + self.seg_r
+                if a >= n:
+                    a -= n
+                    t += 1
+                self.seg_acc = a
+                self.tgt = t
+
+        d = self.tgt - self.cur
+        if d == 0:
+            if self.out.dither:
+                self.out.dither_tick()
+            return
+        if d > self.step:
+            v = self.cur + self.step
+        elif d < -self.step:
+            v = self.cur - self.step
+        else:
+            v = self.tgt
+        self._write(v)
+
+    def _write(self, uv):
+        self.cur = uv
+        DATA.throttle_mv = uv // 1000
+        c = self.out.c16_for(uv)
+        if c != self.c16:
+            self.c16 = c
+            self.out.write_counts(c)
+
+
+# Global instances
 _throttle = Throttle()
+_wave = ThrottleWave(_throttle)
+
+def set_throttle_voltage_now(volts):
+    """Synchronous write for control loops: no await, no slew limit."""
+    _wave.hold(volts)
 
 async def set_throttle_voltage(volts):
-    v = calibrate_voltage(volts)
-    duty = volts_to_duty(v)
-    await _throttle._set_pwm_output(duty)
+    """Slew-limited; the output reaches volts at SLEW_V_PER_S."""
+    _wave.set_target(volts)
     await asyncio.sleep_ms(2)
+
+def set_slew_rate(v_per_s):
+    _wave.set_slew_rate(v_per_s)
+
+def play_profile(segs, n):
+    _wave.play(segs, n)
+
+def stop_profile():
+    """Freeze the output where it is."""
+    _wave.playing = False
+    _wave.tgt = _wave.cur
+
+def profile_active():
+    return _wave.playing
+
+async def wait_profile():
+    if _wave.playing:
+        await _wave.done.wait()
+
+def throttle_output():
+    return _wave.cur / 1000000
+
+def throttle_at(volts):
+    """True once the output has settled exactly on volts."""
+    return _wave.cur == _uv(volts) and not _wave.playing
+
+def pwm_report():
+    """Print and return (freq, counts, counts over V range, mV per count)."""
+    t = _throttle
+    freq = t.tim.freq()
+    span = (DUTY_MAX - DUTY_MIN) / 100 * t.counts
+    mv = (V_MAX_HW - V_MIN_HW) / span * 1000
+    print("THROTTLE PWM %d Hz, %d counts/cycle, %d counts over %.1f-%.1f V, "
+          "%.2f mV/count%s, cal=%s"
+          % (freq, t.counts, span, V_MIN_HW, V_MAX_HW, mv,
+             " (dithered)" if t.dither else "", "LUT" if _cal else "nominal"))
+    return freq, t.counts, span, mv
+
+def write_raw_duty(duty):
+    """Calibration only: logical duty %, bypassing volts and the wave."""
+    _wave.playing = False
+    _wave.tgt = _wave.cur       # keep the timer from writing over it
+    _wave.c16 = -1              # force the next volts write through
+    _throttle.write_duty(duty)
@@ -0,0 +1,173 @@
+# pmu_throttle_cal.py — measured throttle duty -> volts calibration
+# -----------------------------------------------------------------
+# calibrate() sweeps the logical PWM duty (the value volts_to_duty
+# returns, before the converter inversion) across DUTY_MIN..DUTY_MAX,
+# reads the converter output back on ADS1115 0x48 AIN1 and stores the
+# curve in THROTTLE_CAL_FILE:
+#
+#   # duty_pct,volts
+#   5.0,0.512
+#   ...
+#
+# The measured volts are made non-decreasing (pool-adjacent-violators),
+# then inverted onto a uniform volts grid of INV_N points, so at runtime
+# duty_for(v) is one scaled subtraction, int() and a linear blend. It is
+# float code: pmu_throttle samples it onto an integer grid for the timer
+# callback instead of calling it there.
+#
+# Start it with FORCE_THROTTLE_CAL in main.py. Only run with the PMU in
+# WAITING (RUN pin low): the sweep drives the full throttle range.
+from array import array
+from micropython import const
+
+from pmu_config import THROTTLE_CAL_FILE
+
+INV_N = const(128)          # inverse grid points
+
+
+def _pav(y):
+    """Pool-adjacent-violators: least-squares non-decreasing fit, in place."""
+    val = []
+    cnt = []
+    for v in y:
+        val.append(v)
+        cnt.append(1)
+        while len(val) > 1 and val[-2] > val[-1]:
+            c = cnt[-2] + cnt[-1]
+            val[-2] = (val[-2] * cnt[-2] + val[-1] * cnt[-1]) / c
+            cnt[-2] = c
+            val.pop()
+            cnt.pop()
+    i = 0
+    for v, c in zip(val, cnt):
+        for _ in range(c):
+            y[i] = v
+            i += 1
+
+
+class ThrottleCal:
+
+    def __init__(self, duty, volts, v_lo, v_hi):
+        self.duty = array("f", duty)
+        self.volts = array("f", volts)
+        _pav(self.volts)
+        self.v_lo = v_lo
+        self.step = (v_hi - v_lo) / (INV_N - 1)
+        self.inv_step = 1.0 / self.step
+        self.inv = array("f", bytes(4 * INV_N))   # duty at v_lo + k*step
+        self._build_inverse()
+
+    def _build_inverse(self):
+        d = self.duty
+        y = self.volts
+        n = len(y)
+        j = 0
+        for k in range(INV_N):
+            v = self.v_lo + k * self.step
+            if v <= y[0]:
+                self.inv[k] = d[0]
+                continue
+            if v >= y[n - 1]:
+                self.inv[k] = d[n - 1]
+                continue
+            while y[j + 1] < v:
+                j += 1
+            span = y[j + 1] - y[j]
+            f = (v - y[j]) / span if span > 0 else 0.0
+            self.inv[k] = d[j] + (d[j + 1] - d[j]) * f
+
+    def duty_for(self, v):
+        """Logical duty % for output volts (clamped to the grid)."""
+        x = (v - self.v_lo) * self.inv_step
+        if x <= 0:
+            return self.inv[0]
+        if x >= INV_N - 1:
+            return self.inv[INV_N - 1]
+        i = int(x)
+        a = self.inv[i]
+        return a + (self.inv[i + 1] - a) * (x - i)
+
+    def volts_for(self, duty):
+        """Measured output volts at a logical duty % (for reports)."""
+        d = self.duty
+        n = len(d)
+        if duty <= d[0]:
+            return self.volts[0]
+        for j in range(n - 1):
+            if duty <= d[j + 1]:
+                f = (duty - d[j]) / (d[j + 1] - d[j])
+                return self.volts[j] + (self.volts[j + 1] - self.volts[j]) * f
+        return self.volts[n - 1]
+
+    def save(self, path=THROTTLE_CAL_FILE):
+        with open(path, "w") as f:
+            f.write("# duty_pct,volts\n")
+            for i in range(len(self.duty)):
+                f.write("%.3f,%.4f\n" % (self.duty[i], self.volts[i]))
+
+
+def load(v_lo, v_hi, path=THROTTLE_CAL_FILE):
+    """Read a saved curve; returns None if missing or malformed."""
+    duty = []
+    volts = []
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                a, b = line.split(",")
+                duty.append(float(a))
+                volts.append(float(b))
+        if len(duty) < 2:
+            raise OSError("too few points")
+        return ThrottleCal(duty, volts, v_lo, v_hi)
+    except (OSError, ValueError) as e:
+        print("Throttle cal not loaded:", e)
+        return None
+
+
+async def calibrate(step_pct=2.5, settle_ms=60, samples=4):
+    """
+    Sweep duty, build and save the LUT, install it. Returns the
+    ThrottleCal, or None if the measured curve is unusable.
+    """
+    import uasyncio as asyncio
+    import pmu_throttle as thr
+    from pmu_config import DATA, STATE_WAITING
+    from pmu_trace import emit
+    from pmu_trace_events import EV_TCAL_START, EV_TCAL_POINT, EV_TCAL_DONE, EV_TCAL_FAIL
+
+    if DATA.state != STATE_WAITING:
+        raise OSError("throttle calibration needs STATE_WAITING")
+
+    n = int((thr.DUTY_MAX - thr.DUTY_MIN) / step_pct) + 1
+    duty = array("f", bytes(4 * n))
+    volts = array("f", bytes(4 * n))
+    emit(EV_TCAL_START, n)
+
+    try:
+        for i in range(n):
+            d = min(thr.DUTY_MAX, thr.DUTY_MIN + i * step_pct)
+            thr.write_raw_duty(d)
+            await asyncio.sleep_ms(settle_ms)       # RC filter + converter
+            v = await DATA.adc_mgr.read_throttle_v(samples)
+            duty[i] = d
+            volts[i] = v
+            emit(EV_TCAL_POINT, int(d * 100), int(v * 1000))
+    finally:
+        thr.set_throttle_voltage_now(thr.V_NEUTRAL_HW)
+
+    cal = ThrottleCal(duty, volts, thr.V_MIN_HW, thr.V_MAX_HW)
+    lo = cal.volts[0]
+    hi = cal.volts[n - 1]
+    if lo > thr.V_MIN_HW + 0.25 or hi < thr.V_MAX_HW - 0.25 or hi - lo < 1.0:
+        emit(EV_TCAL_FAIL, int(lo * 1000), int(hi * 1000))
+        return None
+
+    cal.save()
+    thr.install_cal(cal)
+    thr.set_throttle_voltage_now(thr.V_NEUTRAL_HW)
+    emit(EV_TCAL_DONE, int(lo * 1000), int(hi * 1000),
+         int(cal.duty_for(thr.V_NEUTRAL_HW) * 100))
+    return cal
@@ -0,0 +1,125 @@
+# pmu_trace.py — structured event/trace log for hot paths
+# --------------------------------------------------------
+# emit() stores (ticks_us, event id, a, b, c, d) in a preallocated int32
+# ring. Nothing is formatted and nothing is allocated, so it costs a few
+# microseconds and is safe from control loops and timer callbacks.
+#
+# drain_task() empties the ring in the background:
+#   sink "repl": one compact line per record  "@<us> <id> <a> <b> <c> <d>"
+#   sink "sd"  : raw 24-byte little-endian records appended to TRACE_FILE
+#
+# tools/trace_decode.py turns either form back into messages using the
+# comments in pmu_trace_events.py.
+
+import uasyncio as asyncio
+import utime
+from array import array
+from machine import disable_irq, enable_irq
+from micropython import const
+
+from pmu_trace_events import SEV_INFO, EV_TRACE_DROPPED
+
+TRACE_SIZE = const(256)      # records held before overwrite
+_REC = const(6)              # ints per record
+TRACE_FILE = "/sd/pmu_trace.bin"
+
+_buf = array("i", bytes(4 * _REC * TRACE_SIZE))
+_head = 0                    # next write slot
+_count = 0                   # records waiting to drain
+_dropped = 0                 # overwritten before drain
+_level = SEV_INFO
+
+
+def set_level(sev):
+    """Only events with severity >= sev are recorded."""
+    global _level
+    _level = sev
+
+
+def emit(evt, a=0, b=0, c=0, d=0):
+    """Record one event. Integer arguments only."""
+    global _head, _count, _dropped
+    if (evt >> 12) < _level:
+        return
+    t = utime.ticks_us()
+    irq = disable_irq()
+    i = _head * _REC
+    _buf[i] = t
+    _buf[i + 1] = evt
+    _buf[i + 2] = a
+    _buf[i + 3] = b
+    _buf[i + 4] = c
+    _buf[i + 5] = d
+    _head = (_head + 1) % TRACE_SIZE
+    if _count < TRACE_SIZE:
+        _count += 1
+    else:
+        _dropped += 1
+    enable_irq(irq)
+
+
+def pending():
+    return _count
+
+
+def _take(rec):
+    """Copy the oldest record into rec. Returns False when empty."""
+    global _count
+    irq = disable_irq()
+    if _count == 0:
+        enable_irq(irq)
+        return False
+    i = ((_head - _count) % TRACE_SIZE) * _REC
+    for k in range(_REC):
+        rec[k] = _buf[i + k]
+    _count -= 1
+    enable_irq(irq)
+    return True
+
+
+def _report_dropped():
+    global _dropped
+    if _dropped:
+        n = _dropped
+        _dropped = 0
+        emit(EV_TRACE_DROPPED, n)
+
+
+async def drain_task(sink="repl", period_ms=100, batch=16):
+    """Background drain. Emitters are never blocked by the sink."""
+    f = None
+    if sink == "sd":
+        try:
+            f = open(TRACE_FILE, "ab")
+        except OSError as e:
+            print("TRACE: SD open failed, draining to REPL:", e)
+            sink = "repl"
+
+    rec = array("i", bytes(4 * _REC))
+
+    while True:
+        _report_dropped()
+        n = 0
+        while n < batch:
+            if not _take(rec):
+                break
+            if f:
+                try:
+                    f.write(rec)
+                except OSError:
+                    pass
+            else:
+                print("@%d %04X %d %d %d %d" % tuple(rec))
+            n += 1
+
+        if f and n:
+            try:
+                f.flush()
+            except OSError:
+                pass
+
+        # Keep draining while behind, otherwise sleep
+        if n < batch:
+            await asyncio.sleep_ms(period_ms)
+        else:
+            await asyncio.sleep_ms(0)
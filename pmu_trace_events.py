@@ -0,0 +1,108 @@
+# pmu_trace_events.py — event ids for pmu_trace
+# ----------------------------------------------
+# id = (severity << 12) | number
+#
+# The trailing comment on each line is the message text. It never reaches
+# the board: tools/trace_decode.py parses this file and substitutes the
+# record's a/b/c/d values into the %d fields.
+#
+# Units are integers only: voltages in mV or dV, torque in dNm, times in ms.
+
+from micropython import const
+
+SEV_DEBUG = const(0)
+SEV_INFO  = const(1)
+SEV_WARN  = const(2)
+SEV_ERROR = const(3)
+
+# ---- Trace system
+EV_TRACE_DROPPED     = const(0x2001)  # TRACE: %d records overwritten before drain
+
+# ---- Crank (SDO torque mode, pmu_crank)
+EV_CRANK_START       = const(0x1101)  # CRANK: sequence starting
+EV_CRANK_PRECHARGE   = const(0x1102)  # CRANK: calling precharge
+EV_CRANK_PCHG_DONE   = const(0x1103)  # CRANK: precharge complete, Vdc=%d dV
+EV_NMT_RESET         = const(0x0104)  # NMT: Reset-Node sent to node %d
+EV_NMT_START         = const(0x0105)  # NMT: Start-Node sent to node %d
+EV_NMT_OK            = const(0x1106)  # NMT: node %d OK
+EV_NMT_FAIL          = const(0x3107)  # NMT: node %d FAILED
+EV_TQ_CFG_START      = const(0x1108)  # CONFIG: torque mode, node %d
+EV_TQ_CFG_OPEN       = const(0x1109)  # CONFIG: OpEnabled, statusword=0x%04X
+EV_TQ_CFG_DONE       = const(0x110A)  # CONFIG: done
+EV_TQ_CFG_FAIL       = const(0x310B)  # CRANK: torque-mode config FAILED
+EV_CRANK_RAMP        = const(0x110C)  # CRANK: ramping to %d dNm in %d steps
+EV_CRANK_HOLD        = const(0x110D)  # CRANK: holding %d dNm
+EV_CRANK_TIMEOUT     = const(0x210E)  # CRANK: timeout after %d ms, rpm=%d
+EV_CRANK_STARTED     = const(0x110F)  # CRANK: start detected at %d rpm after %d ms
+EV_CRANK_DONE        = const(0x1110)  # CRANK: torque zero; sequence done
+
+# ---- Crank (IO throttle, pmu_crank_io)
+EV_CRANKIO_STEP      = const(0x0120)  # CRANK(IO): step %d throttle=%d mV rpm=%d
+EV_CRANKIO_STARTED   = const(0x1121)  # CRANK(IO): engine start detected at %d rpm
+EV_CRANKIO_STATE     = const(0x1122)  # CRANK(IO): state %d -> %d at +%d ms
+EV_CRANKIO_TIMEOUT   = const(0x2123)  # CRANK(IO): state %d timed out after %d ms
+EV_CRANKIO_REPORT    = const(0x1124)  # CRANK(IO): report #%d outcome=%d start=%d ms Ipk=%d A
+EV_CRANKIO_SAG       = const(0x2125)  # CRANK(IO): battery sag %d mV, backing off from %d mV
+
+# ---- Precharge / bring-up
+EV_PCHG_START        = const(0x1201)  # PRECHARGE: starting sequence
+EV_PCHG_KEY_ON       = const(0x1202)  # PRECHARGE: key relay ON, waiting %d ms for LV rails
+EV_PCHG_RELAY_ON     = const(0x1203)  # PRECHARGE: precharge relay ON
+EV_PCHG_WAKE         = const(0x0204)  # PRECHARGE: wake Vc=%d dV Vb=%d dV t=%d ms
+EV_PCHG_WAKE_OK      = const(0x1205)  # PRECHARGE: wake OK, NMT Start to node %d
+EV_PCHG_SAMPLE       = const(0x0206)  # PRECHARGE: Vc=%d dV target=%d dV Vb=%d dV t=%d ms
+EV_PCHG_MAIN_CLOSE   = const(0x1207)  # PRECHARGE: threshold OK, closing MAIN at %d dV
+EV_PCHG_TIMEOUT      = const(0x3208)  # PRECHARGE: TIMEOUT at %d dV after %d ms
+EV_PCHG_DONE         = const(0x1209)  # PRECHARGE: complete
+EV_HB_WAIT           = const(0x120A)  # HB: waiting for bootup heartbeat, %d ms
+EV_HB_OK             = const(0x120B)  # HB: heartbeat received, state=0x%02X
+EV_HB_TIMEOUT        = const(0x220C)  # HB: heartbeat timeout
+EV_DS402_ENABLE      = const(0x120D)  # DS402: enable sequence
+EV_DS402_DONE        = const(0x120E)  # DS402: enable complete
+EV_DRIVE_MODE        = const(0x120F)  # DRIVE: mode 0x6060=%d
+EV_DRIVE_TORQUE      = const(0x0210)  # DRIVE: torque cmd %d dNm
+EV_PCHG_FIT          = const(0x0211)  # PRECHARGE: fit tau=%d ms Vf=%d dV eta=%d ms
+EV_PCHG_FAULT        = const(0x3212)  # PRECHARGE: FAULT 0x%02X tau=%d ms Vf=%d dV at %d ms
+EV_PCHG_ALERT        = const(0x0213)  # PRECHARGE: ALERT armed at %d dV for %d ms
+EV_PCHG_STATE        = const(0x0214)  # PRECHARGE: state %d -> %d
+
+# ---- PID regen
+EV_PID_START         = const(0x1301)  # PID-REGEN: starting, target=%d rpm
+EV_PID_STEP          = const(0x0302)  # PID: rpm=%d throttle=%d mV err=%d
+EV_PID_EXIT          = const(0x1303)  # PID-REGEN: loop exiting
+
+# ---- Battery regen (cascaded)
+EV_BATT_START        = const(0x1401)  # BATT-REGEN: starting, target=%d dV limit=%d dA
+EV_BATT_STEP         = const(0x0402)  # BATT: vb=%d dV ichg=%d dA idem=%d dA throttle=%d mV
+EV_BATT_STALE        = const(0x2403)  # BATT: ADC stale %d ms, throttle neutral
+EV_BATT_EXIT         = const(0x1404)  # BATT-REGEN: loop exiting
+
+# ---- Auto-tune
+EV_TUNE_START        = const(0x1501)  # TUNE: u0=%d mV step=%d mV, %d samples
+EV_TUNE_STEP         = const(0x1502)  # TUNE: step applied at %d rpm
+EV_TUNE_FIT          = const(0x1503)  # TUNE: K=%d rpm/V tau=%d ms theta=%d ms
+EV_TUNE_GAINS        = const(0x1504)  # TUNE: kp=%d e-6 ki=%d e-6
+EV_TUNE_FAIL         = const(0x3505)  # TUNE: fit failed, code=%d
+EV_TUNE_ABORT        = const(0x2506)  # TUNE: aborted after %d samples
+
+# ---- Throttle calibration
+EV_TCAL_START        = const(0x1601)  # TCAL: sweep %d points
+EV_TCAL_POINT        = const(0x0602)  # TCAL: duty=%d e-2 %% -> %d mV
+EV_TCAL_DONE         = const(0x1603)  # TCAL: range %d..%d mV, neutral duty=%d e-2 %%
+EV_TCAL_FAIL         = const(0x3604)  # TCAL: output not monotonic / range %d..%d mV
+
+# ---- PMU state machine (pmu_fsm)
+EV_FSM_TRANS         = const(0x1701)  # FSM: state %d -> %d on event %d, latency %d us
+EV_FSM_IGNORED       = const(0x0702)  # FSM: event %d ignored in state %d
+EV_FSM_QFULL         = const(0x2703)  # FSM: event queue full, %d dropped
+
+# ---- CAN ports (async_can_dual / pmu_can_txq)
+EV_CANTX_DROP        = const(0x2801)  # CANTX: CAN%d prio %d queue full, %d dropped
+EV_CANBUS_STATE      = const(0x2802)  # CANBUS: CAN%d state %d -> %d, TEC=%d
+EV_CANBUS_OFF        = const(0x3803)  # CANBUS: CAN%d bus-off x%d (auto-restarted), total %d
+EV_CANBUS_LOAD       = const(0x2804)  # CANBUS: CAN%d load %d e-1 %% over %d %%
+
+# ---- Heap / GC (pmu_memmon)
+EV_MEM_GC            = const(0x0901)  # MEM: gc %d us, freed %d B, free %d B
+EV_MEM_LOW           = const(0x2902)  # MEM: free %d B (largest %d B) below %d B
+EV_MEM_AUTO          = const(0x1903)  # MEM: unscheduled gc in state %d, alloc %d -> %d B
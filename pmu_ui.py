@@ -4,21 +4,34 @@ from machine import Pin
 import pmu_config
 from pmu_config import DATA
 import utime as time
+from array import array
+import pmu_crank_report
+from pmu_memmon import MEMMON
+from pmu_fsm import FSM, EVT_PRECHARGE, EVT_CRANK, EVT_REGEN, EVT_STOP
 
 
 from pmu_config import (
     DATA,
     STATE_WAITING,
-    STATE_PRECHARGE,
-    STATE_CRANK,
     STATE_COAST,
-    STATE_REGEN,
-    UI_MODE_LCD
+    UI_MODE_LCD,
+    GRP_TPDO1,
+    GRP_TPDO2,
+    GRP_ADC,
+    REGEN_BATT,
+    REGEN_TUNE,
+    FIELD_TAGS,
+    N_FIELDS,
 )
 
 last_update_ms = 0
 UPDATE_INTERVAL_MS = 250   # 4Hz refresh
 
+# Coherent copies of the seqlock groups (see pmu_config.GROUP_FIELDS)
+_tpdo1 = array("f", (0.0, 0.0, 0.0, 0.0))   # velocity, torque_act, iq_act, iq_tgt
+_tpdo2 = array("f", (0.0, 0.0, 0.0, 0.0))   # ud, uq, mod, dc_bus_v
+_adc   = array("f", (0.0, 0.0, 0.0, 0.0))   # battery_v, load_i, charge_i, spare_i
+
 # UI mode constants
 UI_MODE_STATUS     = 0
 UI_MODE_MENU       = 1
@@ -26,6 +39,9 @@ UI_MODE_LCD        = 2
 UI_MODE_PRECHARGE  = 3
 UI_MODE_CRANK      = 4
 UI_MODE_PID        = 5
+UI_MODE_SIGNALS    = 6
+UI_MODE_CRANKREP   = 7
+UI_MODE_MEMORY     = 8
 
 
 # --------------------------------------------------------------------
@@ -135,8 +151,9 @@ async def show_crank_screen(lcd):
     await lcd.write_string(pad("MODE: CRANK - " + DATA.state_txt))
 
     # Line 1: RPM and torque
-    rpm = int(getattr(DATA, "velocity", 0))
-    tq  = int(getattr(DATA, "torque_act", 0))
+    DATA.read_group(GRP_TPDO1, _tpdo1)
+    rpm = int(_tpdo1[0])
+    tq  = int(_tpdo1[1])
     await lcd.set_cursor(1, 0)
     await lcd.write_string(pad("RPM:%5d Tq:%3d" % (rpm, tq)))
 
@@ -156,13 +173,19 @@ async def show_crank_screen(lcd):
 async def show_pid_screen(lcd):
     await lcd.clear_screen()
     await lcd.set_cursor(0, 0)
-    await lcd.write_string("MODE: PID REGEN")
-
+    if DATA.regen_mode == REGEN_BATT:
+        await lcd.write_string("MODE: BATT REGEN")
+    elif DATA.regen_mode == REGEN_TUNE:
+        await lcd.write_string("MODE: AUTO-TUNE")
+    else:
+        await lcd.write_string("MODE: PID REGEN")
+
+    DATA.read_group(GRP_TPDO2, _tpdo2)
     await lcd.set_cursor(1, 0)
-    await lcd.write_string(f"DC: {DATA.dc_bus_v:5.1f}V")
+    await lcd.write_string(pad(f"DC:{_tpdo2[3]:5.1f}V Vb:{DATA.battery_v_f:5.1f}V"))
 
     await lcd.set_cursor(2, 0)
-    await lcd.write_string(f"Ibatt: {DATA.battery_i:5.1f}A")
+    await lcd.write_string(pad(f"Ichg:{DATA.charge_i_f:5.1f}A/{DATA.regen_i_max:4.0f}A"))
 
     await lcd.set_cursor(3, 0)
     await lcd.write_string(f"Set:{DATA.pid_setpoint:4.1f}V")
@@ -188,19 +211,78 @@ async def show_lcd_settings(lcd, contrast, backlight):
 # --------------------------------------------------------------------
 async def show_status(lcd):
 
+    DATA.read_group(GRP_ADC, _adc)
+
+    await lcd.clear_screen()
+
+    await lcd.set_cursor(0, 0)
+    stale = " STALE" if DATA.stale_mask else ""
+    await lcd.write_string(pad("PMU:" + DATA.state_txt + stale))
+
+    await lcd.set_cursor(1, 0)
+    await lcd.write_string(pad("Batt:" + f"{_adc[0]:.1f}V"))
+
+    await lcd.set_cursor(2, 0)
+    await lcd.write_string(pad("Load:" + f"{_adc[1]:.1f}A"))
+
+    await lcd.set_cursor(3, 0)
+    await lcd.write_string(pad("Chg:" + f"{_adc[2]:.1f}A"))
+
+# --------------------------------------------------------------------
+# Signals Screen — which PMUData fields are stale
+# --------------------------------------------------------------------
+async def show_signals_screen(lcd):
+    mask = DATA.stale_mask
+    tags = [FIELD_TAGS[i] for i in range(N_FIELDS) if mask & (1 << i)]
+
     await lcd.clear_screen()
+    await lcd.set_cursor(0, 0)
+    await lcd.write_string(pad("Stale signals: %d" % len(tags)))
+
+    # Lines 1–3: tags wrapped at 20 columns
+    line = ""
+    row = 1
+    for t in tags:
+        if len(line) + len(t) + 1 > 20:
+            await lcd.set_cursor(row, 0)
+            await lcd.write_string(pad(line))
+            row += 1
+            line = ""
+            if row > 3:
+                break
+        line = (line + " " + t) if line else t
+    if row <= 3:
+        await lcd.set_cursor(row, 0)
+        await lcd.write_string(pad(line if tags else "All fresh"))
+
+# --------------------------------------------------------------------
+# Crank Report Screen — pmu_crank_report history, age 0 = newest
+# --------------------------------------------------------------------
+async def show_crank_report_screen(lcd, age):
+    r = pmu_crank_report.HISTORY.get(age)
+    if r is None:
+        await lcd.clear_screen()
+        await lcd.set_cursor(0, 0)
+        await lcd.write_string(pad("No crank reports"))
+        return
+    await pmu_crank_report.show(lcd, r)
 
+# --------------------------------------------------------------------
+# Memory Screen — pmu_memmon heap / GC metrics
+# --------------------------------------------------------------------
+async def show_memory_screen(lcd):
     await lcd.set_cursor(0, 0)
-    await lcd.write_string(pad("PMU:" + DATA.state_txt))
+    await lcd.write_string(pad("Free%6d min%6d" % (DATA.mem_free, MEMMON.free_min)))
 
     await lcd.set_cursor(1, 0)
-    await lcd.write_string(pad("Batt:" + f"{DATA.battery_v:.1f}V"))
+    await lcd.write_string(pad("Blk:%6d Frag:%3d%%" % (DATA.mem_largest, MEMMON.frag_pct())))
 
     await lcd.set_cursor(2, 0)
-    await lcd.write_string(pad("Load:" + f"{DATA.load_i:.1f}A"))
+    await lcd.write_string(pad("Rate:%6d B/s" % DATA.mem_rate))
 
     await lcd.set_cursor(3, 0)
-    await lcd.write_string(pad("Chg:" + f"{DATA.battery_i:.1f}A"))
+    held = "HOLD" if MEMMON.held() else "x%d" % MEMMON.auto_gc
+    await lcd.write_string(pad("GC:%5dus %s" % (DATA.gc_us, held)))
 
 # async def show_status(lcd):
 #     s = DATA.snapshot()
@@ -222,6 +304,9 @@ MENU = [
     "Precharge",
     "Crank Engine",
     "PID Regen",
+    "Signals",
+    "Crank Report",
+    "Memory",
     "LCD Settings",
     "Back",
 ]
@@ -281,6 +366,7 @@ async def ui_task(lcd):
     menu_top = 0        # top visible index in the 4-line window
     MENU_LINES = 3
     lcd_page = 0     # 0: contrast, 1: backlight
+    report_age = 0   # crank report page: 0 = newest
 
     # Queue for keypresses
     q = SimpleQueue()
@@ -304,6 +390,8 @@ async def ui_task(lcd):
                 UI_MODE_PRECHARGE,
                 UI_MODE_CRANK,
                 UI_MODE_PID,
+                UI_MODE_SIGNALS,
+                UI_MODE_MEMORY,
                 UI_MODE_LCD,
             )
         ):
@@ -323,6 +411,12 @@ async def ui_task(lcd):
             elif DATA.ui_mode == UI_MODE_PID:
                 await show_pid_screen(lcd)
 
+            elif DATA.ui_mode == UI_MODE_SIGNALS:
+                await show_signals_screen(lcd)
+
+            elif DATA.ui_mode == UI_MODE_MEMORY:
+                await show_memory_screen(lcd)
+
             elif DATA.ui_mode == UI_MODE_LCD:
 
                 if lcd_page == 0:
@@ -413,6 +507,26 @@ async def ui_task(lcd):
                     DATA.ui_needs_update = False
                     continue
 
+                elif selection == "Signals":
+                    menu_active = False
+                    DATA.ui_mode = UI_MODE_SIGNALS
+                    await show_signals_screen(lcd)
+                    continue
+
+                elif selection == "Crank Report":
+                    menu_active = False
+                    report_age = 0
+                    DATA.ui_mode = UI_MODE_CRANKREP
+                    await show_crank_report_screen(lcd, report_age)
+                    continue
+
+                elif selection == "Memory":
+                    menu_active = False
+                    DATA.ui_mode = UI_MODE_MEMORY
+                    await lcd.clear_screen()
+                    await show_memory_screen(lcd)
+                    continue
+
                 elif selection == "LCD Settings":
                     menu_active = False
                     DATA.ui_mode = UI_MODE_LCD
@@ -494,6 +608,38 @@ async def ui_task(lcd):
                 await lcd.clear_screen()
                 await show_status(lcd)
 
+# ===== SIGNALS PAGE =====
+        if DATA.ui_mode == UI_MODE_SIGNALS:
+            if evt in ("m", "e"):
+                DATA.ui_mode = UI_MODE_STATUS
+                await lcd.clear_screen()
+                await show_status(lcd)
+            continue
+
+# ===== MEMORY PAGE =====
+        if DATA.ui_mode == UI_MODE_MEMORY:
+            if evt in ("m", "e"):
+                DATA.ui_mode = UI_MODE_STATUS
+                await lcd.clear_screen()
+                await show_status(lcd)
+            continue
+
+# ===== CRANK REPORT PAGE =====
+        if DATA.ui_mode == UI_MODE_CRANKREP:
+            # UP = older, DOWN = newer
+            if evt == "u":
+                if pmu_crank_report.HISTORY.get(report_age + 1) is not None:
+                    report_age += 1
+                await show_crank_report_screen(lcd, report_age)
+            elif evt == "d":
+                report_age = max(0, report_age - 1)
+                await show_crank_report_screen(lcd, report_age)
+            elif evt in ("m", "e"):
+                DATA.ui_mode = UI_MODE_STATUS
+                await lcd.clear_screen()
+                await show_status(lcd)
+            continue
+
 # ===== PRECHARGE MODE =====
         if DATA.ui_mode == UI_MODE_PRECHARGE:
 
@@ -505,13 +651,13 @@ async def ui_task(lcd):
 
             # ENTER = start precharge
             if evt == "e":
-                DATA.state = STATE_PRECHARGE
+                FSM.post(EVT_PRECHARGE)
                 # Let FSM run independently
                 continue
 
             # MENU = exit screen
             if evt == "m":
-                DATA.state = STATE_WAITING
+                FSM.post(EVT_STOP)
                 DATA.ui_mode = UI_MODE_STATUS
                 await lcd.clear_screen()
                 await show_status(lcd)
@@ -526,11 +672,11 @@ async def ui_task(lcd):
                 last_update_ms = now
 
             if evt == "e":
-                DATA.state = STATE_CRANK
+                FSM.post(EVT_CRANK)
                 continue
 
             if evt == "m":
-                DATA.state = STATE_WAITING
+                FSM.post(EVT_STOP)
                 DATA.ui_mode = UI_MODE_STATUS
                 await lcd.clear_screen()
                 await show_status(lcd)
@@ -556,14 +702,12 @@ async def ui_task(lcd):
 
             # ENTER = start PID loop
             if evt == "e":
-                DATA.regen_abort = False
-                DATA.state = STATE_REGEN
+                FSM.post(EVT_REGEN)
                 continue
 
             # MENU = exit + save
             elif evt == "m":
-                DATA.regen_abort = True       # <-- signal abort
-                DATA.state = STATE_WAITING    # force FSM back to WAIT
+                FSM.post(EVT_STOP)            # FSM exit action aborts regen
                 DATA.save_settings()
                 DATA.ui_mode = UI_MODE_STATUS
                 await lcd.clear_screen()
@@ -1,7 +1,6 @@
 import uasyncio as asyncio
-from pmu_preactor_standalone import run as precharge_run
-from pmu_preactor_gpio import set_mode, set_target
-from pid import PID  # simple MicroPython PID class
+from pmu_preactor_gpio import run as bringup_run, set_mode, set_target
+from pmu_pid import PID
 CONFIG_PID = {
     "target_voltage": 52.0,
     "kp": 1.0,
@@ -13,18 +12,22 @@ CONFIG_PID = {
 }
 
 async def run(can, D, lcd=None, keypoll=None):
-    await precharge_run(can, D, lcd, keypoll)  # identical bring-up
+    if await bringup_run(can, D, lcd, keypoll) != "ok":   # shared precharge
+        await lcd.write_string("PRECHARGE FAULT")
+        return
 
     await set_mode(can, "torque")
     await lcd.write_string("PID REGEN MODE")
 
-    pid = PID(CONFIG_PID["kp"], CONFIG_PID["ki"], CONFIG_PID["kd"],
-              setpoint=CONFIG_PID["target_voltage"])
-    pid.output_limits = (CONFIG_PID["min_torque"], CONFIG_PID["max_torque"])
+    lo = min(CONFIG_PID["min_torque"], CONFIG_PID["max_torque"])
+    hi = max(CONFIG_PID["min_torque"], CONFIG_PID["max_torque"])
+    pid = PID(CONFIG_PID["kp"], CONFIG_PID["ki"], CONFIG_PID["kd"], lo, hi)
+    pid.reset(getattr(D, "battery_v", 0.0), hi)
+    dt = CONFIG_PID["interval_ms"] / 1000
 
     while True:
         vb = getattr(D, "battery_v", 0.0)
-        tq = pid(vb)
+        tq = pid.update(CONFIG_PID["target_voltage"], vb, dt)
         await set_target(can, "torque", tq)
         await lcd.set_cursor(1, 0)
         await lcd.write_string("Vb:%5.1f Tq:%5.1f " % (vb, tq))
@@ -0,0 +1,168 @@
+# tools/autotune_fit.py — fit a step-test recording and propose PID gains (CPython + NumPy)
+# ----------------------------------------------------------------------------------------
+# Usage:
+#   python tools/autotune_fit.py pmu_tune.bin
+#   python tools/autotune_fit.py pmu_tune.bin --settings pmu_settings.txt --table pmu_gains.csv
+#   python tools/autotune_fit.py pmu_tune.bin --plot
+#
+# Reads the TUNE_FILE written by pmu_autotune. The first-order-plus-dead-time
+# step response
+#
+#   y(t) = y0 + K*du*(1 - exp(-(t - theta)/tau))   for t > theta
+#
+# is fitted by output-error least squares: for every dead time (in samples,
+# up to --max-delay) and a log-spaced grid of tau, K follows in closed form
+# and the pair with the smallest residual wins. Unlike the two-point fit
+# the board does, this uses every sample, so it holds up on noisy rpm.
+# The proposed gains are the SIMC PI rules (as in tools/pid_sim.py).
+#
+# --settings rewrites pid_kp / pid_ki / pid_kd in a copy of the board's
+# settings file; --table sets the grid point nearest the operating point
+# in a GAIN_FILE table (see tools/gain_table_gen.py). Copy both back to SD.
+
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gain_table_gen import write_table  # noqa: E402
+
+TUNE_MAGIC = b"PTUN"
+TUNE_HDR = "<4sHHHHfff"
+
+
+def read_tune(path):
+    with open(path, "rb") as f:
+        blob = f.read()
+    hsz = struct.calcsize(TUNE_HDR)
+    magic, ver, n, dt_ms, k_step, u0, du, vdc = struct.unpack_from(TUNE_HDR, blob)
+    if magic != TUNE_MAGIC:
+        raise SystemExit("%s: not a tune recording" % path)
+    data = np.frombuffer(blob, dtype="<f4", count=2 * n, offset=hsz).astype(float)
+    return dict(n=n, dt=dt_ms / 1000, k_step=k_step, u0=u0, du=du, vdc=vdc,
+                rpm=data[:n], thr=data[n:])
+
+
+def fit_fopdt(y, k_step, du, dt, max_delay):
+    """Output-error FOPDT fit; returns (K, tau, theta, rms)."""
+    y0 = y[:k_step].mean()
+    yd = y[k_step:] - y0
+    t = np.arange(len(yd)) * dt
+    taus = np.geomspace(dt, 20.0, 400)
+    best = None
+    for d in range(0, max_delay + 1):
+        td = np.clip(t - d * dt, 0.0, None)
+        # unit-step responses, one row per tau
+        S = du * (1.0 - np.exp(-td[None, :] / taus[:, None]))
+        K = (S @ yd) / np.einsum("ij,ij->i", S, S)
+        res = np.mean((S * K[:, None] - yd[None, :]) ** 2, axis=1)
+        i = int(np.argmin(res))
+        if K[i] > 0 and (best is None or res[i] < best[3] ** 2):
+            best = (float(K[i]), float(taus[i]), d * dt, float(np.sqrt(res[i])))
+    if best is None:
+        raise SystemExit("no FOPDT model fits this recording")
+    return best
+
+
+def simulate(K, tau, theta, u, y0, u0, dt):
+    d = int(round(theta / dt))
+    a = np.exp(-dt / tau)
+    y = np.full(len(u), 0.0)
+    for k in range(len(u) - 1):
+        uk = u[k - d] if k >= d else u0
+        y[k + 1] = a * y[k] + K * (1 - a) * (uk - u0)
+    return y + y0
+
+
+def simc(K, tau, theta, dt, tc=None):
+    tc = max(theta, 2 * dt) if tc is None else tc
+    kp = tau / (K * (tc + theta))
+    return kp, kp / min(tau, 4 * (tc + theta))
+
+
+def update_settings(path, kp, ki):
+    lines = []
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = [ln.rstrip("\n") for ln in f if ln.strip()]
+    new = {"pid_kp": float(kp), "pid_ki": float(ki), "pid_kd": 0.0}
+    out = []
+    for ln in lines:
+        key = ln.split("=", 1)[0]
+        if key in new:
+            ln = "%s=%r" % (key, new.pop(key))
+        out.append(ln)
+    out += ["%s=%r" % kv for kv in new.items()]
+    with open(path, "w") as f:
+        f.write("\n".join(out) + "\n")
+
+
+def update_table(path, rpm, vdc, kp, ki):
+    rows = {}
+    with open(path) as f:
+        for ln in f:
+            if ln.strip() and not ln.startswith("#"):
+                parts = ln.strip().split(",")
+                rows[parts[0]] = parts[1:]
+    ax = rows["axes"]
+    rpm0, rpm_step, n_rpm = float(ax[0]), float(ax[1]), int(ax[2])
+    v0, v_step, n_v = float(ax[3]), float(ax[4]), int(ax[5])
+    g = {k: [float(v) for v in rows[k]] for k in ("kp", "ki", "kd")}
+    i = min(n_rpm - 1, max(0, int(round((rpm - rpm0) / rpm_step))))
+    j = min(n_v - 1, max(0, int(round((vdc - v0) / v_step))))
+    n = i * n_v + j
+    g["kp"][n], g["ki"][n], g["kd"][n] = kp, ki, 0.0
+    write_table(path, (rpm0, rpm_step, n_rpm), (v0, v_step, n_v), g["kp"], g["ki"], g["kd"])
+    return rpm0 + i * rpm_step, v0 + j * v_step
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fit a pmu_autotune recording")
+    ap.add_argument("file")
+    ap.add_argument("--max-delay", type=int, default=30, help="samples")
+    ap.add_argument("--tc", type=float, default=None, help="closed-loop time constant (s)")
+    ap.add_argument("--settings", help="settings file to update")
+    ap.add_argument("--table", help="gain table to update")
+    ap.add_argument("--rpm", type=float, help="operating point rpm (default: from recording)")
+    ap.add_argument("--vdc", type=float, help="operating point Vdc (default: from recording)")
+    ap.add_argument("--plot", action="store_true")
+    args = ap.parse_args(argv)
+
+    r = read_tune(args.file)
+    K, tau, theta, rms = fit_fopdt(r["rpm"], r["k_step"], r["du"], r["dt"], args.max_delay)
+    kp, ki = simc(K, tau, theta, r["dt"], args.tc)
+    rpm_op = args.rpm if args.rpm is not None else float(
+        (r["rpm"][:r["k_step"]].mean() + r["rpm"][-10:].mean()) / 2)
+    vdc_op = args.vdc if args.vdc is not None else r["vdc"]
+
+    print("%d samples @ %.0f ms, u0=%.2fV step=%.2fV, Vdc=%.1fV"
+          % (r["n"], r["dt"] * 1000, r["u0"], r["du"], r["vdc"]))
+    print("model  K=%.1f rpm/V  tau=%.3fs  theta=%.3fs  (rms %.1f rpm)" % (K, tau, theta, rms))
+    print("gains  pid_kp=%.6g  pid_ki=%.6g  at %.0f rpm / %.1f V" % (kp, ki, rpm_op, vdc_op))
+
+    if args.settings:
+        update_settings(args.settings, kp, ki)
+        print("updated", args.settings)
+    if args.table:
+        cell = update_table(args.table, rpm_op, vdc_op, kp, ki)
+        print("updated %s cell %.0f rpm / %.1f V" % ((args.table,) + cell))
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        t = np.arange(r["n"]) * r["dt"]
+        y0 = r["rpm"][:r["k_step"]].mean()
+        u0 = r["thr"][:r["k_step"]].mean()
+        fig, (a1, a2) = plt.subplots(2, 1, sharex=True)
+        a1.plot(t, r["rpm"], label="rpm")
+        a1.plot(t, simulate(K, tau, theta, r["thr"], y0, u0, r["dt"]), label="model")
+        a1.legend()
+        a2.plot(t, r["thr"], label="throttle V"); a2.legend()
+        plt.show()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# tools/can2_gen.py — .dbc + CPython codec from customer_proto (CPython)
+# ----------------------------------------------------------------------
+# Usage:
+#   python tools/can2_gen.py --dbc pmu_can2.dbc --py pmu_can2_codec.py
+#
+# customer_proto.py is the only definition of the CAN2 protocol; this
+# writes it out for the customer's tools (.dbc) and for integration
+# tests (a standalone codec module, no firmware imports):
+#
+#   import pmu_can2_codec as c
+#   can_id, data = c.encode("PMU_CMD", cmd=1, seq=7)
+#   name, sig = c.decode(0x121, frame)      # {"result": 0, ...}
+#
+# Signals are big-endian (DBC @0, start bit = MSB) and byte aligned.
+
+import argparse
+import os
+import pprint
+import struct
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import customer_proto as proto  # noqa: E402
+
+SEND_TYPES = ("Cyclic", "CyclicIfChanged", "Event")
+
+
+def _num(x):
+    return ("%.6f" % x).rstrip("0").rstrip(".")
+
+
+def _send_type(period, on_change):
+    if period <= 0:
+        return 2
+    return 1 if on_change else 0
+
+
+def dbc_text():
+    out = ['VERSION ""', "", "NS_ :", "", "BS_:", "",
+           "BU_: %s %s" % (proto.PMU, proto.CUSTOMER), ""]
+    for (name, can_id, sender, _, _, sigs), lay, dlc in zip(
+            proto.MSGS, proto.LAYOUT, proto.DLC):
+        rx = proto.CUSTOMER if sender == proto.PMU else proto.PMU
+        out.append("BO_ %d %s: %d %s" % (can_id, name, dlc, sender))
+        for (sname, c, scale, unit, _), (_, off, _, lo, hi) in zip(sigs, lay):
+            bits = 8 * struct.calcsize(c)
+            out.append(' SG_ %s : %d|%d@0%s (%s,0) [%s|%s] "%s" %s' % (
+                sname, off * 8 + 7, bits, "-" if c.islower() else "+",
+                _num(1.0 / scale), _num(lo / scale), _num(hi / scale),
+                unit, rx))
+        out.append("")
+
+    out.append('BA_DEF_ BO_ "GenMsgCycleTime" INT 0 65535;')
+    out.append('BA_DEF_ BO_ "GenMsgSendType" ENUM %s;'
+               % ",".join('"%s"' % t for t in SEND_TYPES))
+    out.append('BA_DEF_DEF_ "GenMsgCycleTime" 0;')
+    out.append('BA_DEF_DEF_ "GenMsgSendType" "%s";' % SEND_TYPES[2])
+    for _, can_id, _, period, on_change, _ in proto.MSGS:
+        out.append('BA_ "GenMsgCycleTime" BO_ %d %d;' % (can_id, period))
+        out.append('BA_ "GenMsgSendType" BO_ %d %d;'
+                   % (can_id, _send_type(period, on_change)))
+    out.append("")
+
+    ids = dict((m[0], m[1]) for m in proto.MSGS)
+    for (msg, sig), names in sorted(proto.VALUE_NAMES.items()):
+        vals = " ".join('%d "%s"' % kv for kv in sorted(names.items()))
+        out.append("VAL_ %d %s %s ;" % (ids[msg], sig, vals))
+    out.append("")
+    return "\n".join(out)
+
+
+CODEC_TEMPLATE = '''\
+# %(name)s — CAN2 customer protocol codec (CPython)
+# GENERATED by tools/can2_gen.py from customer_proto.py; do not edit.
+import struct
+
+# name -> (can_id, dlc, ((signal, fmt, offset, scale, lo, hi), ...))
+MESSAGES = %(messages)s
+
+VALUE_NAMES = %(values)s
+
+BY_ID = dict((v[0], k) for k, v in MESSAGES.items())
+
+
+def encode(name, **signals):
+    """Physical values -> (can_id, bytes); missing signals are 0."""
+    can_id, dlc, sigs = MESSAGES[name]
+    buf = bytearray(dlc)
+    for sig, fmt, off, scale, lo, hi in sigs:
+        v = round(signals.pop(sig, 0) * scale)
+        struct.pack_into(fmt, buf, off, min(max(v, lo), hi))
+    if signals:
+        raise KeyError("%%s has no signal(s) %%s" %% (name, ", ".join(signals)))
+    return can_id, bytes(buf)
+
+
+def decode(can_id, data):
+    """(can_id, bytes) -> (name, {signal: physical value})."""
+    name = BY_ID[can_id]
+    _, dlc, sigs = MESSAGES[name]
+    if len(data) < dlc:
+        raise ValueError("%%s: %%d bytes, need %%d" %% (name, len(data), dlc))
+    out = {}
+    for sig, fmt, off, scale, _, _ in sigs:
+        v = struct.unpack_from(fmt, data, off)[0]
+        out[sig] = v if scale == 1 else v / scale
+    return name, out
+
+
+def value_name(name, signal, value):
+    return VALUE_NAMES.get((name, signal), {}).get(value, str(value))
+'''
+
+
+def codec_text(module_name):
+    messages = {}
+    for (name, can_id, _, _, _, sigs), lay, dlc in zip(
+            proto.MSGS, proto.LAYOUT, proto.DLC):
+        messages[name] = (can_id, dlc, tuple(
+            (s[0],) + l for s, l in zip(sigs, lay)))
+    return CODEC_TEMPLATE % {
+        "name": module_name,
+        "messages": pprint.pformat(messages, width=78),
+        "values": pprint.pformat(proto.VALUE_NAMES, width=78),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--dbc", help="write the .dbc here")
+    ap.add_argument("--py", help="write the CPython codec module here")
+    args = ap.parse_args()
+    if not (args.dbc or args.py):
+        ap.error("nothing to do: give --dbc and/or --py")
+
+    if args.dbc:
+        with open(args.dbc, "w", newline="\n") as f:
+            f.write(dbc_text())
+        print("wrote", args.dbc, "(%d messages)" % len(proto.MSGS))
+    if args.py:
+        with open(args.py, "w", newline="\n") as f:
+            f.write(codec_text(os.path.basename(args.py)))
+        print("wrote", args.py)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# tools/gain_table_gen.py — build a regen gain schedule from PMU logs (CPython)
+# -----------------------------------------------------------------------------
+# Usage:
+#   python tools/gain_table_gen.py LOGDIR_OR_FILES... -o pmu_gains.csv \
+#       [--rpm 1000:4000:500] [--vdc 40:56:4] [--tau 0.4] [--theta 0.05]
+#
+# For each pair of consecutive log rows where the throttle moved, the local
+# plant gain is K = d(rpm)/d(throttle) (rpm per volt; the log's
+# throttle_mv column, or throttle_v in older logs). Estimates are
+# binned to the nearest rpm x dc_bus_v grid point and the median is taken;
+# empty grid points copy the nearest populated one. Each point then gets
+# SIMC PI gains for a first-order-plus-dead-time plant:
+#
+#   Kp = tau / (K * (tc + theta))      Ki = Kp / min(tau, 4*(tc + theta))
+#
+# tau/theta come from a step test (tools/autotune_fit.py) or the defaults
+# below. The output is the GAIN_FILE format read by pmu_gain_sched.load().
+
+import argparse
+import csv
+import glob
+import os
+import statistics
+import sys
+
+STATE_REGEN = 3
+MIN_DV = 0.05               # ignore throttle moves smaller than this (V)
+MAX_DT = 2.0                # consecutive rows further apart are not paired (s)
+
+
+def parse_axis(spec):
+    lo, hi, step = (float(v) for v in spec.split(":"))
+    n = int(round((hi - lo) / step)) + 1
+    return lo, step, n
+
+
+def read_rows(paths, regen_only):
+    for path in paths:
+        with open(path, newline="") as f:
+            lines = (ln for ln in f if not ln.startswith("#"))
+            for row in csv.DictReader(lines):
+                try:
+                    if regen_only and int(row["state"]) != STATE_REGEN:
+                        yield None          # break the pairing chain
+                        continue
+                    if "throttle_mv" in row:
+                        u = float(row["throttle_mv"]) / 1000
+                    else:                   # logs before the mV column
+                        u = float(row["throttle_v"])
+                    yield (float(row["ts"]), float(row["sevcon_rpm"]),
+                           float(row["dc_bus_v"]), u)
+                except (KeyError, ValueError):
+                    yield None
+        yield None
+
+
+def estimate_gains(rows):
+    """Yield (rpm, vdc, K) from consecutive row pairs."""
+    prev = None
+    for r in rows:
+        if r is not None and prev is not None:
+            t0, rpm0, v0, u0 = prev
+            t1, rpm1, v1, u1 = r
+            du = u1 - u0
+            if 0 < t1 - t0 <= MAX_DT and abs(du) >= MIN_DV:
+                k = (rpm1 - rpm0) / du
+                if k > 0:
+                    yield (rpm0 + rpm1) / 2, (v0 + v1) / 2, k
+        prev = r
+
+
+def build_grid(samples, rpm_ax, v_ax):
+    rpm0, rpm_step, n_rpm = rpm_ax
+    v0, v_step, n_v = v_ax
+    bins = [[] for _ in range(n_rpm * n_v)]
+    for rpm, vdc, k in samples:
+        i = min(n_rpm - 1, max(0, int(round((rpm - rpm0) / rpm_step))))
+        j = min(n_v - 1, max(0, int(round((vdc - v0) / v_step))))
+        bins[i * n_v + j].append(k)
+
+    grid = [statistics.median(b) if b else None for b in bins]
+    filled = [(n // n_v, n % n_v) for n, k in enumerate(grid) if k is not None]
+    if not filled:
+        return None, bins
+    for n, k in enumerate(grid):
+        if k is None:
+            i, j = n // n_v, n % n_v
+            fi, fj = min(filled, key=lambda p: abs(p[0] - i) + abs(p[1] - j))
+            grid[n] = grid[fi * n_v + fj]
+    return grid, bins
+
+
+def simc(k, tau, theta, tc):
+    kp = tau / (k * (tc + theta))
+    return kp, kp / min(tau, 4 * (tc + theta))
+
+
+def write_table(path, rpm_ax, v_ax, kp, ki, kd):
+    with open(path, "w") as f:
+        f.write("# rpm0,rpm_step,n_rpm,v0,v_step,n_v\n")
+        f.write("axes,%g,%g,%d,%g,%g,%d\n" % (rpm_ax + v_ax))
+        for name, vals in (("kp", kp), ("ki", ki), ("kd", kd)):
+            f.write(name + "," + ",".join("%.6g" % v for v in vals) + "\n")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a regen gain schedule from logs")
+    ap.add_argument("paths", nargs="+", help="log files or directories")
+    ap.add_argument("-o", "--out", default="pmu_gains.csv")
+    ap.add_argument("--rpm", default="1000:4000:500", help="lo:hi:step")
+    ap.add_argument("--vdc", default="40:56:4", help="lo:hi:step")
+    ap.add_argument("--tau", type=float, default=0.4, help="plant time constant (s)")
+    ap.add_argument("--theta", type=float, default=0.05, help="plant dead time (s)")
+    ap.add_argument("--tc", type=float, default=None, help="closed-loop time constant (s), default theta")
+    ap.add_argument("--kd", type=float, default=0.0)
+    ap.add_argument("--all-states", action="store_true", help="use rows outside REGEN too")
+    args = ap.parse_args(argv)
+
+    files = []
+    for p in args.paths:
+        files += sorted(glob.glob(os.path.join(p, "pmu_*.csv"))) if os.path.isdir(p) else [p]
+    if not files:
+        print("no log files", file=sys.stderr)
+        return 1
+
+    rpm_ax = parse_axis(args.rpm)
+    v_ax = parse_axis(args.vdc)
+    samples = list(estimate_gains(read_rows(files, not args.all_states)))
+    grid, bins = build_grid(samples, rpm_ax, v_ax)
+    if grid is None:
+        print("no usable throttle steps in %d file(s)" % len(files), file=sys.stderr)
+        return 1
+
+    tc = args.theta if args.tc is None else args.tc
+    kp, ki = zip(*(simc(k, args.tau, args.theta, tc) for k in grid))
+    write_table(args.out, rpm_ax, v_ax, kp, ki, [args.kd] * len(grid))
+
+    # Coverage summary: K (rpm/V) per grid point, '*' = filled from a neighbour
+    n_v = v_ax[2]
+    print("%d samples from %d file(s) -> %s" % (len(samples), len(files), args.out))
+    print("rpm\\Vdc " + "".join("%9g" % (v_ax[0] + j * v_ax[1]) for j in range(n_v)))
+    for i in range(rpm_ax[2]):
+        cells = ""
+        for j in range(n_v):
+            n = i * n_v + j
+            cells += "%8.0f%s" % (grid[n], " " if bins[n] else "*")
+        print("%7g " % (rpm_ax[0] + i * rpm_ax[1]) + cells)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
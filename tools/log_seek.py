@@ -0,0 +1,95 @@
+# tools/log_seek.py — extract a time range from PMU CSV logs (CPython)
+# ---------------------------------------------------------------------
+# Usage:
+#   python tools/log_seek.py LOGDIR_OR_FILES... --from 1732000000 --to 1732003600
+#
+# Uses the #INDEX footer written by pmu_logger_async to seek close to the
+# start time instead of scanning the whole file. Files without a footer
+# (power loss before rotation) are scanned from the top.
+
+import argparse
+import bisect
+import glob
+import os
+import sys
+
+TRAILER_LEN = 16            # "#END,%010d\n"
+
+
+def read_index(f):
+    """Return ([ts], [offset]) from the footer, or None if there is none."""
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    if end < TRAILER_LEN:
+        return None
+    f.seek(end - TRAILER_LEN)
+    trailer = f.read(TRAILER_LEN)
+    if not trailer.startswith(b"#END,"):
+        return None
+    start = int(trailer[5:15])
+    f.seek(start)
+    ts, off = [], []
+    for line in f.read(end - start).splitlines():
+        if line.startswith(b"#I,"):
+            _, t, o = line.split(b",")
+            ts.append(int(t))
+            off.append(int(o))
+    return ts, off
+
+
+def rows_between(path, t_from, t_to):
+    with open(path, "rb") as f:
+        header = f.readline()
+        idx = read_index(f)
+        pos = len(header)
+        if idx and idx[0]:
+            ts, off = idx
+            # Last index entry at or before t_from
+            i = bisect.bisect_right(ts, t_from) - 1
+            if i >= 0:
+                pos = off[i]
+        f.seek(pos)
+        for line in f:
+            if line.startswith(b"#"):
+                break
+            try:
+                t = int(line.split(b",", 1)[0])
+            except ValueError:
+                continue
+            if t < t_from:
+                continue
+            if t > t_to:
+                break
+            yield header, line
+
+
+def expand(paths):
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            out.extend(sorted(glob.glob(os.path.join(p, "pmu_*_1hz.csv"))))
+        else:
+            out.extend(sorted(glob.glob(p)))
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Extract a time range from PMU logs")
+    ap.add_argument("paths", nargs="+", help="log directory or CSV files")
+    ap.add_argument("--from", dest="t_from", type=int, default=0, help="epoch seconds")
+    ap.add_argument("--to", dest="t_to", type=int, default=2**31 - 1, help="epoch seconds")
+    args = ap.parse_args(argv)
+
+    out = sys.stdout.buffer
+    header_done = False
+    for path in expand(args.paths):
+        for header, line in rows_between(path, args.t_from, args.t_to):
+            if not header_done:
+                out.write(header)
+                header_done = True
+            out.write(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
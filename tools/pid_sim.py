@@ -0,0 +1,218 @@
+# tools/pid_sim.py — host step-response checks for pmu_pid.PID (CPython)
+# -----------------------------------------------------------------------
+# Usage:
+#   python tools/pid_sim.py            # run all checks, exit 1 on failure
+#   python tools/pid_sim.py --plot     # also plot the step response (matplotlib)
+#
+# The plant is a first-order-plus-dead-time engine/generator: throttle
+# volts above neutral raise the steady rpm by K rpm/V with time constant
+# TAU and transport delay THETA, plus an optional load step. Gains are the
+# SIMC rules for that model, the same rules tools/autotune_fit.py proposes.
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pmu_pid import PID  # noqa: E402
+
+DT = 0.010                  # PID_PERIOD_MS
+V_NEUTRAL = 4.0
+V_MAX = 7.5
+IDLE_RPM = 1000.0
+K = 1000.0                  # rpm per volt above neutral
+TAU = 0.40                  # s
+THETA = 0.05                # s
+
+
+class EnginePlant:
+    def __init__(self, rpm=IDLE_RPM, k=K, tau=TAU, theta=THETA, noise=0.0, seed=1):
+        self.rpm = rpm
+        self.k = k
+        self.tau = tau
+        self.delay = [V_NEUTRAL + (rpm - IDLE_RPM) / k] * max(1, int(round(theta / DT)))
+        self.load = 0.0     # rpm drop from generator load
+        self.noise = noise
+        self.rng = random.Random(seed)
+
+    def step(self, u):
+        self.delay.append(u)
+        u_d = self.delay.pop(0)
+        target = IDLE_RPM + self.k * (u_d - V_NEUTRAL) - self.load
+        self.rpm += (target - self.rpm) * DT / self.tau
+        return self.rpm + (self.rng.uniform(-self.noise, self.noise) if self.noise else 0.0)
+
+
+def simc_gains(k=K, tau=TAU, theta=THETA, tc=None):
+    tc = theta if tc is None else tc
+    kp = tau / (k * (tc + theta))
+    ti = min(tau, 4 * (tc + theta))
+    return kp, kp / ti
+
+
+def make_pid(**kw):
+    kp, ki = simc_gains()
+    args = dict(kp=kp, ki=ki, kd=0.0, out_min=V_NEUTRAL, out_max=V_MAX)
+    args.update(kw)
+    return PID(**args)
+
+
+def simulate(pid, plant, setpoints, t_end, ff=V_NEUTRAL):
+    """setpoints: list of (t, sp). Returns lists t, sp, rpm, u."""
+    y = plant.step(V_NEUTRAL + (plant.rpm - IDLE_RPM) / plant.k)
+    pid.reset(y, V_NEUTRAL + (plant.rpm - IDLE_RPM) / plant.k, ff)
+    ts, sps, ys, us = [], [], [], []
+    sp = setpoints[0][1]
+    n = int(round(t_end / DT))
+    for i in range(n):
+        t = i * DT
+        for ts_, sp_ in setpoints:
+            if t >= ts_:
+                sp = sp_
+        u = pid.update(sp, y, DT, ff)
+        y = plant.step(u)
+        ts.append(t); sps.append(pid.sp); ys.append(y); us.append(u)
+    return ts, sps, ys, us
+
+
+def settle_time(ts, ys, final, band, t0=0.0):
+    last_out = t0
+    for t, y in zip(ts, ys):
+        if t >= t0 and abs(y - final) > band:
+            last_out = t
+    return last_out - t0
+
+
+# ----------------------------------------------------------------------
+# Checks: each returns (ok, detail)
+# ----------------------------------------------------------------------
+def check_step_response():
+    ts, _, ys, _ = simulate(make_pid(), EnginePlant(rpm=1500), [(0, 1500), (0.5, 2500)], 4.0)
+    peak = max(ys)
+    overshoot = (peak - 2500) / 1000 * 100
+    st = settle_time(ts, ys, 2500, 25, 0.5)
+    sse = abs(ys[-1] - 2500)
+    ok = overshoot < 10 and st < 1.5 and sse < 5
+    return ok, "overshoot=%.1f%% settle(1%%)=%.2fs sse=%.1frpm" % (overshoot, st, sse)
+
+
+def check_load_rejection():
+    pid = make_pid()
+    plant = EnginePlant(rpm=2500)
+    _, _, ys, _ = simulate(pid, plant, [(0, 2500)], 1.0)
+
+    # Continue the same run with the load applied
+    plant.load = 300.0
+    y = ys[-1]
+    dip = 0.0
+    for _ in range(int(3.0 / DT)):
+        u = pid.update(2500, y, DT, V_NEUTRAL)
+        y = plant.step(u)
+        dip = max(dip, 2500 - y)
+    sse = abs(y - 2500)
+    ok = sse < 5 and dip < 300
+    return ok, "load step 300rpm: dip=%.0frpm sse=%.1frpm" % (dip, sse)
+
+
+def check_output_clamped():
+    _, _, _, us = simulate(make_pid(), EnginePlant(), [(0, 1000), (0.2, 9000), (2.0, 0)], 4.0)
+    ok = min(us) >= V_NEUTRAL and max(us) <= V_MAX
+    return ok, "u in [%.2f, %.2f]" % (min(us), max(us))
+
+
+def _recovery(kaw):
+    """Saturate for 3 s on an unreachable setpoint, then ask for 2500 rpm."""
+    pid = make_pid(kaw=kaw)
+    ts, _, ys, us = simulate(pid, EnginePlant(rpm=2000),
+                             [(0, 2000), (0.5, 8000), (3.5, 2500)], 8.0)
+    peak_after = max(y for t, y in zip(ts, ys) if t >= 3.5)
+    return settle_time(ts, ys, 2500, 25, 3.5), peak_after
+
+
+def check_anti_windup():
+    st_aw, pk_aw = _recovery(None)
+    st_no, pk_no = _recovery(0.0)
+    ok = st_aw < 1.5 and st_aw < st_no
+    return ok, "recovery %.2fs (peak %.0f) vs %.2fs (peak %.0f) without" % (
+        st_aw, pk_aw, st_no, pk_no)
+
+
+def check_derivative_filter():
+    def u_std(d_tau):
+        pid = make_pid(kd=0.0004, d_tau=d_tau)
+        _, _, _, us = simulate(pid, EnginePlant(rpm=2500, noise=20.0), [(0, 2500)], 3.0)
+        us = us[50:]
+        m = sum(us) / len(us)
+        return (sum((u - m) ** 2 for u in us) / len(us)) ** 0.5
+    raw, filt = u_std(0.0), u_std(0.05)
+    ok = filt < raw * 0.5
+    return ok, "noise u_std %.4fV raw -> %.4fV filtered" % (raw, filt)
+
+
+def check_no_derivative_kick():
+    pid = make_pid(kd=0.0004, d_tau=0.02)
+    plant = EnginePlant(rpm=1500)
+    _, _, _, us = simulate(pid, plant, [(0, 1500), (0.5, 2500)], 0.52)
+    jump = us[-2] - us[-3]
+    expected = pid.kp * 1000
+    ok = jump <= expected * 1.05
+    return ok, "u jump on step %.3fV (Kp*e=%.3fV)" % (jump, expected)
+
+
+def check_setpoint_ramp():
+    rate = 500.0
+    ts, sps, ys, _ = simulate(make_pid(sp_rate=rate), EnginePlant(rpm=1500),
+                              [(0, 1500), (0.5, 2500)], 4.0)
+    max_rate = max(abs(b - a) / DT for a, b in zip(sps, sps[1:]))
+    overshoot = (max(ys) - 2500) / 1000 * 100
+    ok = max_rate <= rate * 1.001 and overshoot < 2
+    return ok, "sp rate %.0f rpm/s (limit %.0f), overshoot=%.1f%%" % (max_rate, rate, overshoot)
+
+
+def check_feed_forward():
+    ff = V_NEUTRAL + 1.5            # exact steady-state for 2500 rpm
+    pid = make_pid(ki=0.0)
+    _, _, ys, _ = simulate(pid, EnginePlant(rpm=2500), [(0, 2500)], 3.0, ff=ff)
+    ok = abs(ys[-1] - 2500) < 5
+    return ok, "P-only with ff holds %.0f rpm" % ys[-1]
+
+
+CHECKS = (
+    check_step_response,
+    check_load_rejection,
+    check_output_clamped,
+    check_anti_windup,
+    check_derivative_filter,
+    check_no_derivative_kick,
+    check_setpoint_ramp,
+    check_feed_forward,
+)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="PID step-response checks")
+    ap.add_argument("--plot", action="store_true")
+    args = ap.parse_args(argv)
+
+    kp, ki = simc_gains()
+    print("plant K=%.0f rpm/V tau=%.2fs theta=%.2fs  gains Kp=%.5f Ki=%.5f" % (K, TAU, THETA, kp, ki))
+    failed = 0
+    for chk in CHECKS:
+        ok, detail = chk()
+        failed += not ok
+        print("%-4s %-26s %s" % ("ok" if ok else "FAIL", chk.__name__[6:], detail))
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        ts, sps, ys, us = simulate(make_pid(), EnginePlant(rpm=1500), [(0, 1500), (0.5, 2500)], 4.0)
+        fig, (a1, a2) = plt.subplots(2, 1, sharex=True)
+        a1.plot(ts, sps, label="setpoint"); a1.plot(ts, ys, label="rpm"); a1.legend()
+        a2.plot(ts, us, label="throttle V"); a2.legend()
+        plt.show()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
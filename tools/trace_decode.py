@@ -0,0 +1,106 @@
+# tools/trace_decode.py — host-side decoder for pmu_trace records (CPython)
+# -------------------------------------------------------------------------
+# Usage:
+#   python tools/trace_decode.py pmu_trace.bin        # raw SD dump
+#   python tools/trace_decode.py repl_capture.txt     # captured REPL output
+#   python tools/trace_decode.py --level 2 file       # warnings and errors only
+#
+# Event messages come from the trailing comments in pmu_trace_events.py, so
+# the board never stores any message text.
+
+import argparse
+import os
+import re
+import struct
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EVENTS_PY = os.path.join(HERE, "..", "pmu_trace_events.py")
+
+REC = struct.Struct("<6i")
+TICKS_PERIOD = 1 << 30          # MicroPython ticks_us wraps at 2**30
+SEV_NAMES = ("DBG", "INF", "WRN", "ERR")
+
+_EV_RE = re.compile(r"^(EV_\w+)\s*=\s*const\((0x[0-9A-Fa-f]+|\d+)\)\s*#\s*(.*)$")
+_REPL_RE = re.compile(r"^@(-?\d+) ([0-9A-Fa-f]{4}) (-?\d+) (-?\d+) (-?\d+) (-?\d+)\s*$")
+_FMT_RE = re.compile(r"%[-0-9]*[dxXi]")
+
+
+def load_events(path=EVENTS_PY):
+    """Return {event_id: (name, message)} parsed from pmu_trace_events.py."""
+    events = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            m = _EV_RE.match(line.strip())
+            if m:
+                events[int(m.group(2), 0)] = (m.group(1), m.group(3).strip())
+    return events
+
+
+def read_bin(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    n = len(data) // REC.size
+    for i in range(n):
+        yield REC.unpack_from(data, i * REC.size)
+
+
+def read_repl(path):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = _REPL_RE.match(line.strip())
+            if m:
+                t, evt, a, b, c, d = m.groups()
+                yield (int(t), int(evt, 16), int(a), int(b), int(c), int(d))
+
+
+def format_record(events, evt, args):
+    name, msg = events.get(evt, ("EV_%04X" % evt, "unknown event a=%d b=%d c=%d d=%d"))
+    n = len(_FMT_RE.findall(msg))
+    try:
+        return name, msg % tuple(args[:n])
+    except (TypeError, ValueError):
+        return name, "%s %r" % (msg, args)
+
+
+def decode(records, events, level=0):
+    """Yield (t_s, sev, name, text) with ticks_us unwrapped to a monotonic time."""
+    t0 = None
+    last = None
+    base = 0
+    for t, evt, a, b, c, d in records:
+        t &= TICKS_PERIOD - 1
+        if last is not None and t < last:
+            base += TICKS_PERIOD
+        last = t
+        t_abs = base + t
+        if t0 is None:
+            t0 = t_abs
+        sev = (evt >> 12) & 0xF
+        if sev < level:
+            continue
+        name, text = format_record(events, evt, (a, b, c, d))
+        yield (t_abs - t0) / 1e6, sev, name, text
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Decode PMU trace records")
+    ap.add_argument("file", help="pmu_trace.bin or a captured REPL log")
+    ap.add_argument("--level", type=int, default=0, help="minimum severity 0..3")
+    ap.add_argument("--events", default=EVENTS_PY, help="path to pmu_trace_events.py")
+    args = ap.parse_args(argv)
+
+    events = load_events(args.events)
+    if args.file.endswith(".bin"):
+        records = read_bin(args.file)
+    else:
+        records = read_repl(args.file)
+
+    for t, sev, name, text in decode(records, events, args.level):
+        sev_txt = SEV_NAMES[sev] if sev < len(SEV_NAMES) else str(sev)
+        print("%10.6f %s %-20s %s" % (t, sev_txt, name, text))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())